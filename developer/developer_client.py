@@ -374,6 +374,8 @@ async def async_main():
                                             print(f"   - {user}: {rating} 分 | {text}")
                                         else:
                                             print(f"   - {user}: {rating} 分")
+                                    if count > len(reviews):
+                                        print(f"   （只顯示最新 {len(reviews)} 則，共 {count} 則）")
 
                                 print(f"{'='*50}")
                     else:
@@ -1,5 +1,5 @@
 #developer\games\rps\start_server.py
-import os, socket, threading, json, time
+import os, socket, threading, json, time, hmac, hashlib
 
 HOST = os.getenv("GAME_HOST", "127.0.0.1")
 PORT = int(os.getenv("GAME_PORT", "0"))
@@ -68,6 +68,19 @@ def get_lobby_connect_host():
     
     return lobby_host
 
+def sign_callback(payload: dict) -> dict:
+    """
+    回呼 lobby 的 payload 加上 ts 與 sig（HMAC-SHA256(ROOM_KEY, 排序好的 JSON)），
+    lobby 靠它確認真的是這個房間的遊戲 server 送的；沒有 ROOM_KEY 就原樣送
+    """
+    key = os.getenv("ROOM_KEY")
+    if not key:
+        return payload
+    body = dict(payload, ts=int(time.time()))
+    raw = json.dumps(body, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    body["sig"] = hmac.new(key.encode("ascii"), raw, hashlib.sha256).hexdigest()
+    return body
+
 def notify_lobby_game_finished():
     """
     告訴 Lobby：這個 ROOM_ID 的一局已經結束（重設為 waiting/idle, 清空 ready）。
@@ -83,11 +96,11 @@ def notify_lobby_game_finished():
     
     try:
         with socket.create_connection((lobby_host, int(lobby_port)), timeout=2) as s:
-            msg = json.dumps({
+            msg = json.dumps(sign_callback({
                 "kind": "game_finished",
                 "room_id": room_id
                 # 不帶 kick_all 或 kick_all=False → 只 reset，不踢人
-            }) + "\n"
+            })) + "\n"
             s.sendall(msg.encode("utf-8"))
             try:
                 s.recv(4096)  # best-effort 接一下回覆
@@ -109,11 +122,11 @@ def notify_lobby_game_finished_kick_all():
     
     try:
         with socket.create_connection((lobby_host, int(lobby_port)), timeout=2) as s:
-            s.sendall((json.dumps({
+            s.sendall((json.dumps(sign_callback({
                 "kind": "game_finished",
                 "room_id": room_id,
                 "kick_all": True
-            }) + "\n").encode("utf-8"))
+            })) + "\n").encode("utf-8"))
             try:
                 s.recv(4096)  # best-effort
             except Exception:
@@ -0,0 +1,314 @@
+# --- HW3 uploaded_games bootstrap ---
+import sys, os
+GAME_ROOT = os.path.dirname(__file__)
+sys.path.insert(0, GAME_ROOT)
+sys.path.insert(0, os.path.join(GAME_ROOT, 'game'))
+sys.path.insert(0, os.path.join(GAME_ROOT, 'common'))
+# ------------------------------------
+# developer\games\tetris\bench.py
+# 效能基準（不需要網路 / pygame）：
+#   engine  - TetrisEngine 各操作每秒次數（move / rotate / hard_drop / lock），
+#             以及固定 seed 的隨機輸入流與腳本輸入流
+#   tick    - N 個 GameRoom 同步跑一輪（套輸入 + 重力 + 推送）要多久，對照 50 ms 預算；
+#             另外拆出 snapshot 編碼與廣播的成本
+#   live    - N 個 GameRoom 真的跑 game_loop 幾秒，量 event loop 延遲（tick 抖動）
+# 結果輸出成 JSON，方便存檔比對回歸。
+#
+# 用法：
+#   python bench.py                              # 全部，預設參數
+#   python bench.py --only engine --ops 50000
+#   python bench.py --rooms 1,10,50 --spectators 20 --out bench.json
+import argparse, asyncio, contextlib, json, platform, random, statistics, time
+
+import gamelog
+from logic_tetris import TetrisEngine
+from framing import pack_msg
+
+# log 一律寫 stderr（要在 import start_server 之前：它 import 時就會 setup 成 stdout），stdout 只留 JSON
+gamelog.setup(stream=sys.stderr)
+from start_server import GameRoom, Conn, build_frame, push_state, broadcast, game_loop
+
+TICK_BUDGET_MS = 50
+RANDOM_ACTIONS = ["LEFT", "RIGHT", "CW", "CCW", "SOFT", "LEFT", "RIGHT", "HARD", "HOLD"]
+SCRIPT = ["CW", "LEFT", "LEFT", "SOFT", "HARD", "RIGHT", "RIGHT", "RIGHT", "CCW", "HARD",
+          "HOLD", "LEFT", "HARD", "CW", "CW", "RIGHT", "HARD"]
+
+
+def percentiles(samples) -> dict:
+    if not samples:
+        return {}
+    xs = sorted(samples)
+    pick = lambda q: xs[min(len(xs) - 1, int(q * len(xs)))]
+    return {"n": len(xs), "mean": round(statistics.fmean(xs), 4), "p50": round(pick(0.50), 4),
+            "p90": round(pick(0.90), 4), "p99": round(pick(0.99), 4), "max": round(xs[-1], 4)}
+
+
+# ---------------------------------------------------------------------------
+# engine
+# ---------------------------------------------------------------------------
+def _fresh(eng: TetrisEngine, seed: int) -> TetrisEngine:
+    return TetrisEngine(seed) if eng.topout or eng.active is None else eng
+
+
+def bench_op(name: str, n: int, seed: int) -> dict:
+    rnd = random.Random(seed)
+    eng = TetrisEngine(seed)
+    elapsed = 0.0
+    done = 0
+    while done < n:
+        eng = _fresh(eng, rnd.randint(1, 2**31 - 1))
+        if name == "move":
+            dx = rnd.choice((-1, 1))
+            t0 = time.perf_counter()
+            eng.move(dx, 0)
+            elapsed += time.perf_counter() - t0
+        elif name == "rotate":
+            d = rnd.choice((-1, 1))
+            t0 = time.perf_counter()
+            eng.rotate(d)
+            elapsed += time.perf_counter() - t0
+        elif name == "hard_drop":
+            t0 = time.perf_counter()
+            eng.hard_drop()
+            elapsed += time.perf_counter() - t0
+        elif name == "lock":
+            # 先把方塊移到底（不計時），只量 lock（含清行與下一顆 spawn）
+            for _ in range(rnd.randint(0, 4)):
+                eng.move(rnd.choice((-1, 1)), 0)
+            while eng.move(0, 1):
+                pass
+            t0 = time.perf_counter()
+            eng.lock()
+            elapsed += time.perf_counter() - t0
+        done += 1
+    return {"ops": n, "sec": round(elapsed, 6), "ops_per_sec": round(n / elapsed) if elapsed else None}
+
+
+def bench_stream(kind: str, n: int, seed: int) -> dict:
+    rnd = random.Random(seed)
+    eng = TetrisEngine(seed)
+    restarts = 0
+    t0 = time.perf_counter()
+    for i in range(n):
+        if eng.topout:
+            eng = TetrisEngine(seed + i)
+            restarts += 1
+        act = rnd.choice(RANDOM_ACTIONS) if kind == "random" else SCRIPT[i % len(SCRIPT)]
+        eng.apply_action(act)
+    elapsed = time.perf_counter() - t0
+    return {"actions": n, "sec": round(elapsed, 6), "actions_per_sec": round(n / elapsed) if elapsed else None,
+            "restarts": restarts}
+
+
+def run_engine(args) -> dict:
+    out = {op: bench_op(op, args.ops, args.seed) for op in ("move", "rotate", "hard_drop", "lock")}
+    out["stream_random"] = bench_stream("random", args.ops, args.seed)
+    out["stream_scripted"] = bench_stream("scripted", args.ops, args.seed)
+    return out
+
+
+# ---------------------------------------------------------------------------
+# 假連線：只計算寫入的 bytes
+# ---------------------------------------------------------------------------
+class FakeTransport:
+    def __init__(self):
+        self.bytes = 0
+
+    def get_write_buffer_size(self) -> int:
+        return 0
+
+
+class FakeWriter:
+    def __init__(self):
+        self.transport = FakeTransport()
+
+    def write(self, data: bytes):
+        self.transport.bytes += len(data)
+
+    def is_closing(self) -> bool:
+        return False
+
+    def close(self):
+        pass
+
+    async def wait_closed(self):
+        pass
+
+
+def make_room(seed: int, spectators: int, binary: bool, duration: int = 3600) -> GameRoom:
+    room = GameRoom(duration_sec=duration, seed=seed)
+    for i, role in enumerate(("P1", "P2")):
+        c = Conn(None, FakeWriter(), f"bench{i}", f"bench{i}", role)
+        c.binary = binary
+        room.conns[role] = c
+    for i in range(spectators):
+        c = Conn(None, FakeWriter(), f"spec{i}", f"spec{i}", f"SPEC_{i + 1}", spectator=True)
+        c.binary = binary
+        room.spectators.append(c)
+    room.begin(int(time.time() * 1000))
+    return room
+
+
+def _conns(room: GameRoom):
+    return [c for c in room.conns.values() if c is not None] + room.spectators
+
+
+def _room_bytes(room: GameRoom) -> int:
+    return sum(c.writer.transport.bytes for c in _conns(room))
+
+
+# ---------------------------------------------------------------------------
+# tick：N 個房間同步跑一輪
+# ---------------------------------------------------------------------------
+async def _tick_once(room: GameRoom, rnd: random.Random, now: int):
+    """跟 game_loop 一輪做的事相同：套輸入、重力、推送"""
+    for role in ("P1", "P2"):
+        eng = room.engine[role]
+        if eng.topout:
+            room.engine[role] = eng = TetrisEngine(rnd.randint(1, 2**31 - 1))
+        for _ in range(rnd.randint(0, 2)):
+            room.acked_seq[role] += 1
+            eng.apply_action(rnd.choice(RANDOM_ACTIONS))
+        eng.soft_drop()
+    await push_state(room, now)
+
+
+async def bench_tick(n_rooms: int, ticks: int, spectators: int, binary: bool, seed: int) -> dict:
+    rnd = random.Random(seed)
+    rooms = [make_room(seed + i, spectators, binary) for i in range(n_rooms)]
+    passes = []
+    now = int(time.time() * 1000)
+    for _ in range(ticks):
+        now += TICK_BUDGET_MS
+        t0 = time.perf_counter()
+        for room in rooms:
+            await _tick_once(room, rnd, now)
+        passes.append((time.perf_counter() - t0) * 1000)
+
+    # 拆開量：build_frame + DeltaEncoder / pack_msg / broadcast
+    frame_ms, encode_ms, bcast_ms = [], [], []
+    for room in rooms:
+        for _ in range(max(1, ticks // 4)):
+            await _tick_once(room, rnd, now)
+            t0 = time.perf_counter()
+            key, delta = room.snap_encoder.push(build_frame(room, now))
+            t1 = time.perf_counter()
+            pack_msg(key, binary)
+            pack_msg(delta, binary)
+            t2 = time.perf_counter()
+            await broadcast(_conns(room), delta, droppable=True)
+            t3 = time.perf_counter()
+            frame_ms.append((t1 - t0) * 1000)
+            encode_ms.append((t2 - t1) * 1000)
+            bcast_ms.append((t3 - t2) * 1000)
+
+    pass_stats = percentiles(passes)
+    return {
+        "rooms": n_rooms,
+        "spectators_per_room": spectators,
+        "binary": binary,
+        "tick_pass_ms": pass_stats,
+        "within_budget": bool(pass_stats) and pass_stats["p99"] <= TICK_BUDGET_MS,
+        "frame_build_ms": percentiles(frame_ms),
+        "snapshot_encode_ms": percentiles(encode_ms),
+        "broadcast_ms": percentiles(bcast_ms),
+        "bytes_per_room_per_tick": round(sum(_room_bytes(r) for r in rooms) / (n_rooms * ticks)),
+    }
+
+
+# ---------------------------------------------------------------------------
+# live：真的跑 game_loop，量 event loop 延遲
+# ---------------------------------------------------------------------------
+async def _feed_inputs(room: GameRoom, rnd: random.Random, rate_hz: float):
+    seq = {"P1": 0, "P2": 0}
+    while not room.done:
+        await asyncio.sleep(rnd.expovariate(rate_hz))
+        role = rnd.choice(("P1", "P2"))
+        seq[role] += 1
+        await room.input_queues[role].put((seq[role], rnd.choice(RANDOM_ACTIONS[:-2])))  # 不 HARD / HOLD，少 topout
+        room.wakeup.set()
+
+
+async def bench_live(n_rooms: int, seconds: float, spectators: int, binary: bool, seed: int,
+                     input_hz: float, probe_ms: int = 5) -> dict:
+    rooms = [make_room(seed + i, spectators, binary) for i in range(n_rooms)]
+    tasks = [asyncio.create_task(game_loop(r)) for r in rooms]
+    tasks += [asyncio.create_task(_feed_inputs(r, random.Random(seed + 1000 + i), input_hz))
+              for i, r in enumerate(rooms)]
+
+    lag = []
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        t0 = time.perf_counter()
+        await asyncio.sleep(probe_ms / 1000)
+        lag.append((time.perf_counter() - t0) * 1000 - probe_ms)
+
+    for t in tasks:
+        t.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return {
+        "rooms": n_rooms,
+        "spectators_per_room": spectators,
+        "binary": binary,
+        "seconds": seconds,
+        "input_hz_per_room": input_hz,
+        "loop_lag_ms": percentiles(lag),
+        "rooms_finished": sum(1 for r in rooms if r.done),
+        "bytes_per_room_per_sec": round(sum(_room_bytes(r) for r in rooms) / (n_rooms * seconds)),
+    }
+
+
+# ---------------------------------------------------------------------------
+async def run_rooms(args) -> dict:
+    out = {"tick": [], "live": []}
+    counts = [int(x) for x in args.rooms.split(",") if x.strip()]
+    # game_loop / broadcast 會印 log，不要混進 JSON 輸出
+    with contextlib.redirect_stdout(sys.stderr):
+        for n in counts:
+            if args.only in (None, "tick"):
+                out["tick"].append(await bench_tick(n, args.ticks, args.spectators, args.binary, args.seed))
+            if args.only in (None, "live"):
+                out["live"].append(await bench_live(n, args.seconds, args.spectators, args.binary,
+                                                    args.seed, args.input_hz))
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Tetris engine / game server benchmarks (JSON output)")
+    ap.add_argument("--only", choices=["engine", "tick", "live"], default=None)
+    ap.add_argument("--seed", type=int, default=12345)
+    ap.add_argument("--ops", type=int, default=20000, help="engine: 每種操作的次數")
+    ap.add_argument("--rooms", default="1,10,50", help="房間數列表，逗號分隔")
+    ap.add_argument("--ticks", type=int, default=200, help="tick: 每組跑幾輪")
+    ap.add_argument("--seconds", type=float, default=3.0, help="live: 每組跑幾秒")
+    ap.add_argument("--spectators", type=int, default=2, help="每房間的假觀戰連線數")
+    ap.add_argument("--input-hz", type=float, default=10.0, help="live: 每房間每秒輸入數")
+    ap.add_argument("--json-wire", dest="binary", action="store_false", help="用 JSON 而非二進位格式")
+    ap.add_argument("--out", default=None, help="寫到檔案（預設印到 stdout）")
+    args = ap.parse_args()
+
+    result = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "time": int(time.time()),
+            "tick_budget_ms": TICK_BUDGET_MS,
+            "args": vars(args),
+        }
+    }
+    if args.only in (None, "engine"):
+        result["engine"] = run_engine(args)
+    if args.only in (None, "tick", "live"):
+        result["rooms"] = asyncio.run(run_rooms(args))
+
+    text = json.dumps(result, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        print(f"[Bench] wrote {args.out}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
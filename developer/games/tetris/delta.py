@@ -0,0 +1,142 @@
+# developer\games\tetris\delta.py
+# SNAPSHOT 差量編碼：加入 / 重同步時送完整 keyframe（SNAPSHOT），之後只送變動（DELTA）
+#
+# frame 格式（server 組出來、client 還原回來的都是同一種）：
+#   {"at", "remainMs", "currentDropMs",
+#    "players": [{"role", "name", "board"(已鎖定的格子，不含 active),
+#                 "active", "hold", "next", "score", "lines", "level", "blocksCleared",
+#                 "drawn"(已抽方塊數), "ack"(最後套用的輸入 seq)}]}
+from typing import Dict, List, Optional
+
+from logic_tetris import SHAPES, PID, W, H
+
+FRAME_FIELDS = ("remainMs", "currentDropMs")
+PLAYER_FIELDS = ("name", "active", "hold", "next", "score", "lines", "level", "blocksCleared",
+                 "drawn", "ack")
+
+
+def diff_frames(prev: dict, cur: dict, seq: int) -> dict:
+    """算出 prev → cur 的 DELTA：只帶有變動的列、active 位置與計數器"""
+    delta = {"type": "DELTA", "seq": seq, "at": cur.get("at")}
+    for f in FRAME_FIELDS:
+        if cur.get(f) != prev.get(f):
+            delta[f] = cur.get(f)
+
+    prev_by_role = {p["role"]: p for p in prev.get("players", [])}
+    players = []
+    for p in cur.get("players", []):
+        old = prev_by_role.get(p["role"])
+        if old is None:
+            players.append(p)
+            continue
+        entry = {"role": p["role"]}
+        rows = [[y, row] for y, (row, old_row) in enumerate(zip(p["board"], old["board"]))
+                if row != old_row]
+        if rows:
+            entry["rows"] = rows
+        for f in PLAYER_FIELDS:
+            if p.get(f) != old.get(f):
+                entry[f] = p.get(f)
+        if len(entry) > 1:
+            players.append(entry)
+    if players:
+        delta["players"] = players
+    return delta
+
+
+class DeltaEncoder:
+    """Server 端：每個 frame 給一個遞增 seq，同時產出 keyframe 與相對上一個 frame 的 delta"""
+
+    def __init__(self):
+        self.seq = 0
+        self.prev: Optional[dict] = None
+
+    def push(self, frame: dict):
+        """回傳 (keyframe, delta)；第一個 frame 沒有前一個可比，delta 為 None"""
+        self.seq += 1
+        key = {"type": "SNAPSHOT", "seq": self.seq, **frame}
+        delta = diff_frames(self.prev, frame, self.seq) if self.prev is not None else None
+        self.prev = frame
+        return key, delta
+
+
+class DeltaDecoder:
+    """Client 端：套用 SNAPSHOT / DELTA 還原完整 frame；seq 不連續就要求重同步"""
+
+    def __init__(self):
+        self.seq: Optional[int] = None
+        self.frame: Optional[dict] = None
+        self.resync_requested = False
+
+    def apply(self, msg: dict) -> Optional[dict]:
+        """成功回傳還原後的 frame；掉包（seq 跳號）或還沒有 keyframe 則回傳 None"""
+        t = msg.get("type")
+        if t == "SNAPSHOT":
+            self.seq = msg.get("seq")
+            self.frame = {k: v for k, v in msg.items() if k not in ("type", "seq")}
+            self.resync_requested = False
+            return self.frame
+
+        if t != "DELTA":
+            return None
+
+        if self.frame is None or self.seq is None or msg.get("seq") != self.seq + 1:
+            self.frame = None
+            return None
+
+        self.seq = msg["seq"]
+        frame = self.frame
+        frame["at"] = msg.get("at", frame.get("at"))
+        for f in FRAME_FIELDS:
+            if f in msg:
+                frame[f] = msg[f]
+
+        by_role = {p["role"]: p for p in frame.get("players", [])}
+        for entry in msg.get("players", []):
+            p = by_role.get(entry["role"])
+            if p is None:
+                p = {"role": entry["role"], "board": [[0] * W for _ in range(H)]}
+                frame.setdefault("players", []).append(p)
+                by_role[entry["role"]] = p
+            if "board" in entry:
+                p["board"] = entry["board"]
+            for y, row in entry.get("rows", []):
+                p["board"][y] = row
+            for f in PLAYER_FIELDS:
+                if f in entry:
+                    p[f] = entry[f]
+        return frame
+
+    def copy_frame(self) -> Optional[dict]:
+        """目前 frame 的複本，可以交給其他執行緒（之後的 apply 不會改到它）"""
+        frame = self.frame
+        if frame is None:
+            return None
+        out = dict(frame)
+        # 列是整列替換、不會原地修改，所以只需複製 board 外層 list
+        out["players"] = [dict(p, board=list(p["board"])) for p in frame.get("players", [])]
+        return out
+
+    def take_resync_request(self) -> bool:
+        """需要 keyframe 且還沒送出 RESYNC → True（每次掉包只送一次）"""
+        if self.frame is not None or self.resync_requested:
+            return False
+        self.resync_requested = True
+        return True
+
+
+def compose_board(board: List[List[int]], active: Optional[Dict]) -> List[List[int]]:
+    """把 active 方塊疊到鎖定的盤面上，給畫面用"""
+    out = [row[:] for row in board]
+    if not active:
+        return out
+    shape = active.get("shape")
+    if shape not in SHAPES:
+        return out
+    pid = PID[shape]
+    ax, ay, rot = active.get("x", 0), active.get("y", 0), active.get("rot", 0) % 4
+    for (dx, dy) in SHAPES[shape][rot]:
+        cx, cy = ax + dx, ay + dy
+        if 0 <= cy < H and 0 <= cx < W:
+            out[cy][cx] = pid
+    return out
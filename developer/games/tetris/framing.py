@@ -1,6 +1,8 @@
 # common/framing.py
 import struct, json, asyncio
 
+from logic_tetris import PIECES, W, H
+
 MAX_LEN = 65536
 
 def pack_json(obj: dict) -> bytes:
@@ -11,14 +13,12 @@ def pack_json(obj: dict) -> bytes:
     return struct.pack('!I', n) + body
 
 async def read_exactly(reader: asyncio.StreamReader, n: int) -> bytes:
-    buf = bytearray()
-    while len(buf) < n:
-        chunk = await reader.read(n - len(buf))
-        if not chunk:
-            # 對端關閉 → 視為正常離線，交由上層決定是否記錄
-            raise ConnectionError("socket closed")
-        buf.extend(chunk)
-    return bytes(buf)
+    # readexactly 直接從 StreamReader 的緩衝切出 n bytes，不用自己一塊塊拼接再複製
+    try:
+        return await reader.readexactly(n)
+    except asyncio.IncompleteReadError:
+        # 對端關閉 → 視為正常離線，交由上層決定是否記錄
+        raise ConnectionError("socket closed")
 
 async def recv_json(reader: asyncio.StreamReader) -> dict:
     hdr = await read_exactly(reader, 4)
@@ -34,3 +34,273 @@ async def recv_json(reader: asyncio.StreamReader) -> dict:
 async def send_json(writer: asyncio.StreamWriter, obj: dict):
     writer.write(pack_json(obj))
     await writer.drain()
+
+# ---------------------------------------------------------------------------
+# 二進位格式：HELLO 帶 "caps": [CAP_BINARY]、WELCOME 回同樣的 caps 後才使用。
+# 一樣是 4-byte 長度 + body；body 第一個 byte 是 '{' 就是 JSON，否則是下面的 tag。
+# 只有高頻訊息（INPUT / PING / PONG / SNAPSHOT / DELTA）走二進位，其他控制訊息維持 JSON。
+# ---------------------------------------------------------------------------
+CAP_BINARY = "bin1"
+
+T_INPUT, T_PING, T_PONG, T_SNAPSHOT, T_DELTA = 1, 2, 3, 4, 5
+
+ACTIONS = ["LEFT", "RIGHT", "SOFT", "CW", "CCW", "HARD", "HOLD"]
+_ACTION_ID = {a: i for i, a in enumerate(ACTIONS)}
+_PIECE_ID = {p: i + 1 for i, p in enumerate(PIECES)}  # 0 = 沒有
+
+_INPUT = struct.Struct('!BIqB')          # tag, seq, ts, action
+_TIME = struct.Struct('!Bq')             # tag, t
+_SNAP_HDR = struct.Struct('!BIqIIB')     # tag, seq, at, remainMs, currentDropMs, 玩家數
+_DELTA_HDR = struct.Struct('!BIqB')      # tag, seq, at, frame 欄位 mask
+_ACTIVE = struct.Struct('!Bbbb')         # shape, x, y, rot（bit 4 = canHold）
+_COUNTERS = struct.Struct('!IIHIIi')     # score, lines, level, blocksCleared, drawn, ack
+_U8 = struct.Struct('!B')
+_U16 = struct.Struct('!H')
+_U32 = struct.Struct('!I')
+_I32 = struct.Struct('!i')
+
+ROW_BYTES = W // 2  # 每格 4 bits → 一列 5 bytes
+
+# DELTA 每個玩家的欄位 mask（bit 順序）
+_DELTA_PLAYER_BITS = ("rows", "name", "active", "hold", "next",
+                      "score", "lines", "level", "blocksCleared", "drawn", "ack")
+# 數值欄位：(bit, 欄位, struct)
+_DELTA_PLAYER_NUMS = ((5, "score", _U32), (6, "lines", _U32), (7, "level", _U16),
+                      (8, "blocksCleared", _U32), (9, "drawn", _U32), (10, "ack", _I32))
+
+
+def pack_row(row) -> bytes:
+    return bytes(((row[i] & 0xF) << 4) | (row[i + 1] & 0xF) for i in range(0, W, 2))
+
+# byte → (高 4 bits, 低 4 bits)，解列時查表即可
+_NIBBLES = [(b >> 4, b & 0xF) for b in range(256)]
+
+def unpack_row(data) -> list:
+    return [v for b in data for v in _NIBBLES[b]]
+
+
+def _pack_str(s) -> bytes:
+    raw = str(s or "").encode('utf-8')[:255]
+    return _U8.pack(len(raw)) + raw
+
+def _pack_active(a) -> bytes:
+    if not a:
+        return _ACTIVE.pack(0, 0, 0, 0)
+    rot = (a.get("rot", 0) & 0x3) | (0x10 if a.get("canHold", True) else 0)
+    return _ACTIVE.pack(_PIECE_ID.get(a.get("shape"), 0), a.get("x", 0), a.get("y", 0), rot)
+
+def _pack_piece_list(pieces) -> bytes:
+    pieces = list(pieces or [])[:255]
+    return _U8.pack(len(pieces)) + bytes(_PIECE_ID.get(p, 0) for p in pieces)
+
+def _role_id(role: str) -> int:
+    return int(str(role)[1:])
+
+
+def _encode_snapshot(obj: dict) -> bytes:
+    players = obj.get("players", [])
+    parts = [_SNAP_HDR.pack(T_SNAPSHOT, obj.get("seq") or 0, obj.get("at") or 0,
+                            obj.get("remainMs") or 0, obj.get("currentDropMs") or 0, len(players))]
+    for p in players:
+        parts.append(_U8.pack(_role_id(p["role"])))
+        parts.append(_pack_str(p.get("name")))
+        parts.extend(pack_row(row) for row in p["board"])
+        parts.append(_pack_active(p.get("active")))
+        parts.append(_U8.pack(_PIECE_ID.get(p.get("hold"), 0)))
+        parts.append(_pack_piece_list(p.get("next")))
+        parts.append(_COUNTERS.pack(p.get("score", 0), p.get("lines", 0), p.get("level", 1),
+                                    p.get("blocksCleared", 0), p.get("drawn", 0), p.get("ack", -1)))
+    return b"".join(parts)
+
+
+def _encode_delta(obj: dict) -> bytes:
+    mask = (1 if "remainMs" in obj else 0) | (2 if "currentDropMs" in obj else 0)
+    parts = [_DELTA_HDR.pack(T_DELTA, obj["seq"], obj.get("at") or 0, mask)]
+    if mask & 1:
+        parts.append(_U32.pack(obj["remainMs"]))
+    if mask & 2:
+        parts.append(_U32.pack(obj["currentDropMs"]))
+
+    players = obj.get("players", [])
+    parts.append(_U8.pack(len(players)))
+    for p in players:
+        rows = p.get("rows")
+        if rows is None and "board" in p:
+            rows = list(enumerate(p["board"]))
+        pmask = 0
+        for bit, f in enumerate(_DELTA_PLAYER_BITS):
+            if (f == "rows" and rows) or (f != "rows" and f in p):
+                pmask |= 1 << bit
+        parts.append(_U8.pack(_role_id(p["role"])))
+        parts.append(_U16.pack(pmask))
+        if pmask & 1:
+            parts.append(_U8.pack(len(rows)))
+            for y, row in rows:
+                parts.append(_U8.pack(y))
+                parts.append(pack_row(row))
+        if pmask & 2:
+            parts.append(_pack_str(p["name"]))
+        if pmask & 4:
+            parts.append(_pack_active(p["active"]))
+        if pmask & 8:
+            parts.append(_U8.pack(_PIECE_ID.get(p["hold"], 0)))
+        if pmask & 16:
+            parts.append(_pack_piece_list(p["next"]))
+        for bit, f, st in _DELTA_PLAYER_NUMS:
+            if pmask & (1 << bit):
+                parts.append(st.pack(p[f]))
+    return b"".join(parts)
+
+
+def encode_binary(obj: dict):
+    """可以用二進位表示的訊息回傳 body bytes，否則回傳 None（走 JSON）"""
+    t = obj.get("type")
+    if t == "INPUT":
+        action = _ACTION_ID.get(obj.get("action"))
+        if action is None:
+            return None
+        return _INPUT.pack(T_INPUT, obj.get("seq", 0), obj.get("ts") or 0, action)
+    if t == "PING":
+        return _TIME.pack(T_PING, int(obj.get("t") or 0))
+    if t == "PONG":
+        return _TIME.pack(T_PONG, int(obj.get("t") or 0))
+    if t == "SNAPSHOT":
+        return _encode_snapshot(obj)
+    if t == "DELTA":
+        return _encode_delta(obj)
+    return None
+
+
+class _Cursor:
+    """在 memoryview 上依序讀欄位，不額外複製"""
+
+    def __init__(self, body):
+        self.mv = memoryview(body)
+        self.pos = 0
+
+    def take(self, st: struct.Struct):
+        vals = st.unpack_from(self.mv, self.pos)
+        self.pos += st.size
+        return vals
+
+    def u8(self) -> int:
+        return self.take(_U8)[0]
+
+    def raw(self, n: int):
+        if self.pos + n > len(self.mv):
+            raise struct.error("truncated")
+        out = self.mv[self.pos:self.pos + n]
+        self.pos += n
+        return out
+
+    def string(self) -> str:
+        return bytes(self.raw(self.u8())).decode('utf-8', errors='replace')
+
+    def active(self):
+        shape, x, y, rot = self.take(_ACTIVE)
+        if not shape:
+            return None
+        return {"shape": PIECES[shape - 1], "x": x, "y": y, "rot": rot & 0x3, "canHold": bool(rot & 0x10)}
+
+    def piece(self):
+        pid = self.u8()
+        return PIECES[pid - 1] if pid else None
+
+    def piece_list(self) -> list:
+        return [PIECES[b - 1] for b in self.raw(self.u8()) if b]
+
+
+def _decode_snapshot(cur: _Cursor) -> dict:
+    _, seq, at, remain, drop, n = cur.take(_SNAP_HDR)
+    players = []
+    for _ in range(n):
+        role = f"P{cur.u8()}"
+        name = cur.string()
+        board = [unpack_row(cur.raw(ROW_BYTES)) for _ in range(H)]
+        active = cur.active()
+        hold = cur.piece()
+        nextq = cur.piece_list()
+        score, lines, level, blocks, drawn, ack = cur.take(_COUNTERS)
+        players.append({"role": role, "name": name, "board": board, "active": active,
+                        "hold": hold, "next": nextq, "score": score, "lines": lines,
+                        "level": level, "blocksCleared": blocks, "drawn": drawn, "ack": ack})
+    return {"type": "SNAPSHOT", "seq": seq, "at": at, "remainMs": remain,
+            "currentDropMs": drop, "players": players}
+
+
+def _decode_delta(cur: _Cursor) -> dict:
+    _, seq, at, mask = cur.take(_DELTA_HDR)
+    msg = {"type": "DELTA", "seq": seq, "at": at}
+    if mask & 1:
+        msg["remainMs"] = cur.take(_U32)[0]
+    if mask & 2:
+        msg["currentDropMs"] = cur.take(_U32)[0]
+    players = []
+    for _ in range(cur.u8()):
+        entry = {"role": f"P{cur.u8()}"}
+        pmask = cur.take(_U16)[0]
+        if pmask & 1:
+            entry["rows"] = [[cur.u8(), unpack_row(cur.raw(ROW_BYTES))] for _ in range(cur.u8())]
+        if pmask & 2:
+            entry["name"] = cur.string()
+        if pmask & 4:
+            entry["active"] = cur.active()
+        if pmask & 8:
+            entry["hold"] = cur.piece()
+        if pmask & 16:
+            entry["next"] = cur.piece_list()
+        for bit, f, st in _DELTA_PLAYER_NUMS:
+            if pmask & (1 << bit):
+                entry[f] = cur.take(st)[0]
+        players.append(entry)
+    if players:
+        msg["players"] = players
+    return msg
+
+
+def decode_body(body) -> dict:
+    """解一個 frame 的 body：JSON 或二進位 tag 皆可"""
+    if not body:
+        raise ConnectionError("empty frame")
+    tag = body[0]
+    try:
+        if tag == 0x7B:  # '{'
+            return json.loads(bytes(body).decode('utf-8'))
+        cur = _Cursor(body)
+        if tag == T_INPUT:
+            _, seq, ts, action = cur.take(_INPUT)
+            return {"type": "INPUT", "seq": seq, "ts": ts, "action": ACTIONS[action]}
+        if tag in (T_PING, T_PONG):
+            _, t = cur.take(_TIME)
+            return {"type": "PING" if tag == T_PING else "PONG", "t": t}
+        if tag == T_SNAPSHOT:
+            return _decode_snapshot(cur)
+        if tag == T_DELTA:
+            return _decode_delta(cur)
+    except Exception as e:
+        raise ConnectionError(f"bad frame: {e}")
+    raise ConnectionError(f"unknown frame tag: {tag}")
+
+
+def pack_msg(obj: dict, binary: bool = False) -> bytes:
+    """binary=True 且訊息有二進位格式時用二進位，否則退回 JSON"""
+    if binary:
+        body = encode_binary(obj)
+        if body is not None:
+            return struct.pack('!I', len(body)) + body
+    return pack_json(obj)
+
+async def recv_frame(reader: asyncio.StreamReader) -> bytes:
+    """讀一個 frame 的 body（原始 bytes，尚未解碼）"""
+    hdr = await read_exactly(reader, 4)
+    (length,) = _U32.unpack(hdr)
+    if not (0 < length <= MAX_LEN):
+        raise ConnectionError("length out of range")
+    return await read_exactly(reader, length)
+
+async def recv_msg(reader: asyncio.StreamReader) -> dict:
+    return decode_body(await recv_frame(reader))
+
+async def send_msg(writer: asyncio.StreamWriter, obj: dict, binary: bool = False):
+    writer.write(pack_msg(obj, binary))
+    await writer.drain()
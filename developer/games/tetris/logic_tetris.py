@@ -76,6 +76,7 @@ class Snapshot:
     lines: int
     level: int
     blocks_cleared: int = 0
+    drawn: int = 0
 
 class TetrisEngine:
     def __init__(self, seed: int):
@@ -92,8 +93,57 @@ class TetrisEngine:
         self.combo = 0          # 當前 combo 連續數
         self.max_combo = 0      # 最高 combo
         self.last_cleared = False
+        self.drawn = 0          # 已從 queue 抽出的方塊數（client 端用來重建 rng / queue）
         self._fill_queue()
         self.spawn()
+
+    @classmethod
+    def from_snapshot(cls, seed: int, s: Dict) -> "TetrisEngine":
+        """
+        用 server 的 snapshot（board 不含 active、active、hold、drawn、計數器）
+        重建一個可以繼續模擬的引擎：rng 與 queue 由 seed 重播 drawn 次抽牌得到。
+        """
+        eng = cls.__new__(cls)
+        eng.rng = random.Random(seed)
+        eng.queue = []
+        eng.drawn = int(s.get("drawn", 0))
+        eng._fill_queue()
+        for _ in range(eng.drawn):
+            eng._fill_queue()
+            eng.queue.pop(0)
+        eng.board = [list(row) for row in s["board"]]
+        eng.hold = s.get("hold")
+        a = s.get("active")
+        eng.active = None
+        if a:
+            eng.active = Active(shape=a["shape"], rot=a.get("rot", 0), x=a.get("x", 3), y=a.get("y", 0),
+                                can_hold=a.get("canHold", True))
+        eng.score = s.get("score", 0)
+        eng.lines = s.get("lines", 0)
+        eng.level = s.get("level", 1)
+        eng.blocks_cleared = s.get("blocksCleared", 0)
+        eng.topout = False
+        eng.combo = 0
+        eng.max_combo = 0
+        eng.last_cleared = False
+        return eng
+
+    def apply_action(self, act: str):
+        """套用一個玩家輸入（server 與 client 預測共用）"""
+        if act == "LEFT":
+            self.move(-1, 0)
+        elif act == "RIGHT":
+            self.move(1, 0)
+        elif act == "CW":
+            self.rotate(+1)
+        elif act == "CCW":
+            self.rotate(-1)
+        elif act == "SOFT":
+            self.soft_drop()
+        elif act == "HARD":
+            self.hard_drop()
+        elif act == "HOLD":
+            self.hold_swap()
         
     def clear_lines(self):
         cleared = 0
@@ -130,6 +180,7 @@ class TetrisEngine:
     def spawn(self):
         self._fill_queue()
         shape = self.queue.pop(0)
+        self.drawn += 1
         # spawn near top center
         a = Active(shape=shape, rot=0, x=3, y=0, can_hold=True)
         if self._collides(a, dx=0, dy=0, droplast=False):
@@ -261,7 +312,8 @@ class TetrisEngine:
     def snapshot(self) -> Snapshot:
         act = None
         if self.active:
-            act = {"shape": self.active.shape, "x": self.active.x, "y": self.active.y, "rot": self.active.rot}
+            act = {"shape": self.active.shape, "x": self.active.x, "y": self.active.y, "rot": self.active.rot,
+                   "canHold": self.active.can_hold}
         return Snapshot(
             board=[row[:] for row in self.board],
             active=act,
@@ -272,4 +324,5 @@ class TetrisEngine:
             level=self.level,
             # extra
             blocks_cleared=self.blocks_cleared,
+            drawn=self.drawn,
         )
@@ -0,0 +1,57 @@
+# developer\games\tetris\predict.py
+# Client 端預測 + server reconcile：
+#   - 按鍵當下就在本地 TetrisEngine 上套用（畫面立即反應），同時記在 pending
+#   - 收到權威狀態（帶 ack = server 最後套用的輸入 seq）時，以它為準重建引擎，
+#     丟掉已 ack 的輸入，把剩下還沒被處理的輸入重播一次
+# 最終狀態永遠以 server 為準，client 只是提早顯示結果。
+import time
+from collections import deque
+from typing import Optional
+
+from logic_tetris import TetrisEngine
+from delta import compose_board
+
+PENDING_TTL_MS = 1000  # 超過這麼久還沒被 ack 的輸入視為 server 已丟棄（例如開局前按的鍵）
+
+
+class Predictor:
+    def __init__(self, seed: int):
+        self.seed = seed
+        self.engine: Optional[TetrisEngine] = None
+        self.pending = deque()  # (seq, action, 送出時間 ms)
+        self.acked = -1
+
+    def local_input(self, seq: int, action: str):
+        """玩家按鍵：立即在本地套用"""
+        self.pending.append((seq, action, int(time.time() * 1000)))
+        if self.engine is not None:
+            self.engine.apply_action(action)
+
+    def reconcile(self, player: dict):
+        """套用 server 的權威狀態（frame 裡自己的那一份），再重播尚未 ack 的輸入"""
+        ack = player.get("ack", -1)
+        if ack is not None and ack > self.acked:
+            self.acked = ack
+        now = int(time.time() * 1000)
+        while self.pending and (self.pending[0][0] <= self.acked or
+                                now - self.pending[0][2] > PENDING_TTL_MS):
+            self.pending.popleft()
+
+        self.engine = TetrisEngine.from_snapshot(self.seed, player)
+        for _, action, _ in self.pending:
+            self.engine.apply_action(action)
+
+    def view(self) -> Optional[dict]:
+        """目前預測的畫面狀態（格式與 apply_snapshot 用的 player dict 相同）"""
+        eng = self.engine
+        if eng is None:
+            return None
+        s = eng.snapshot()
+        return {
+            "board": compose_board(s.board, s.active),
+            "hold": s.hold,
+            "next": s.nextq,
+            "score": s.score,
+            "lines": s.lines,
+            "level": s.level,
+        }
@@ -0,0 +1,283 @@
+# --- HW3 uploaded_games bootstrap ---
+import sys, os
+GAME_ROOT = os.path.dirname(__file__)
+sys.path.insert(0, GAME_ROOT)
+sys.path.insert(0, os.path.join(GAME_ROOT, 'game'))
+sys.path.insert(0, os.path.join(GAME_ROOT, 'common'))
+# ------------------------------------
+# developer\games\tetris\relay.py
+# 觀戰轉播：
+#   game server ──(一條 relay 連線)──> relay ──> 所有觀眾
+# game server 只需要服務一條觀戰連線，觀眾再多也不會拖慢玩家的 tick。
+# relay 自己還原 SNAPSHOT / DELTA，再重新編碼分送給觀眾；
+# 每位觀眾有自己的送出緩衝上限，落後就跳幀、追上後補 keyframe。
+# 可選的延遲緩衝（--delayMs）讓觀眾畫面比實際對局晚一段時間。
+
+import argparse, asyncio, time
+from collections import deque
+from typing import List, Optional
+
+from framing import recv_msg, send_msg, send_json, pack_msg, CAP_BINARY
+from delta import DeltaDecoder, DeltaEncoder
+from gamelog import get_logger
+import ticket as room_ticket
+
+log = get_logger("relay", room=os.getenv("ROOM_ID", "0"))
+
+VIEWER_MAX_BUFFER = 64 * 1024   # 超過就跳過這一幀，之後補 keyframe
+VIEWER_HARD_LIMIT = 1 << 20     # 超過代表觀眾連線卡死，直接斷線
+UPSTREAM_RETRIES = 20
+UPSTREAM_RETRY_SEC = 0.5
+END_TYPES = ("MATCH_END", "SPECTATOR_KICKED")
+
+
+def now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+class Viewer:
+    def __init__(self, writer, name: str, role: str, binary: bool):
+        self.writer = writer
+        self.name = name
+        self.role = role
+        self.binary = binary
+        self.need_keyframe = True
+        self.frames_skipped = 0
+
+
+class Relay:
+    def __init__(self, upstream_host: str, upstream_port: int, delay_ms: int = 0):
+        self.upstream_host = upstream_host
+        self.upstream_port = upstream_port
+        self.delay_ms = max(0, delay_ms)
+        self.viewers: List[Viewer] = []
+        self.viewer_count = 0
+        self.welcome: Optional[dict] = None     # upstream 的 WELCOME，轉給觀眾時換掉 role
+        self.welcomed = asyncio.Event()
+        self.decoder = DeltaDecoder()
+        self.encoder = DeltaEncoder()
+        self.pending = deque()                  # (放出時間 ms, 種類, 內容)，依收到順序
+        self.wakeup = asyncio.Event()
+        self.upstream_closed = False
+        self.done = False
+
+    def _enqueue(self, kind: str, payload):
+        self.pending.append((now_ms() + self.delay_ms, kind, payload))
+        self.wakeup.set()
+
+    # ---------- upstream ----------
+    async def upstream_loop(self):
+        attempts = 0
+        writer = None
+        try:
+            while True:
+                try:
+                    reader, writer = await asyncio.open_connection(self.upstream_host, self.upstream_port)
+                    break
+                except OSError as e:
+                    attempts += 1
+                    if attempts >= UPSTREAM_RETRIES:
+                        log.error("Cannot reach game server", error=str(e))
+                        return
+                    await asyncio.sleep(UPSTREAM_RETRY_SEC)
+
+            await send_msg(writer, {"type": "HELLO", "username": "__relay__", "name": "relay",
+                                    "relay": True, "ticket": os.getenv("RELAY_TICKET"), "caps": [CAP_BINARY]})
+            welcome = await recv_msg(reader)
+            if welcome.get("type") != "WELCOME":
+                log.error("Upstream refused", welcome=welcome)
+                return
+            binary = CAP_BINARY in (welcome.get("caps") or [])
+            self.welcome = welcome
+            self.welcomed.set()
+            log.info("Attached to game server", role=welcome.get("role"))
+
+            while True:
+                m = await recv_msg(reader)
+                t = m.get("type")
+                if t in ("SNAPSHOT", "DELTA"):
+                    if self.decoder.apply(m) is None:
+                        if self.decoder.take_resync_request():
+                            await send_msg(writer, {"type": "RESYNC"}, binary)
+                        continue
+                    self._enqueue("frame", self.decoder.copy_frame())
+                else:
+                    self._enqueue("msg", m)
+                    if t == "SPECTATOR_KICKED":
+                        break
+        except ConnectionError:
+            pass
+        except Exception as e:
+            log.warning("Upstream error", error=str(e))
+        finally:
+            self.upstream_closed = True
+            self.welcomed.set()
+            self.wakeup.set()
+            if writer:
+                try:
+                    writer.close()
+                    await writer.wait_closed()
+                except Exception:
+                    pass
+
+    # ---------- 延遲緩衝 → 分送 ----------
+    async def pump_loop(self):
+        while True:
+            if not self.pending:
+                if self.upstream_closed:
+                    break
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+
+            release, kind, payload = self.pending[0]
+            wait = release - now_ms()
+            if wait > 0:
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=wait / 1000)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self.pending.popleft()
+            if kind == "frame":
+                await self.push_frame(payload)
+            else:
+                await self.fan_out(list(self.viewers), payload)
+
+        self.done = True
+        for v in list(self.viewers):
+            try:
+                v.writer.close()
+            except Exception:
+                pass
+
+    async def push_frame(self, frame: dict):
+        """跟 game server 的 push_state 一樣：需要 keyframe 的送 SNAPSHOT，其他送 DELTA"""
+        key, delta = self.encoder.push(frame)
+        fresh = [v for v in self.viewers if v.need_keyframe or delta is None]
+        for v in fresh:
+            v.need_keyframe = False
+        if fresh:
+            await self.fan_out(fresh, key, droppable=True)
+        if delta is not None:
+            await self.fan_out([v for v in self.viewers if v not in fresh], delta, droppable=True)
+
+    async def fan_out(self, viewers, obj, droppable: bool = False):
+        """每種格式只編碼一次，直接寫進 transport；落後的觀眾跳幀、卡死的斷線"""
+        encoded = {}
+        dead = []
+        for v in viewers:
+            w = v.writer
+            if w.is_closing():
+                dead.append(v)
+                continue
+            buffered = w.transport.get_write_buffer_size()
+            if buffered > VIEWER_HARD_LIMIT:
+                dead.append(v)
+                continue
+            if droppable and buffered > VIEWER_MAX_BUFFER:
+                v.frames_skipped += 1
+                v.need_keyframe = True
+                continue
+            try:
+                data = encoded.get(v.binary)
+                if data is None:
+                    data = encoded[v.binary] = pack_msg(obj, v.binary)
+                w.write(data)
+            except Exception:
+                dead.append(v)
+
+        for v in dead:
+            self.viewers = [x for x in self.viewers if x is not v]
+            try:
+                v.writer.close()
+            except Exception:
+                pass
+
+    # ---------- 觀眾 ----------
+    async def handle_viewer(self, reader, writer):
+        viewer = None
+        try:
+            hello = await recv_msg(reader)
+            if hello.get("type") != "HELLO":
+                await send_json(writer, {"type": "ERROR", "code": "BadRequest", "msg": "need HELLO"})
+                return
+
+            if room_ticket.enabled() and not room_ticket.verify(hello.get("ticket")):
+                log.warning("Rejected viewer: invalid room ticket", claimed=hello.get("username"))
+                await send_json(writer, {"type": "ERROR", "code": "Unauthorized", "msg": "invalid room ticket"})
+                return
+
+            await self.welcomed.wait()
+            if self.welcome is None or self.done:
+                await send_json(writer, {"type": "ERROR", "code": "GameEnded", "msg": "Game ended"})
+                return
+
+            name = str(hello.get("name", hello.get("username", "viewer")))
+            self.viewer_count += 1
+            binary = CAP_BINARY in (hello.get("caps") or [])
+            viewer = Viewer(writer, name, f"SPEC_{self.viewer_count}", binary)
+            await send_json(writer, dict(self.welcome, role=viewer.role, spectator=True,
+                                         caps=[CAP_BINARY] if binary else []))
+
+            # 已經有 frame 就立刻補一個 keyframe，不用等下一次推送
+            if self.encoder.prev is not None:
+                viewer.need_keyframe = False
+                writer.write(pack_msg({"type": "SNAPSHOT", "seq": self.encoder.seq, **self.encoder.prev},
+                                      binary))
+            self.viewers.append(viewer)
+            log.info("Viewer joined", name=name, watching=len(self.viewers))
+
+            while not self.done:
+                msg = await recv_msg(reader)
+                t = msg.get("type")
+                if t == "RESYNC":
+                    viewer.need_keyframe = True
+                elif t == "PING":
+                    await send_msg(writer, {"type": "PONG", "t": msg.get("t")}, binary)
+                elif t == "BYE":
+                    break
+        except ConnectionError:
+            pass
+        except Exception as e:
+            log.warning("Viewer error", error=str(e))
+        finally:
+            if viewer is not None:
+                self.viewers = [v for v in self.viewers if v is not viewer]
+            try:
+                writer.close()
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--upstreamHost", default=os.getenv("GAME_HOST", "127.0.0.1"))
+    ap.add_argument("--upstreamPort", type=int, default=int(os.getenv("GAME_PORT", "0")))
+    ap.add_argument("--port", type=int, default=int(os.getenv("RELAY_PORT", "0")))
+    ap.add_argument("--delayMs", type=int, default=int(os.getenv("RELAY_DELAY_MS", "0")))
+    args = ap.parse_args()
+
+    if args.upstreamPort == 0 or args.port == 0:
+        log.error("need --upstreamPort and --port (or GAME_PORT / RELAY_PORT env)")
+        sys.exit(1)
+
+    relay = Relay(args.upstreamHost, args.upstreamPort, args.delayMs)
+    server = await asyncio.start_server(relay.handle_viewer, host="0.0.0.0", port=args.port)
+    log.info("Listening", port=args.port, upstream=f"{args.upstreamHost}:{args.upstreamPort}",
+             delay_ms=relay.delay_ms)
+
+    async with server:
+        up_task = asyncio.create_task(relay.upstream_loop())
+        await relay.pump_loop()
+        await up_task
+        server.close()
+        await asyncio.sleep(0.5)  # 給觀眾時間收完最後的訊息
+    log.info("Closed", viewers_seen=relay.viewer_count)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,146 @@
+# developer\games\tetris\render.py
+# pygame 繪圖層：
+#   - 每種顏色 / 格子大小只預先畫一次 tile surface，之後直接 blit
+#   - 文字 surface 依 (font, 內容, 顏色) 快取，不再每幀 render
+#   - 盤面只重畫跟上次不同的格子，其他區塊內容沒變就不動，回傳 dirty rects 給 display.update
+import pygame
+
+from logic_tetris import W as BOARD_W, H as BOARD_H
+
+BG_COLOR = (20, 20, 30)
+BOARD_BG = (60, 60, 60)
+BOARD_BORDER = (100, 100, 100)
+
+# 顏色定義
+COLORS = {
+    0: (40, 40, 40),      # 空格
+    1: (0, 240, 240),     # I - 青色
+    2: (0, 0, 240),       # J - 藍色
+    3: (240, 160, 0),     # L - 橙色
+    4: (240, 240, 0),     # O - 黃色
+    5: (0, 240, 0),       # S - 綠色
+    6: (160, 0, 240),     # T - 紫色
+    7: (240, 0, 0),       # Z - 紅色
+}
+
+PIECE_NAMES = {1: 'I', 2: 'J', 3: 'L', 4: 'O', 5: 'S', 6: 'T', 7: 'Z'}
+PIECE_IDS = {name: pid for pid, name in PIECE_NAMES.items()}
+
+PREVIEW_SHAPES = {
+    'I': [(0, 1), (1, 1), (2, 1), (3, 1)],
+    'O': [(1, 0), (2, 0), (1, 1), (2, 1)],
+    'T': [(1, 0), (0, 1), (1, 1), (2, 1)],
+    'L': [(2, 0), (0, 1), (1, 1), (2, 1)],
+    'J': [(0, 0), (0, 1), (1, 1), (2, 1)],
+    'S': [(1, 0), (2, 0), (0, 1), (1, 1)],
+    'Z': [(0, 0), (1, 0), (1, 1), (2, 1)],
+}
+
+
+def draw_cell(surf, x, y, w, h, color):
+    """繪製單個方塊（帶立體效果）"""
+    pygame.draw.rect(surf, color, (x, y, w, h))
+    lighter = tuple(min(255, c + 40) for c in color)
+    pygame.draw.line(surf, lighter, (x, y), (x + w, y), 2)
+    pygame.draw.line(surf, lighter, (x, y), (x, y + h), 2)
+    darker = tuple(max(0, c - 40) for c in color)
+    pygame.draw.line(surf, darker, (x + w, y), (x + w, y + h), 2)
+    pygame.draw.line(surf, darker, (x, y + h), (x + w, y + h), 2)
+
+
+class TileCache:
+    """(格子值, 格子大小, 底色) → 預先畫好的 surface"""
+
+    def __init__(self):
+        self._tiles = {}
+
+    def get(self, val: int, size: int, bg=BOARD_BG, gap: int = 1):
+        key = (val, size, bg, gap)
+        tile = self._tiles.get(key)
+        if tile is None:
+            tile = pygame.Surface((size, size))
+            tile.fill(bg)
+            color = COLORS.get(val, (100, 100, 100))
+            if val == 0:
+                pygame.draw.rect(tile, color, (0, 0, size - gap, size - gap))
+            else:
+                draw_cell(tile, 0, 0, size - gap, size - gap, color)
+            self._tiles[key] = tile
+        return tile
+
+
+class TextCache:
+    """(font, 文字, 顏色) → 已 render 的 surface；超過上限就整批清掉"""
+
+    def __init__(self, max_items: int = 256):
+        self.max_items = max_items
+        self._cache = {}
+
+    def get(self, font, text: str, color):
+        key = (id(font), text, color)
+        surf = self._cache.get(key)
+        if surf is None:
+            if len(self._cache) >= self.max_items:
+                self._cache.clear()
+            surf = font.render(text, True, color)
+            self._cache[key] = surf
+        return surf
+
+
+class BoardView:
+    """一個盤面：記住上次畫的內容，只重畫有變的格子"""
+
+    def __init__(self, tiles: TileCache, x0: int, y0: int, cell_size: int):
+        self.tiles = tiles
+        self.x0, self.y0, self.cell = x0, y0, cell_size
+        self.rect = pygame.Rect(x0 - 2, y0 - 2, BOARD_W * cell_size + 4, BOARD_H * cell_size + 4)
+        self.last = None
+
+    def draw(self, surf, board, full: bool = False) -> list:
+        cs = self.cell
+        if full or self.last is None:
+            pygame.draw.rect(surf, BOARD_BG, self.rect)
+            pygame.draw.rect(surf, BOARD_BORDER, self.rect, 2)
+            for y in range(BOARD_H):
+                for x in range(BOARD_W):
+                    surf.blit(self.tiles.get(board[y][x], cs), (self.x0 + x * cs, self.y0 + y * cs))
+            self.last = [row[:] for row in board]
+            return [self.rect]
+
+        dirty = []
+        for y in range(BOARD_H):
+            row, old = board[y], self.last[y]
+            if row == old:
+                continue
+            for x in range(BOARD_W):
+                if row[x] != old[x]:
+                    dirty.append(surf.blit(self.tiles.get(row[x], cs), (self.x0 + x * cs, self.y0 + y * cs)))
+            self.last[y] = row[:]
+        return dirty
+
+
+class Panel:
+    """畫面上的一塊區域：內容 key 沒變就不重畫"""
+
+    def __init__(self, rect, bg=BG_COLOR):
+        self.rect = pygame.Rect(rect)
+        self.bg = bg
+        self.key = None
+
+    def update(self, surf, key, draw_fn, full: bool = False) -> list:
+        if not full and key == self.key:
+            return []
+        surf.fill(self.bg, self.rect)
+        draw_fn(surf)
+        self.key = key
+        return [self.rect]
+
+
+def draw_piece_preview(surf, tiles: TileCache, piece_name, x, y, cell_size=20, bg=BOARD_BG):
+    """繪製方塊預覽（Hold 或 Next）"""
+    pid = PIECE_IDS.get(piece_name)
+    if pid is None:
+        return
+    tile = tiles.get(pid, cell_size, bg=bg, gap=2)
+    for (cx, cy) in PREVIEW_SHAPES[piece_name]:
+        surf.blit(tile, (x + cx * cell_size, y + cy * cell_size))
@@ -0,0 +1,239 @@
+# --- HW3 uploaded_games bootstrap ---
+import sys, os
+GAME_ROOT = os.path.dirname(__file__)
+sys.path.insert(0, GAME_ROOT)
+sys.path.insert(0, os.path.join(GAME_ROOT, 'game'))
+sys.path.insert(0, os.path.join(GAME_ROOT, 'common'))
+# ------------------------------------
+# developer\games\tetris\replay.py
+# 對局紀錄 / 重播：
+#   TetrisEngine(seed) 是決定性的，只要記下 seed 與每位玩家依序套用的操作，就能完整重現一局。
+#   server 的重力下落（G）也當成操作記下來，重播時不需要重算時間，結果跟計時精度無關。
+#
+# 紀錄格式（gzip 壓縮的 JSON，一局通常只有幾 KB）：
+#   {"version", "seed", "gravityPlan", "durationSec", "startMs",
+#    "players": {"P1": {"username", "name"}, ...},
+#    "events": [[t(開局後 ms), tick, role, code], ...],   # role: 1 / 2，code 見 CODES
+#    "gravity": [[t, tick, dropMs], ...],                 # 重力調整（重播時顯示用）
+#    "end": {"reason", "winnerRole", "winDetail", "results"},
+#    "final": {"P1": {"board"(200 個數字的字串), "drawn", "topout", ...}, ...}}  # 重播核對用
+#
+# 用法：
+#   python replay.py <紀錄檔>            # 以最快速度重新模擬並核對結果
+import argparse, gzip, json, time
+from typing import Dict, List, Optional
+
+from logic_tetris import TetrisEngine
+
+REPLAY_VERSION = 1
+REPLAY_SUFFIX = ".tetrec.gz"
+
+# 操作 ↔ 一個字元
+CODES = {"LEFT": "L", "RIGHT": "R", "CW": "C", "CCW": "W", "SOFT": "S", "HARD": "H", "HOLD": "O",
+         "GRAVITY": "G"}
+ACTION_OF = {c: a for a, c in CODES.items()}
+ROLES = ("P1", "P2")
+
+
+class MatchRecorder:
+    """server 端：邊打邊記，結束時一次寫檔"""
+
+    def __init__(self, seed: int, gravity_plan: dict, duration_sec: int):
+        self.seed = seed
+        self.gravity_plan = dict(gravity_plan)
+        self.duration_sec = duration_sec
+        self.start_ms: Optional[int] = None
+        self.events: List[list] = []
+        self.gravity: List[list] = []
+
+    def start(self, start_ms: int):
+        self.start_ms = start_ms
+
+    def _t(self, now: int) -> int:
+        return max(0, now - (self.start_ms or now))
+
+    def action(self, now: int, tick: int, role: str, act: str):
+        code = CODES.get(act)
+        if code is not None:
+            self.events.append([self._t(now), tick, int(role[1:]), code])
+
+    def gravity_drop(self, now: int, tick: int, role: str):
+        self.events.append([self._t(now), tick, int(role[1:]), "G"])
+
+    def drop_change(self, now: int, tick: int, drop_ms: int):
+        self.gravity.append([self._t(now), tick, drop_ms])
+
+    def to_dict(self, players: Dict[str, dict], end: dict, final: Optional[dict] = None) -> dict:
+        return {
+            "version": REPLAY_VERSION,
+            "seed": self.seed,
+            "gravityPlan": self.gravity_plan,
+            "durationSec": self.duration_sec,
+            "startMs": self.start_ms,
+            "players": players,
+            "events": self.events,
+            "gravity": self.gravity,
+            "end": end,
+            "final": final or {},
+        }
+
+    def save(self, path: str, players: Dict[str, dict], end: dict, final: Optional[dict] = None) -> str:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = path + ".tmp"
+        with gzip.open(tmp, "wt", encoding="utf-8") as f:
+            json.dump(self.to_dict(players, end, final), f, separators=(',', ':'))
+        os.replace(tmp, path)
+        return path
+
+
+def prune_replays(directory: str, keep: int) -> int:
+    """只留最新的 keep 個紀錄檔（依修改時間），回傳刪了幾個；keep <= 0 不刪"""
+    if keep <= 0:
+        return 0
+    try:
+        names = [n for n in os.listdir(directory) if n.endswith(REPLAY_SUFFIX)]
+    except OSError:
+        return 0
+    paths = sorted((os.path.join(directory, n) for n in names), key=os.path.getmtime, reverse=True)
+    removed = 0
+    for path in paths[keep:]:
+        try:
+            os.remove(path)
+            removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+def final_state(eng: TetrisEngine) -> dict:
+    """引擎最終狀態的精簡表示（盤面壓成一個字串）"""
+    return {
+        "board": "".join(str(v) for row in eng.board for v in row),
+        "score": eng.score,
+        "lines": eng.lines,
+        "drawn": eng.drawn,
+        "topout": bool(eng.topout),
+    }
+
+
+def load_replay(path: str) -> dict:
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        rec = json.load(f)
+    if rec.get("version") != REPLAY_VERSION:
+        raise ValueError(f"unsupported replay version: {rec.get('version')}")
+    return rec
+
+
+def apply_event(engines: Dict[str, TetrisEngine], ev: list):
+    _, _, role_id, code = ev
+    eng = engines[f"P{role_id}"]
+    if code == "G":
+        eng.soft_drop()
+    else:
+        eng.apply_action(ACTION_OF[code])
+
+
+def simulate(rec: dict) -> Dict[str, TetrisEngine]:
+    """以最快速度重新模擬整局，回傳最後的引擎狀態"""
+    engines = {role: TetrisEngine(rec["seed"]) for role in ROLES}
+    for ev in rec["events"]:
+        apply_event(engines, ev)
+    return engines
+
+
+def verify(rec: dict, engines: Dict[str, TetrisEngine]) -> List[str]:
+    """比對重播結果與紀錄裡的最終狀態 / 成績，回傳不一致的地方"""
+    problems = []
+    for role, want in (rec.get("final") or {}).items():
+        eng = engines.get(role)
+        if eng is None:
+            continue
+        got = final_state(eng)
+        for key, val in want.items():
+            if got.get(key) != val:
+                problems.append(f"{role}.{key}: recorded {val!r}, replayed {got.get(key)!r}")
+    for r in (rec.get("end") or {}).get("results", []):
+        eng = engines.get(r.get("role"))
+        if eng is None:
+            continue
+        for key, got in (("score", eng.score), ("lines", eng.lines), ("blocksCleared", eng.blocks_cleared)):
+            if key in r and int(r[key]) != int(got):
+                problems.append(f"{r['role']}.{key}: recorded {r[key]}, replayed {got}")
+    return problems
+
+
+class ReplayPlayer:
+    """client 端：依紀錄的時間軸逐步推進，產生跟線上 SNAPSHOT 相同格式的 frame"""
+
+    def __init__(self, rec: dict):
+        self.rec = rec
+        self.engines = {role: TetrisEngine(rec["seed"]) for role in ROLES}
+        self.names = {role: (rec.get("players", {}).get(role) or {}).get("name", role) for role in ROLES}
+        self.pos = 0
+        self.gravity_pos = 0
+        self.drop_ms = int((rec.get("gravityPlan") or {}).get("initialDropMs", 500))
+        events = rec["events"]
+        self.length_ms = max(events[-1][0] if events else 0,
+                             rec["gravity"][-1][0] if rec.get("gravity") else 0)
+
+    @property
+    def finished(self) -> bool:
+        return self.pos >= len(self.rec["events"]) and self.gravity_pos >= len(self.rec.get("gravity", []))
+
+    def advance(self, t_ms: int) -> dict:
+        """套用時間 <= t_ms 的所有事件，回傳目前的 frame"""
+        events = self.rec["events"]
+        while self.pos < len(events) and events[self.pos][0] <= t_ms:
+            apply_event(self.engines, events[self.pos])
+            self.pos += 1
+        gravity = self.rec.get("gravity", [])
+        while self.gravity_pos < len(gravity) and gravity[self.gravity_pos][0] <= t_ms:
+            self.drop_ms = gravity[self.gravity_pos][2]
+            self.gravity_pos += 1
+        return self.frame(t_ms)
+
+    def frame(self, t_ms: int) -> dict:
+        frame = {
+            "at": (self.rec.get("startMs") or 0) + t_ms,
+            "remainMs": max(0, int(self.rec.get("durationSec", 0)) * 1000 - t_ms),
+            "currentDropMs": self.drop_ms,
+            "players": [],
+        }
+        for role in ROLES:
+            s = self.engines[role].snapshot()
+            frame["players"].append({
+                "role": role, "name": self.names[role], "board": s.board, "active": s.active,
+                "hold": s.hold, "next": s.nextq, "score": s.score, "lines": s.lines, "level": s.level,
+                "blocksCleared": s.blocks_cleared, "drawn": s.drawn, "ack": -1,
+            })
+        return frame
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Re-simulate a recorded Tetris match at full speed")
+    ap.add_argument("path")
+    args = ap.parse_args()
+
+    rec = load_replay(args.path)
+    t0 = time.perf_counter()
+    engines = simulate(rec)
+    elapsed = time.perf_counter() - t0
+
+    n = len(rec["events"])
+    print(f"[Replay] {args.path}: seed={rec['seed']} events={n} "
+          f"length={ReplayPlayer(rec).length_ms / 1000:.1f}s")
+    print(f"[Replay] re-simulated in {elapsed * 1000:.1f} ms ({n / elapsed if elapsed else 0:.0f} events/s)")
+    for role in ROLES:
+        eng = engines[role]
+        print(f"[Replay] {role}: score={eng.score} lines={eng.lines} topout={eng.topout}")
+
+    problems = verify(rec, engines)
+    if problems:
+        for p in problems:
+            print(f"[Replay] ✗ mismatch: {p}")
+        sys.exit(1)
+    print("[Replay] ✓ matches recorded result")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,28 +7,38 @@ sys.path.insert(0, os.path.join(GAME_ROOT, 'common'))
 # ------------------------------------
 # developer\games\tetris\start_client.py
 import argparse, threading, queue, time, sys
+from collections import deque
 import pygame
-from framing import recv_json, send_json
+from framing import recv_msg, send_msg, CAP_BINARY
+from delta import DeltaDecoder, compose_board
+from predict import Predictor
+from replay import load_replay, ReplayPlayer
+from render import (BG_COLOR, BOARD_BG, TileCache, TextCache, BoardView, Panel,
+                    draw_piece_preview)
 import asyncio
 
 import atexit
 import signal
+from gamelog import get_logger
 
-print("[GUI] Script started", flush=True)
-
-# 顏色定義
-COLORS = {
-    0: (40, 40, 40),      # 空格
-    1: (0, 240, 240),     # I - 青色
-    2: (0, 0, 240),       # J - 藍色
-    3: (240, 160, 0),     # L - 橙色
-    4: (240, 240, 0),     # O - 黃色
-    5: (0, 240, 0),       # S - 綠色
-    6: (160, 0, 240),     # T - 紫色
-    7: (240, 0, 0),       # Z - 紅色
-}
+log = get_logger("client")
+net_log = get_logger("client.net")
+log.debug("Script started")
+
+ACTIVE_FPS = 60        # 畫面有變化時的幀率上限
+IDLE_WAIT_MS = 250     # 沒有任何變化時最多睡這麼久（網路訊息 / 按鍵會提早叫醒）
+NET_EVENT = pygame.USEREVENT + 1
+
+
+REPLAY_FRAME_SEC = 1 / 30  # 重播時產生 frame 的間隔
 
-PIECE_NAMES = {1: 'I', 2: 'J', 3: 'L', 4: 'O', 5: 'S', 6: 'T', 7: 'Z'}
+
+def wake_ui():
+    """網路執行緒收到訊息後叫醒主迴圈（pygame.event.post 可跨執行緒呼叫）"""
+    try:
+        pygame.event.post(pygame.event.Event(NET_EVENT))
+    except pygame.error:
+        pass
 
 # 遊戲狀態
 state = {
@@ -52,12 +62,77 @@ state = {
     "winner_role": None,     # "P1" / "P2" / None
     "winner_reason": None,   # e.g. "topout @ P1", "higher score", "draw"
     "winner_name": None,     # 得勝者名稱（觀戰者用）
+    "predictor": None,       # 玩家本地預測（觀戰者為 None）
 }
 
 
-def apply_snapshot(msg: dict):
-    """更新遊戲狀態"""
-    players = msg.get("players", [])
+class FrameRing:
+    """
+    網路執行緒 → 畫面的 frame 環形緩衝：網路端解完 SNAPSHOT / DELTA 就放進來，
+    畫面每一輪只拿最新的一個，來不及畫的舊 frame 直接丟掉。
+    """
+
+    def __init__(self, size: int = 8):
+        self._frames = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def put(self, frame: dict):
+        with self._lock:
+            self._frames.append(frame)
+
+    def pending(self) -> bool:
+        return bool(self._frames)
+
+    def latest(self):
+        with self._lock:
+            if not self._frames:
+                return None
+            frame = self._frames.pop()
+            self.dropped += len(self._frames)
+            self._frames.clear()
+        return frame
+
+
+class Outbox:
+    """
+    畫面 → 網路執行緒的送出佇列：put() 用 call_soon_threadsafe 直接叫醒 asyncio 那端，
+    不用輪詢；網路 loop 還沒起來前送的訊息先暫存，bind() 時補進去。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loop = None
+        self._queue = None
+        self._early = []
+
+    def bind(self, loop: asyncio.AbstractEventLoop):
+        with self._lock:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            for msg in self._early:
+                self._queue.put_nowait(msg)
+            self._early.clear()
+
+    def put(self, msg: dict, timeout=None):
+        with self._lock:
+            if self._loop is None:
+                self._early.append(msg)
+                return
+            loop, q = self._loop, self._queue
+        try:
+            loop.call_soon_threadsafe(q.put_nowait, msg)
+        except RuntimeError:
+            pass  # 網路 loop 已結束
+
+    async def get(self) -> dict:
+        return await self._queue.get()
+
+
+def apply_frame(frame: dict):
+    """套用網路執行緒還原好的 frame 並更新遊戲狀態"""
+    players = [dict(p, board=compose_board(p.get("board") or [[0]*10 for _ in range(20)], p.get("active")))
+               for p in frame.get("players", [])]
     if not players:
         return
 
@@ -90,6 +165,13 @@ def apply_snapshot(msg: dict):
         me_p = by_role.get(my_role, players[0])
         op_p = by_role.get(op_role)
 
+        # 以權威狀態 reconcile，再疊上尚未被 server 處理的本地輸入
+        predictor = state.get("predictor")
+        raw_me = next((p for p in frame.get("players", []) if p.get("role") == my_role), None)
+        if predictor is not None and raw_me is not None:
+            predictor.reconcile(raw_me)
+            me_p = dict(me_p, **predictor.view())
+
         if "board" in me_p:
             state["board_me"] = me_p["board"]
         state["score"] = me_p.get("score", 0)
@@ -104,19 +186,44 @@ def apply_snapshot(msg: dict):
             state["op_name"] = op_p.get("name", op_role)
 
     # 🔧 更新當前掉落速度
-    current_drop_ms = msg.get("currentDropMs")
+    current_drop_ms = frame.get("currentDropMs")
     if current_drop_ms:
         state["current_drop_ms"] = current_drop_ms
 
-    remain_ms = msg.get("remainMs", 0)
+    remain_ms = frame.get("remainMs", 0)
     state["remain_sec"] = max(0, remain_ms // 1000)
 
 
-def start_network_thread(host, port, me_user, me_name, inbox: queue.Queue, outbox: queue.Queue):
-    """背景網路執行緒（遊戲結束後停止重連）"""
-    print(f"[GUI] Starting network thread to {host}:{port}", flush=True)
+def apply_prediction():
+    """按鍵後立刻把本地預測結果顯示出來（不等 server）"""
+    predictor = state.get("predictor")
+    view = predictor.view() if predictor is not None else None
+    if view is None:
+        return
+    state["board_me"] = view["board"]
+    state["score"] = view["score"]
+    state["lines"] = view["lines"]
+    state["level"] = view["level"]
+    state["hold"] = view["hold"]
+    state["next_queue"] = view["next"]
+
+
+def start_network_thread(host, port, me_user, me_name, inbox: queue.Queue, outbox: Outbox,
+                         frames: FrameRing, on_message=None):
+    """
+    背景網路執行緒（遊戲結束後停止重連）。
+    SNAPSHOT / DELTA 在這裡就還原成 frame 放進 frames；其他訊息放進 inbox。
+    每放一則就呼叫 on_message() 叫醒畫面。
+    """
+    net_log.info("Starting network thread", peer=f"{host}:{port}")
+
+    def deliver(m):
+        inbox.put(m)
+        if on_message:
+            on_message()
 
     async def net_main():
+        outbox.bind(asyncio.get_running_loop())
         attempts = 0
         game_ended = False  # ⭐ 關鍵旗標
 
@@ -124,64 +231,82 @@ def start_network_thread(host, port, me_user, me_name, inbox: queue.Queue, outbo
             writer = None
             send_task = None
             try:
-                print(f"[GUI] Connecting... (attempt {attempts+1})", flush=True)
+                net_log.info("Connecting", attempt=attempts + 1)
                 reader, writer = await asyncio.open_connection(host, int(port))
-                print(f"[GUI] Connected!", flush=True)
-                inbox.put({"type": "NET", "sub": "CONNECTED"})
+                net_log.info("Connected")
+                deliver({"type": "NET", "sub": "CONNECTED"})
 
-                # 發送 HELLO
-                await send_json(writer, {
+                # 發送 HELLO（caps 告知支援二進位格式，等 WELCOME 確認後才切換）
+                binary = False
+                await send_msg(writer, {
                     "type": "HELLO",
                     "version": 1,
                     "roomId": 0,
                     "username": me_user,
-                    "name": me_name
+                    "name": me_name,
+                    "ticket": os.getenv("ROOM_TICKET") or None,   # lobby 發的房間票
+                    "caps": [CAP_BINARY]
                 })
                 await writer.drain()
-                print(f"[GUI] HELLO sent", flush=True)
+                net_log.debug("HELLO sent", user=me_user)
 
-                # 建立發送任務
+                # 建立發送任務（outbox.put 會直接叫醒這裡）
                 async def send_loop():
                     while True:
+                        msg = await outbox.get()
                         try:
-                            msg = outbox.get(timeout=0.1)
-                            await send_json(writer, msg)
+                            await send_msg(writer, msg, binary)
                             if msg.get("type") != "INPUT":
-                                print(f"[GUI] Sent: {msg.get('type')}", flush=True)
-                        except queue.Empty:
-                            await asyncio.sleep(0.01)
+                                net_log.debug("Sent", type=msg.get("type"))
                         except Exception as e:
-                            print(f"[GUI][send_loop] error: {e}", flush=True)
+                            net_log.warning("send_loop error", error=str(e))
                             break
 
                 send_task = asyncio.create_task(send_loop())
 
-                # 接收迴圈
+                # 接收迴圈（每條連線一個還原器，重連後等新的 keyframe）
+                decoder = DeltaDecoder()
                 msg_count = 0
                 while True:
-                    m = await recv_json(reader)
+                    m = await recv_msg(reader)
                     msg_count += 1
                     t = m.get("type")
 
-                    if t != "SNAPSHOT" or msg_count % 30 == 0:
-                        print(f"[GUI] Received #{msg_count}: {t}", flush=True)
+                    if t == "WELCOME":
+                        binary = CAP_BINARY in (m.get("caps") or [])
 
-                    inbox.put(m)
+                    if t in ("SNAPSHOT", "DELTA"):
+                        net_log.debug("Received frame", n=msg_count, type=t, sample=1 / 30)
+                    else:
+                        net_log.debug("Received", n=msg_count, type=t)
+
+                    if t in ("SNAPSHOT", "DELTA"):
+                        if decoder.apply(m) is None:
+                            # seq 接不上 → 直接在這裡要求 keyframe，不經過畫面
+                            if decoder.take_resync_request():
+                                await send_msg(writer, {"type": "RESYNC"}, binary)
+                            continue
+                        frames.put(decoder.copy_frame())
+                        if on_message:
+                            on_message()
+                        continue
+
+                    deliver(m)
 
                     # ⭐ 收到結束訊號 → 停止重連
                     if t in ("MATCH_END", "SPECTATOR_KICKED"):
                         game_ended = True
-                        print(f"[GUI] Game ended, stopping reconnection attempts", flush=True)
+                        net_log.info("Game ended, stopping reconnection attempts")
                         break
 
             except Exception as e:
                 if game_ended:
-                    print(f"[GUI] Connection closed after game end", flush=True)
+                    net_log.info("Connection closed after game end")
                     break
 
                 attempts += 1
-                print(f"[GUI] Connection error: {e} (attempt {attempts})", flush=True)
-                inbox.put({"type": "NET", "sub": "ERROR", "detail": f"{e} (try#{attempts})"})
+                net_log.warning("Connection error", error=str(e), attempt=attempts)
+                deliver({"type": "NET", "sub": "ERROR", "detail": f"{e} (try#{attempts})"})
 
                 if attempts >= 50:
                     break
@@ -207,92 +332,68 @@ def start_network_thread(host, port, me_user, me_name, inbox: queue.Queue, outbo
         try:
             asyncio.run(net_main())
         except Exception as e:
-            print(f"[GUI] Runner error: {e}", flush=True)
-            inbox.put({"type": "NET", "sub": "ERROR", "detail": str(e)})
+            net_log.exception("Runner error", error=str(e))
+            deliver({"type": "NET", "sub": "ERROR", "detail": str(e)})
 
     th = threading.Thread(target=runner, daemon=True)
     th.start()
-    print(f"[GUI] Network thread started", flush=True)
+    net_log.debug("Network thread started")
     return th
 
 
-def draw_cell(surf, x, y, w, h, color):
-    """繪製單個方塊（帶立體效果）"""
-    pygame.draw.rect(surf, color, (x, y, w, h))
-    lighter = tuple(min(255, c + 40) for c in color)
-    pygame.draw.line(surf, lighter, (x, y), (x + w, y), 2)
-    pygame.draw.line(surf, lighter, (x, y), (x, y + h), 2)
-    darker = tuple(max(0, c - 40) for c in color)
-    pygame.draw.line(surf, darker, (x + w, y), (x + w, y + h), 2)
-    pygame.draw.line(surf, darker, (x, y + h), (x + w, y + h), 2)
-
-
-def draw_board(surf, board, x0, y0, cell_size=24, title=""):
-    """繪製遊戲板"""
-    if title:
-        font = pygame.font.SysFont(None, 24)
-        txt = font.render(title, True, (255, 255, 255))
-        surf.blit(txt, (x0, y0 - 25))
-
-    bg_rect = pygame.Rect(x0 - 2, y0 - 2, 10 * cell_size + 4, 20 * cell_size + 4)
-    pygame.draw.rect(surf, (60, 60, 60), bg_rect)
-    pygame.draw.rect(surf, (100, 100, 100), bg_rect, 2)
-
-    for row in range(20):
-        for col in range(10):
-            val = board[row][col]
-            color = COLORS.get(val, (100, 100, 100))
-            cell_x = x0 + col * cell_size
-            cell_y = y0 + row * cell_size
-
-            if val == 0:
-                pygame.draw.rect(surf, color, (cell_x, cell_y, cell_size - 1, cell_size - 1))
-            else:
-                draw_cell(surf, cell_x, cell_y, cell_size - 1, cell_size - 1, color)
+def start_replay_thread(path, inbox: queue.Queue, frames: FrameRing, on_message=None, speed: float = 1.0):
+    """重播模式：不連線，依紀錄檔的時間軸產生 frame，畫面端跟觀戰完全一樣"""
+    log.info("Starting replay", path=path, speed=speed)
 
+    def deliver(m):
+        inbox.put(m)
+        if on_message:
+            on_message()
 
-def draw_piece_preview(surf, piece_name, x, y, cell_size=20):
-    """繪製方塊預覽（Hold 或 Next）"""
-    if not piece_name:
-        return
-
-    shapes = {
-        'I': [(0, 1), (1, 1), (2, 1), (3, 1)],
-        'O': [(1, 0), (2, 0), (1, 1), (2, 1)],
-        'T': [(1, 0), (0, 1), (1, 1), (2, 1)],
-        'L': [(2, 0), (0, 1), (1, 1), (2, 1)],
-        'J': [(0, 0), (0, 1), (1, 1), (2, 1)],
-        'S': [(1, 0), (2, 0), (0, 1), (1, 1)],
-        'Z': [(0, 0), (1, 0), (1, 1), (2, 1)],
-    }
-
-    piece_id = None
-    for pid, name in PIECE_NAMES.items():
-        if name == piece_name:
-            piece_id = pid
-            break
-
-    if piece_id is None:
-        return
-
-    color = COLORS.get(piece_id, (150, 150, 150))
-    cells = shapes.get(piece_name, [])
+    def runner():
+        try:
+            rec = load_replay(path)
+        except Exception as e:
+            deliver({"type": "NET", "sub": "ERROR", "detail": f"replay: {e}"})
+            return
+
+        player = ReplayPlayer(rec)
+        deliver({"type": "WELCOME", "role": "SPEC_REPLAY", "spectator": True,
+                 "gravityPlan": rec.get("gravityPlan") or {}})
+        t0 = time.time()
+        while True:
+            t_ms = int((time.time() - t0) * 1000 * speed)
+            frames.put(player.advance(t_ms))
+            if on_message:
+                on_message()
+            if player.finished:
+                break
+            time.sleep(REPLAY_FRAME_SEC)
+
+        end = rec.get("end") or {}
+        deliver({
+            "type": "MATCH_END",
+            "reason": end.get("reason", "replay end"),
+            "results": end.get("results", []),
+            "winnerRole": end.get("winnerRole"),
+            "winDetail": end.get("winDetail", ""),
+        })
 
-    for (cx, cy) in cells:
-        draw_cell(surf, x + cx * cell_size, y + cy * cell_size,
-                  cell_size - 2, cell_size - 2, color)
+    th = threading.Thread(target=runner, daemon=True)
+    th.start()
+    return th
 
 
-def pygame_main(host, port, me_user, me_name):
-    print(f"[GUI] pygame_main started: {me_name} @ {host}:{port} (user={me_user})", flush=True)
+def pygame_main(host, port, me_user, me_name, replay=None, speed=1.0):
+    log.info("pygame_main started", name=me_name, user=me_user, peer=f"{host}:{port}")
 
     pygame.init()
-    print(f"[GUI] pygame initialized", flush=True)
+    log.debug("pygame initialized")
 
     W, H = 900, 600
     screen = pygame.display.set_mode((W, H))
     pygame.display.set_caption(f"Tetris - {me_name}")
-    print(f"[GUI] Window created: {W}x{H}", flush=True)
+    log.debug("Window created", size=f"{W}x{H}")
 
     clock = pygame.time.Clock()
     font = pygame.font.SysFont(None, 24)
@@ -300,8 +401,13 @@ def pygame_main(host, port, me_user, me_name):
     font_title = pygame.font.SysFont(None, 48)
 
     inbox = queue.Queue()
-    outbox = queue.Queue()
-    net_thread = start_network_thread(host, port, me_user, me_name, inbox, outbox)
+    outbox = Outbox()
+    frames = FrameRing()
+    if replay:
+        net_thread = start_replay_thread(replay, inbox, frames, on_message=wake_ui, speed=speed)
+    else:
+        net_thread = start_network_thread(host, port, me_user, me_name, inbox, outbox, frames,
+                                          on_message=wake_ui)
     # ✅ 註冊退出處理器
     def cleanup():
         """確保退出時發送 BYE 訊息"""
@@ -315,7 +421,7 @@ def pygame_main(host, port, me_user, me_name):
     
     # ✅ 捕獲 Ctrl+C
     def signal_handler(sig, frame):
-        print(f"[GUI] Caught signal {sig}, cleaning up...", flush=True)
+        log.info("Caught signal, cleaning up", sig=sig)
         cleanup()
         pygame.quit()
         sys.exit(0)
@@ -351,23 +457,165 @@ def pygame_main(host, port, me_user, me_name):
         pygame.K_c: "HOLD",
     }
 
+    def draw_msg(surf):
+        surf.blit(texts.get(font, state["msg"], (200, 200, 200)), (40, 30))
+
+    def draw_title_me(surf):
+        surf.blit(texts.get(font, f"{state.get('my_name', 'You')}", (255, 255, 255)), (40, 55))
+        if state.get("is_spectator"):
+            surf.blit(texts.get(font_large, "*** SPECTATOR MODE ***", (255, 200, 0)), (40, 55))
+
+    def draw_title_op(surf):
+        surf.blit(texts.get(font, f"{state.get('op_name', 'Opponent')}", (255, 255, 255)), (550, 55))
+
+    def draw_hold(surf):
+        surf.blit(texts.get(font, "HOLD", (255, 255, 255)), (340, 58))
+        if state["hold"]:
+            draw_piece_preview(surf, tiles, state["hold"], 350, 90, cell_size=16)
+
+    def draw_next(surf):
+        surf.blit(texts.get(font, "NEXT", (255, 255, 255)), (340, 198))
+        for i, piece in enumerate(state["next_queue"][:3]):
+            draw_piece_preview(surf, tiles, piece, 350, 230 + i * 60, cell_size=14)
+
+    def info_lines():
+        return (
+            f"Score: {state['score']}",
+            f"Lines: {state['lines']}",
+            f"Level: {state['level']}",
+            f"Time: {state['remain_sec']}s",
+            f"Speed: {state.get('current_drop_ms', 500)}ms",
+        )
+
+    def draw_info(surf):
+        for i, text in enumerate(info_lines()):
+            surf.blit(texts.get(font_large, text, (255, 255, 100)), (340, 420 + i * 30))
+
+    def draw_controls(surf):
+        if state.get("is_spectator"):
+            controls = [
+                "Spectator Mode:",
+                "You can only watch",
+                "ESC : Quit",
+            ]
+        else:
+            controls = [
+                "Controls:",
+                "← → : Move",
+                "↓ : Soft Drop",
+                "↑ : Rotate CW",
+                "Z : Rotate CCW",
+                "Space : Hard Drop",
+                "C : Hold",
+                "ESC : Quit",
+            ]
+        for i, text in enumerate(controls):
+            surf.blit(texts.get(font, text, (150, 150, 150)), (700, 410 + i * 22))
+
+    def draw_overlay(remaining):
+        overlay = pygame.Surface((W, H))
+        overlay.set_alpha(210)
+        overlay.fill((0, 0, 0))
+        screen.blit(overlay, (0, 0))
+
+        y_offset = 130
+
+        # 勝負橫幅
+        if state["winner_role"] is None:
+            banner_text = "DRAW"
+            banner_color = (255, 215, 0)
+        else:
+            my_role = state.get("my_role")
+            if my_role and not my_role.startswith("SPEC"):
+                banner_text = "YOU WIN" if state["winner_role"] == my_role else "YOU LOSE"
+                banner_color = (0, 255, 120) if banner_text == "YOU WIN" else (255, 80, 80)
+            else:
+                # 觀戰者：顯示贏家名稱
+                win_name = state.get("winner_name") or state["winner_role"]
+                banner_text = f"{win_name} WINS"
+                banner_color = (0, 255, 120)
+
+        title = texts.get(font_title, banner_text, banner_color)
+        screen.blit(title, title.get_rect(center=(W//2, y_offset)))
+        y_offset += 60
+
+        # 勝利原因
+        reason_text = state.get("winner_reason") or "game end"
+        reason_txt = texts.get(font, f"Reason: {reason_text}", (220, 220, 220))
+        screen.blit(reason_txt, reason_txt.get_rect(center=(W//2, y_offset)))
+        y_offset += 20
+
+        # 詳細成績
+        y_offset += 40
+        for result in match_results:
+            role = result.get("role", "?")
+            name = result.get("name", role)
+            score = result.get("score", 0)
+            lines = result.get("lines", 0)
+            blocks = result.get("blocksCleared", 0)
+
+            if role == state["my_role"] and not state.get("is_spectator"):
+                color = (0, 255, 100)
+                prefix = "YOU"
+            else:
+                color = (200, 200, 200)
+                prefix = name
+
+            result_text = f"{prefix}: Score {score} | Lines {lines} | Blocks {blocks}"
+            txt = texts.get(font_large, result_text, color)
+            screen.blit(txt, txt.get_rect(center=(W//2, y_offset)))
+            y_offset += 36
+
+        y_offset += 24
+        if remaining > 0:
+            countdown = texts.get(font_large, f"Closing in {remaining}s...", (200, 200, 200))
+        else:
+            countdown = texts.get(font_large, "Closing...", (200, 200, 200))
+        screen.blit(countdown, countdown.get_rect(center=(W//2, y_offset)))
+
+        y_offset += 32
+        hint = texts.get(font, "(Press ESC to close now)", (150, 150, 150))
+        screen.blit(hint, hint.get_rect(center=(W//2, y_offset)))
+
+    # 繪圖快取與各區塊（內容沒變就不重畫）
+    tiles = TileCache()
+    texts = TextCache()
+    view_me = BoardView(tiles, 40, 80, cell_size=24)
+    view_op = BoardView(tiles, 550, 80, cell_size=16)
+    msg_panel = Panel((0, 25, W, 28))
+    title_me_panel = Panel((40, 55, 290, 23))
+    title_op_panel = Panel((550, 55, W - 550, 23))
+    hold_panel = Panel((335, 55, 90, 110), bg=BOARD_BG)
+    next_panel = Panel((335, 195, 90, 200), bg=BOARD_BG)
+    info_panel = Panel((335, 420, 200, 150))
+    controls_panel = Panel((700, 410, 200, 180))
+    need_full = True       # 第一幀 / 結束畫面變化時整個重畫
+    overlay_key = None
+    drew = True
+
     frame_count = 0
-    print(f"[GUI] Entering main loop", flush=True)
+    log.debug("Entering main loop")
 
     while running:
         frame_count += 1
         if frame_count % 300 == 0:
-            print(f"[GUI] Frame {frame_count}, FPS: {clock.get_fps():.1f}", flush=True)
+            log.debug("Frame stats", frame=frame_count, fps=round(clock.get_fps(), 1), stale_dropped=frames.dropped)
+
+        # 1) 處理事件；上一輪什麼都沒畫且沒有待處理訊息 → 睡到有事件為止
+        events = pygame.event.get()
+        if not events and not drew and inbox.empty() and not frames.pending():
+            e = pygame.event.wait(IDLE_WAIT_MS)
+            if e.type != pygame.NOEVENT:
+                events = [e] + pygame.event.get()
 
-        # 1) 處理事件
-        for e in pygame.event.get():
+        for e in events:
             if e.type == pygame.QUIT:
-                print(f"[GUI] QUIT event", flush=True)
+                log.info("QUIT event")
                 cleanup()  # ✅ 主動清理
                 running = False
             elif e.type == pygame.KEYDOWN:
                 if e.key == pygame.K_ESCAPE:
-                    print(f"[GUI] ESC pressed, closing", flush=True)
+                    log.info("ESC pressed, closing")
                     cleanup()  # ✅ 主動清理
                     running = False
                     continue
@@ -382,6 +630,9 @@ def pygame_main(host, port, me_user, me_name):
                             "ts": int(time.time() * 1000),
                             "action": action
                         })
+                        if state.get("predictor") is not None:
+                            state["predictor"].local_input(seq, action)
+                            apply_prediction()
                         seq += 1
 
         # 2) 處理網路訊息
@@ -393,11 +644,11 @@ def pygame_main(host, port, me_user, me_name):
                 if t == "NET" and m.get("sub") == "CONNECTED":
                     state["connected"] = True
                     state["msg"] = "Connected. Waiting..."
-                    print(f"[GUI] State: Connected", flush=True)
+                    log.debug("State: Connected")
 
                 elif t == "NET" and m.get("sub") == "ERROR":
                     state["msg"] = f"Error: {m.get('detail')}"
-                    print(f"[GUI] State: Error - {m.get('detail')}", flush=True)
+                    log.debug("State: Error", detail=m.get("detail"))
 
                 elif t == "WELCOME":
                     state["my_role"] = m.get("role", "P1")
@@ -409,34 +660,31 @@ def pygame_main(host, port, me_user, me_name):
 
                     if gravity_plan:
                         state["current_drop_ms"] = gravity_plan.get("initialDropMs", 500)
-                        print(f"[GUI] Gravity plan received: {gravity_plan}", flush=True)
+                        log.debug("Gravity plan received", plan=gravity_plan)
 
                     if is_spectator:
                         state["msg"] = f"🎥 觀戰模式 (只能觀看)"
-                        print(f"[GUI] Spectator mode activated", flush=True)
+                        log.info("Spectator mode activated")
                     else:
                         state["msg"] = f"Welcome! You are {state['my_role']}"
-                        print(f"[GUI] State: Welcome as {state['my_role']}", flush=True)
+                        log.info("Welcome", role=state["my_role"])
 
                     state["is_spectator"] = is_spectator
+                    seed = m.get("seed")
+                    state["predictor"] = Predictor(seed) if (seed is not None and not is_spectator) else None
 
                     # 🔧 初始化遊戲時鐘
                     game_start_ticks = pygame.time.get_ticks()
                     server_start_ms = int(time.time() * 1000)
                     last_drop_time = 0
 
-                elif t == "SNAPSHOT":
-                    apply_snapshot(m)
-                    if not game_ended:
-                        state["msg"] = f"Playing... {state['remain_sec']}s left"
-
                 elif t == "GRAVITY_UPDATE":
                     new_drop_ms = m.get("dropMs")
                     reason = m.get("reason", "")
                     if new_drop_ms:
                         old_drop_ms = state.get("current_drop_ms", 500)
                         state["current_drop_ms"] = new_drop_ms
-                        print(f"[GUI] Gravity updated: {old_drop_ms}ms -> {new_drop_ms}ms ({reason})", flush=True)
+                        log.debug("Gravity updated", old_ms=old_drop_ms, new_ms=new_drop_ms, reason=reason)
                         state["msg"] = f"⚡ Speed up! {new_drop_ms}ms"
 
                 elif t == "MATCH_END":
@@ -448,9 +696,8 @@ def pygame_main(host, port, me_user, me_name):
                     winner_username = m.get("winnerUsername")  # ⭐ 改名
                     win_detail = m.get("winDetail", "")
 
-                    print(f"[GUI] Game Over: {reason}", flush=True)
-                    print(f"[GUI] Results: {results}", flush=True)
-                    print(f"[GUI] Winner: role={winner_role} user={winner_username} detail={win_detail}", flush=True)
+                    log.info("Game Over", reason=reason, winner_role=winner_role, winner=winner_username,
+                             detail=win_detail, results=results)
 
                     state["winner_role"] = winner_role
                     state["winner_reason"] = win_detail if win_detail else reason
@@ -488,7 +735,7 @@ def pygame_main(host, port, me_user, me_name):
 
                 elif t == "SPECTATOR_KICKED":
                     reason = m.get("reason", "")
-                    print(f"[GUI] Spectator kicked: {reason}", flush=True)
+                    log.info("Spectator kicked", reason=reason)
                     state["msg"] = f"You have been kicked: {reason}"
                     game_ended = True
                     game_end_time = time.time()
@@ -496,9 +743,16 @@ def pygame_main(host, port, me_user, me_name):
         except queue.Empty:
             pass
 
+        # 只畫最新的 frame（中間來不及畫的已在 FrameRing 裡丟掉）
+        frame = frames.latest()
+        if frame is not None:
+            apply_frame(frame)
+            if not game_ended:
+                state["msg"] = f"Playing... {state['remain_sec']}s left"
+
         # 遊戲結束後 5 秒自動關閉
         if game_ended and time.time() - game_end_time > 5:
-            print(f"[GUI] Auto-closing after game end", flush=True)
+            log.info("Auto-closing after game end")
             running = False
 
         # 🔧 單調時鐘預期掉落（僅視覺，不送命令）
@@ -509,152 +763,47 @@ def pygame_main(host, port, me_user, me_name):
             if elapsed_game_ms - last_drop_time >= current_drop_ms:
                 last_drop_time = elapsed_game_ms
 
-        # 3) 繪圖
-        screen.fill((20, 20, 30))
-
-        # 我的遊戲板（左側）
-        my_display_name = state.get("my_name", "You")
-        draw_board(screen, state["board_me"], 40, 80, cell_size=24, title=f"{my_display_name}")
-
-        # 對手遊戲板（右側，縮小）
-        op_display_name = state.get("op_name", "Opponent")
-        draw_board(screen, state["board_op"], 550, 80, cell_size=16, title=f"{op_display_name}")
-
-        # Hold 區域
-        hold_x, hold_y = 340, 80
-        pygame.draw.rect(screen, (60, 60, 60), (hold_x - 5, hold_y - 25, 90, 110))
-        txt = font.render("HOLD", True, (255, 255, 255))
-        screen.blit(txt, (hold_x, hold_y - 22))
-        if state["hold"]:
-            draw_piece_preview(screen, state["hold"], hold_x + 10, hold_y + 10, cell_size=16)
-
-        # Next 區域
-        next_x, next_y = 340, 220
-        pygame.draw.rect(screen, (60, 60, 60), (next_x - 5, next_y - 25, 90, 200))
-        txt = font.render("NEXT", True, (255, 255, 255))
-        screen.blit(txt, (next_x, next_y - 22))
-        for i, piece in enumerate(state["next_queue"][:3]):
-            draw_piece_preview(screen, piece, next_x + 10, next_y + 10 + i * 60, cell_size=14)
-
-        # 分數資訊
-        info_y = 450
-        info_texts = [
-            f"Score: {state['score']}",
-            f"Lines: {state['lines']}",
-            f"Level: {state['level']}",
-            f"Time: {state['remain_sec']}s",
-            f"Speed: {state.get('current_drop_ms', 500)}ms",
-        ]
-        for i, text in enumerate(info_texts):
-            txt = font_large.render(text, True, (255, 255, 100))
-            screen.blit(txt, (40, info_y + i * 30))
-
-        # 狀態訊息
-        msg_txt = font.render(state["msg"], True, (200, 200, 200))
-        screen.blit(msg_txt, (40, 30))
-        if state.get("is_spectator"):
-            spectator_txt = font_large.render("*** SPECTATOR MODE ***", True, (255, 200, 0))
-            screen.blit(spectator_txt, (40, 55))
-
-        # 控制說明
-        if state.get("is_spectator"):
-            controls = [
-                "Spectator Mode:",
-                "You can only watch",
-                "ESC : Quit",
-            ]
-        else:
-            controls = [
-                "Controls:",
-                "← → : Move",
-                "↓ : Soft Drop",
-                "↑ : Rotate CW",
-                "Z : Rotate CCW",
-                "Space : Hard Drop",
-                "C : Hold",
-                "ESC : Quit",
-            ]
-        for i, text in enumerate(controls):
-            txt = font.render(text, True, (150, 150, 150))
-            screen.blit(txt, (700, 380 + i * 22))
-
-        # 如果遊戲結束，顯示結果覆蓋層（加入勝負橫幅）
+        # 3) 繪圖：只重畫有變的區塊 / 格子
+        full = need_full
         if game_ended:
-            overlay = pygame.Surface((W, H))
-            overlay.set_alpha(210)
-            overlay.fill((0, 0, 0))
-            screen.blit(overlay, (0, 0))
-
-            y_offset = 130
-
-            # 勝負橫幅
-            if state["winner_role"] is None:
-                banner_text = "DRAW"
-                banner_color = (255, 215, 0)
-            else:
-                my_role = state.get("my_role")
-                if my_role and not my_role.startswith("SPEC"):
-                    banner_text = "YOU WIN" if state["winner_role"] == my_role else "YOU LOSE"
-                    banner_color = (0, 255, 120) if banner_text == "YOU WIN" else (255, 80, 80)
-                else:
-                    # 觀戰者：顯示贏家名稱
-                    win_name = state.get("winner_name") or state["winner_role"]
-                    banner_text = f"{win_name} WINS"
-                    banner_color = (0, 255, 120)
-
-            title = font_title.render(banner_text, True, banner_color)
-            title_rect = title.get_rect(center=(W//2, y_offset))
-            screen.blit(title, title_rect)
-            y_offset += 60
-
-            # 勝利原因
-            reason_text = state.get("winner_reason") or "game end"
-            reason_txt = font.render(f"Reason: {reason_text}", True, (220, 220, 220))
-            reason_rect = reason_txt.get_rect(center=(W//2, y_offset))
-            screen.blit(reason_txt, reason_rect)
-            y_offset += 20
-
-            # 詳細成績
-            y_offset += 40
-            for result in match_results:
-                role = result.get("role", "?")
-                name = result.get("name", role)
-                score = result.get("score", 0)
-                lines = result.get("lines", 0)
-                blocks = result.get("blocksCleared", 0)
-
-                if role == state["my_role"] and not state.get("is_spectator"):
-                    color = (0, 255, 100)
-                    prefix = "YOU"
-                else:
-                    color = (200, 200, 200)
-                    prefix = name
-
-                result_text = f"{prefix}: Score {score} | Lines {lines} | Blocks {blocks}"
-                txt = font_large.render(result_text, True, color)
-                txt_rect = txt.get_rect(center=(W//2, y_offset))
-                screen.blit(txt, txt_rect)
-                y_offset += 36
-
-            y_offset += 24
             remaining = max(0, int(5 - (time.time() - game_end_time)))
-            if remaining > 0:
-                countdown = font_large.render(f"Closing in {remaining}s...",
-                                              True, (200, 200, 200))
-            else:
-                countdown = font_large.render("Closing...", True, (200, 200, 200))
-            countdown_rect = countdown.get_rect(center=(W//2, y_offset))
-            screen.blit(countdown, countdown_rect)
+            key = (state["winner_role"], state.get("winner_name"), state.get("winner_reason"),
+                   repr(match_results), remaining)
+            if key != overlay_key:
+                overlay_key = key
+                full = True
+
+        rects = []
+        if full:
+            screen.fill(BG_COLOR)
+        if full or not game_ended:
+            rects += msg_panel.update(screen, state["msg"], draw_msg, full)
+            rects += title_me_panel.update(screen, (state.get("my_name", "You"), state.get("is_spectator")),
+                                           draw_title_me, full)
+            rects += title_op_panel.update(screen, state.get("op_name", "Opponent"), draw_title_op, full)
+            rects += view_me.draw(screen, state["board_me"], full)
+            rects += view_op.draw(screen, state["board_op"], full)
+            rects += hold_panel.update(screen, state["hold"], draw_hold, full)
+            rects += next_panel.update(screen, tuple(state["next_queue"][:3]), draw_next, full)
+            rects += info_panel.update(screen, info_lines(), draw_info, full)
+            rects += controls_panel.update(screen, bool(state.get("is_spectator")), draw_controls, full)
+
+        # 如果遊戲結束，顯示結果覆蓋層（加入勝負橫幅）
+        if game_ended and full:
+            draw_overlay(remaining)
 
-            y_offset += 32
-            hint = font.render("(Press ESC to close now)", True, (150, 150, 150))
-            hint_rect = hint.get_rect(center=(W//2, y_offset))
-            screen.blit(hint, hint_rect)
+        if full:
+            pygame.display.flip()
+        elif rects:
+            pygame.display.update(rects)
+        need_full = False
 
-        pygame.display.flip()
-        clock.tick(60)
+        # 有畫東西才限制幀率；沒變化時下一輪在事件等待裡閒置
+        drew = full or bool(rects)
+        if drew:
+            clock.tick(ACTIVE_FPS)
 
-    print(f"[GUI] Exiting", flush=True)
+    log.info("Exiting")
     cleanup()  # ✅ 最後確保清理
     time.sleep(0.2)
     pygame.quit()
@@ -666,6 +815,8 @@ if __name__ == "__main__":
     ap.add_argument("--port", required=False)
     ap.add_argument("--user", default=None)  # ⭐ 改成 default=None
     ap.add_argument("--name", default=None)  # ⭐ 改成 default=None
+    ap.add_argument("--replay", default=None)   # 紀錄檔路徑：不連線，直接播放
+    ap.add_argument("--speed", type=float, default=1.0)
     args = ap.parse_args()
 
     # ⭐ 優先使用環境變數中的真實帳號
@@ -676,6 +827,6 @@ if __name__ == "__main__":
     user = args.user or os.getenv("PLAYER_USERNAME") or os.getenv("PLAYER_USER_ID", "guest")
     name = args.name or os.getenv("PLAYER_NAME") or user
 
-    print(f"[GUI] Arguments: host={host} port={port} user={user} name={name}", flush=True)
+    log.debug("Arguments", host=host, port=port, user=user, name=name)
 
-    pygame_main(host, port, user, name)
\ No newline at end of file
+    pygame_main(host, port, user, name, replay=args.replay, speed=args.speed)
\ No newline at end of file
@@ -9,8 +9,15 @@ sys.path.insert(0, os.path.join(GAME_ROOT, 'common'))
 
 import argparse, asyncio, time, random, json, subprocess, socket, sys, threading
 from typing import Dict, Optional, List
-from framing import recv_json, send_json
-from logic_tetris import TetrisEngine, PID
+from framing import send_json, pack_msg, recv_msg, send_msg, CAP_BINARY
+from logic_tetris import TetrisEngine
+from delta import DeltaEncoder
+from replay import MatchRecorder, REPLAY_SUFFIX, final_state, prune_replays
+from gamelog import get_logger
+import ticket as room_ticket
+
+# 每個 game server 行程只有一個房間，房號直接綁在 logger 上
+log = get_logger("server.room", room=os.getenv("ROOM_ID", "0"))
 
 def get_lobby_connect_host():
     """
@@ -43,34 +50,46 @@ def notify_lobby_game_finished_kick_all():
         return
     try:
         with socket.create_connection((lobby_host, int(lobby_port)), timeout=2) as s:
-            msg = json.dumps({
+            msg = json.dumps(room_ticket.sign_callback({
                 "kind": "game_finished",
                 "room_id": room_id,
                 "kick_all": True
-            }) + "\n"
+            })) + "\n"
             s.sendall(msg.encode("utf-8"))
             try:
                 s.recv(4096)
             except Exception:
                 pass
-        print(f"[GameServer] Notified lobby kick_all for {room_id}", flush=True)
+        log.info("Notified lobby kick_all")
     except Exception as e:
-        print(f"[GameServer] notify kick_all failed: {e}", flush=True)
+        log.warning("notify kick_all failed", error=str(e))
 
 ARGS = None
 
-TICK_MS = 50
-SNAPSHOT_MS = 150
+# 事件驅動排程：有輸入立刻處理，重力依每位玩家的 deadline 觸發，沒事就睡到下一個 deadline
+PUSH_MIN_MS = 30      # 狀態有變動時，兩次推送之間的最小間隔（限流）
+HEARTBEAT_MS = 1000   # 狀態沒變動時，至少這麼久推一次（讓倒數計時更新）
+DISCONNECT_TIMEOUT = 3.0  # 玩家掉線超過幾秒判負
+
+# 每條連線的送出緩衝上限（bytes）
+PLAYER_MAX_BUFFER = 1 << 20      # 玩家：超過代表連線卡死，直接斷線
+SPECTATOR_MAX_BUFFER = 64 * 1024 # 觀戰者：超過就跳過這一幀，追上後直接拿最新 keyframe
+RELAY_MAX_BUFFER = 1 << 20       # 觀戰轉播（relay.py）：背後是所有觀眾，容許較多緩衝再跳幀
 
 class Conn:
-    def __init__(self, reader, writer, user_id: str, name: str, role: str, spectator: bool=False):
+    def __init__(self, reader, writer, user_id: str, name: str, role: str, spectator: bool=False,
+                 relay: bool=False):
         self.reader = reader
         self.writer = writer
         self.user_id = user_id
         self.name = name
         self.role = role
         self.spectator = spectator
+        self.relay = relay         # 觀戰轉播連線（一條連線代表 relay 後面所有觀眾）
         self.seq_seen = -1
+        self.need_keyframe = True  # 剛加入 / 要求重同步 → 下一個 SNAPSHOT 送完整 keyframe
+        self.frames_skipped = 0    # 因為落後而被跳過的幀數
+        self.binary = False        # HELLO/WELCOME 協商後使用二進位格式
 
 class GameRoom:
     def __init__(self, duration_sec: int = 60, drop_ms: int = 500, seed: Optional[int]=None, 
@@ -95,18 +114,33 @@ class GameRoom:
         }
         self.conns: Dict[str, Optional[Conn]] = {"P1": None, "P2": None}
         self.spectators: List[Conn] = []
-        self.input_queues = {"P1": asyncio.Queue(), "P2": asyncio.Queue()}
+        self.input_queues = {"P1": asyncio.Queue(), "P2": asyncio.Queue()}  # (seq, action)
+        self.acked_seq = {"P1": -1, "P2": -1}  # 每位玩家最後一個已套用的輸入 seq（回給 client 做 reconcile）
         self.started = False
         self.start_ms = None
         self.last_drop_ms = {"P1": 0, "P2": 0}
         self.last_snapshot_ms = 0
+        self.snap_encoder = DeltaEncoder()
         self.last_gravity_update_ms = 0
+        self.next_gravity_ms = None   # progressive 模式下一次調整重力的時間點
+        self.wakeup = asyncio.Event() # 有輸入 / 連線變動時叫醒 game_loop
         self.done = False
         self.result = None
         self.accepting_connections = True  # 🔧 新增：是否接受新連接
         self.disconnect_timestamps = {"P1": None, "P2": None}  # ✅ 記錄掉線時間
         self.early_end_reason = None  # ✅ 提前結束原因
         self.early_winner = None      # ✅ 提前結束贏家
+        self.tick = 0                 # game_loop 迴圈次數（紀錄檔用）
+        self.recorder = MatchRecorder(self.seed, self.gravity_plan(), duration_sec)
+
+    def gravity_plan(self) -> dict:
+        return {
+            "mode": self.gravity_mode,
+            "initialDropMs": self.gravity_cfg["initialDropMs"],
+            "minDropMs": self.gravity_cfg["minDropMs"],
+            "intervalSec": self.gravity_cfg["intervalSec"],
+            "stepMs": self.gravity_cfg["stepMs"],
+        }
 
     def role_of(self, conn: Conn) -> str:
         return conn.role
@@ -114,6 +148,16 @@ class GameRoom:
     def ready(self) -> bool:
         return self.conns["P1"] is not None and self.conns["P2"] is not None
 
+    def begin(self, now: int):
+        """兩位玩家到齊，開始計時"""
+        self.started = True
+        self.start_ms = now
+        self.recorder.start(now)
+        self.last_drop_ms = {"P1": now, "P2": now}
+        self.last_gravity_update_ms = now
+        if self.gravity_mode == "progressive":
+            self.next_gravity_ms = now + max(1, int(self.gravity_cfg["intervalSec"])) * 1000
+
     def any_topout(self) -> bool:
         return self.engine["P1"].topout or self.engine["P2"].topout
     
@@ -160,7 +204,7 @@ async def handle_client(room: GameRoom, reader: asyncio.StreamReader, writer: as
     try:
         # 🔧 遊戲結束後拒絕所有新連接
         if not room.accepting_connections:
-            print(f"[GameServer] ✗ Rejected connection: game has ended")
+            log.info("Rejected connection: game has ended")
             try:
                 await send_json(writer, {
                     "type": "ERROR",
@@ -173,20 +217,31 @@ async def handle_client(room: GameRoom, reader: asyncio.StreamReader, writer: as
             await writer.wait_closed()
             return
         
-        hello = await recv_json(reader)
+        hello = await recv_msg(reader)
         if hello.get("type") != "HELLO":
             await send_json(writer, {"type":"ERROR","code":"BadRequest","msg":"need HELLO"})
             writer.close()
             await writer.wait_closed()
             return
         
+        # 由 lobby 啟動時（有 ROOM_KEY）一律要帶房間票，身分以票上的 user / role 為準
+        claims = None
+        if room_ticket.enabled():
+            claims = room_ticket.verify(hello.get("ticket"))
+            if not claims:
+                log.warning("Rejected: invalid room ticket", claimed=hello.get("username"))
+                await send_json(writer, {"type":"ERROR","code":"Unauthorized","msg":"invalid room ticket"})
+                writer.close()
+                await writer.wait_closed()
+                return
+
         # ⭐ 改用 username 作為識別
-        username = str(hello.get("username", "player"))
+        username = claims["user"] if claims else str(hello.get("username", "player"))
         name = str(hello.get("name", username))  # name 可以是顯示名稱
         
         # 🔧 再次檢查（避免競態條件）
         if not room.accepting_connections:
-            print(f"[GameServer] ✗ Rejected {name}: game ended during handshake")
+            log.info("Rejected: game ended during handshake", name=name)
             try:
                 await send_json(writer, {
                     "type": "ERROR",
@@ -211,7 +266,16 @@ async def handle_client(room: GameRoom, reader: asyncio.StreamReader, writer: as
                 break
         
         spectator = False
-        if existing_role:
+        relay = claims["role"] == "relay" if claims else bool(hello.get("relay"))
+        if relay:
+            # relay 可能比玩家先連上，一律當觀戰者，不佔玩家位置
+            spectator = True
+            role = f"RELAY_{sum(1 for s in room.spectators if s.relay) + 1}"
+        elif claims and claims["role"] != "player":
+            # 觀戰票不能佔玩家位置
+            spectator = True
+            role = f"SPEC_{len(room.spectators) + 1}"
+        elif existing_role:
             role = existing_role
         elif room.conns["P1"] is None:
             role = "P1"
@@ -222,44 +286,41 @@ async def handle_client(room: GameRoom, reader: asyncio.StreamReader, writer: as
             spec_num = len(room.spectators) + 1
             role = f"SPEC_{spec_num}"
         
-        conn = Conn(reader, writer, username, name, role, spectator)
+        conn = Conn(reader, writer, username, name, role, spectator, relay)
+        conn.binary = CAP_BINARY in (hello.get("caps") or [])
         
-        if spectator:
+        if relay:
+            room.spectators.append(conn)
+            log.info("Spectator relay attached", name=name, role=role)
+        elif spectator:
             room.spectators.append(conn)
-            print(f"[GameServer] 🎥 Spectator joined: {name} (userId={username}, role={role})")
+            log.info("Spectator joined", name=name, user=username, role=role)
         else:
             room.conns[role] = conn
-            print(f"[GameServer] ✓ Player joined: {name} as {role} (userId={username})")
+            log.info("Player joined", name=name, user=username, role=role)
         
         await send_json(writer, {
             "type":"WELCOME",
             "role":role,
             "seed":room.seed,
             "bagRule":"7bag",
-            "gravityPlan":{
-                "mode": room.gravity_mode,
-                "initialDropMs": room.gravity_cfg["initialDropMs"],
-                "minDropMs": room.gravity_cfg["minDropMs"],
-                "intervalSec": room.gravity_cfg["intervalSec"],
-                "stepMs": room.gravity_cfg["stepMs"],
-            },
+            "gravityPlan":room.gravity_plan(),
             "rule":{"mode":"timer","durationSec":room.duration_sec},
-            "spectator": spectator
+            "spectator": spectator,
+            "caps": [CAP_BINARY] if conn.binary else []
         })
         
         if room.ready() and not room.started:
-            room.started = True
-            room.start_ms = int(time.time()*1000)
-            room.last_drop_ms = {"P1": room.start_ms, "P2": room.start_ms}
-            room.last_gravity_update_ms = room.start_ms
-            print(f"[GameServer] ✓ Game started!")
+            room.begin(int(time.time()*1000))
+            log.info("Game started", seed=room.seed)
         
         if not conn.spectator:
             room.disconnect_timestamps[conn.role] = None
-        # 接收循環帶超時
+        room.wakeup.set()
+        # 接收循環：不設 timeout，遊戲結束時連線會被關閉而跳出
         while not room.done:
             try:
-                msg = await asyncio.wait_for(recv_json(reader), timeout=1.0)
+                msg = await recv_msg(reader)
                 t = msg.get("type")
                 
                 if t == "INPUT" and not conn.spectator and room.started:
@@ -268,17 +329,21 @@ async def handle_client(room: GameRoom, reader: asyncio.StreamReader, writer: as
                     if seq <= conn.seq_seen: 
                         continue
                     conn.seq_seen = seq
-                    await room.input_queues[conn.role].put(action)
+                    await room.input_queues[conn.role].put((seq, action))
+                    room.wakeup.set()
                 
                 elif t == "PING":
-                    await send_json(writer, {"type":"PONG","t":msg.get("t")})
+                    await send_msg(writer, {"type":"PONG","t":msg.get("t")}, conn.binary)
+
+                elif t == "RESYNC":
+                    # client 的 DELTA seq 接不上 → 下一輪補一個 keyframe
+                    conn.need_keyframe = True
+                    room.wakeup.set()
                 
                 elif t == "BYE":
-                    print(f"[GameServer] Client {conn.name} sent BYE")
+                    log.info("Client sent BYE", name=conn.name)
                     break
                 
-            except asyncio.TimeoutError:
-                continue
             except ConnectionError:
                 break
     
@@ -286,14 +351,15 @@ async def handle_client(room: GameRoom, reader: asyncio.StreamReader, writer: as
         pass  # 靜默處理正常斷線
     
     except Exception as e:
-        print(f"[GameServer] Error handling client {conn.name if conn else 'unknown'}: {e}")
+        log.exception("Error handling client", name=conn.name if conn else "unknown", error=str(e))
     
     finally:
         if conn:
             # ✅ 關鍵：玩家掉線時記錄時間戳
             if conn and not conn.spectator and room.started and not room.done:
                 room.disconnect_timestamps[conn.role] = time.time()
-                print(f"[GameServer] ⚠ {conn.name} ({conn.role}) disconnected during game", flush=True)
+                room.wakeup.set()
+                log.warning("Disconnected during game", name=conn.name, role=conn.role)
 
                 # 檢查是否應提前結束
                 await check_early_end(room)
@@ -306,13 +372,13 @@ async def handle_client(room: GameRoom, reader: asyncio.StreamReader, writer: as
             if conn.spectator:
                 room.spectators = [s for s in room.spectators if s is not conn]
                 if room.accepting_connections:  # 只在遊戲中才記錄
-                    print(f"[GameServer] Spectator left: {conn.name}")
+                    log.info("Spectator left", name=conn.name)
             else:
                 for role, c in list(room.conns.items()):
                     if c is conn:
                         room.conns[role] = None
                         if room.accepting_connections:  # 只在遊戲中才記錄
-                            print(f"[GameServer] Player left: {conn.name} ({role})")
+                            log.info("Player left", name=conn.name, role=role)
 async def check_early_end(room: GameRoom):
     """檢查是否因掉線而提前結束遊戲"""
     if room.done:
@@ -322,18 +388,16 @@ async def check_early_end(room: GameRoom):
     p2_disc = room.disconnect_timestamps.get("P2")
     now = time.time()
     
-    # ✅ 策略1：任一玩家掉線超過 3 秒 → 判負
-    DISCONNECT_TIMEOUT = 3.0
-    
+    # ✅ 策略1：任一玩家掉線超過 DISCONNECT_TIMEOUT 秒 → 判負
     if p1_disc and (now - p1_disc) >= DISCONNECT_TIMEOUT:
-        print(f"[GameServer] P1 disconnect timeout, P2 wins by forfeit", flush=True)
+        log.info("P1 disconnect timeout, P2 wins by forfeit")
         room.early_end_reason = "P1 disconnected"
         room.early_winner = "P2"
         room.done = True
         return
     
     if p2_disc and (now - p2_disc) >= DISCONNECT_TIMEOUT:
-        print(f"[GameServer] P2 disconnect timeout, P1 wins by forfeit", flush=True)
+        log.info("P2 disconnect timeout, P1 wins by forfeit")
         room.early_end_reason = "P2 disconnected"
         room.early_winner = "P1"
         room.done = True
@@ -341,20 +405,44 @@ async def check_early_end(room: GameRoom):
     
     # ✅ 策略2：雙方都掉線 → 立即結束，比分數
     if p1_disc and p2_disc:
-        print(f"[GameServer] Both players disconnected, ending immediately", flush=True)
+        log.info("Both players disconnected, ending immediately")
         room.early_end_reason = "Both disconnected"
         room.done = True
         return
 
-async def broadcast(conns, obj):
-    """廣播給所有連線"""
+async def broadcast(conns, obj, droppable: bool = False):
+    """
+    廣播給所有連線：每種格式（JSON / 二進位）只序列化一次，同一份 bytes 直接寫進
+    每條連線的 transport，不逐一 await drain（一個慢的觀戰者不會拖住所有人）。
+    - 玩家優先寫入；緩衝超過 PLAYER_MAX_BUFFER 視為卡死 → 斷線
+    - droppable（SNAPSHOT / DELTA）：落後的觀戰者跳過這一幀，並標記下一幀送 keyframe
+    - relay 排在玩家之後、一般觀戰者之前，跳幀門檻用 RELAY_MAX_BUFFER
+    """
+    encoded = {}
     dead = []
-    for c in conns:
+    for c in sorted(conns, key=lambda c: (c.spectator, not c.relay)):
+        w = c.writer
+        if w.is_closing():
+            dead.append(c)
+            continue
+        buffered = w.transport.get_write_buffer_size()
+        limit = RELAY_MAX_BUFFER if c.relay else SPECTATOR_MAX_BUFFER
+        if c.spectator and droppable and buffered > limit:
+            c.frames_skipped += 1
+            c.need_keyframe = True
+            continue
+        if not c.spectator and buffered > PLAYER_MAX_BUFFER:
+            log.warning("Send buffer stuck, dropping", name=c.name, role=c.role, buffered=buffered)
+            dead.append(c)
+            continue
         try:
-            await send_json(c.writer, obj)
+            data = encoded.get(c.binary)
+            if data is None:
+                data = encoded[c.binary] = pack_msg(obj, c.binary)
+            w.write(data)
         except Exception:
             dead.append(c)
-    
+
     for c in dead:
         try:
             c.writer.close()
@@ -362,27 +450,85 @@ async def broadcast(conns, obj):
         except:
             pass
 
+def build_frame(room: GameRoom, now: int) -> dict:
+    """組出目前的完整狀態（盤面只含已鎖定格子，active 另外帶），交給 DeltaEncoder 編碼"""
+    frame = {
+        "at":now,
+        "remainMs":max(0, room.duration_sec*1000 - (now-room.start_ms)),
+        "currentDropMs":room.drop_ms,
+        "players":[]
+    }
+    for role in ["P1","P2"]:
+        eng = room.engine[role]
+        conn = room.conns.get(role)
+        player_name = conn.name if conn else f"Player{role[-1]}"
+        s = eng.snapshot()
+        frame["players"].append({
+            "role": role,
+            "name": player_name,
+            "board": s.board,
+            "active": s.active,
+            "hold": s.hold,
+            "next": s.nextq,
+            "score": s.score,
+            "lines": s.lines,
+            "level": s.level,
+            "blocksCleared": s.blocks_cleared,
+            "drawn": s.drawn,
+            "ack": room.acked_seq[role],
+        })
+    return frame
+
+async def push_state(room: GameRoom, now: int):
+    """送出目前狀態：需要 keyframe 的連線送 SNAPSHOT，其他送 DELTA"""
+    room.last_snapshot_ms = now
+    key, delta = room.snap_encoder.push(build_frame(room, now))
+    all_conns = [c for c in room.conns.values() if c is not None] + room.spectators
+    fresh = [c for c in all_conns if c.need_keyframe or delta is None]
+    for c in fresh:
+        c.need_keyframe = False
+    if fresh:
+        await broadcast(fresh, key, droppable=True)
+    if delta is not None:
+        await broadcast([c for c in all_conns if c not in fresh], delta, droppable=True)
+
+def next_deadline_ms(room: GameRoom, dirty: bool) -> int:
+    """下一個需要醒來的時間點（結束、重力、推送、重力調整、掉線判負）"""
+    deadlines = [
+        room.start_ms + room.duration_sec*1000,
+        room.last_drop_ms["P1"] + room.drop_ms,
+        room.last_drop_ms["P2"] + room.drop_ms,
+        room.last_snapshot_ms + (PUSH_MIN_MS if dirty else HEARTBEAT_MS),
+    ]
+    if room.next_gravity_ms is not None:
+        deadlines.append(room.next_gravity_ms)
+    for ts in room.disconnect_timestamps.values():
+        if ts:
+            deadlines.append(int(ts*1000 + DISCONNECT_TIMEOUT*1000) + 1)
+    return min(deadlines)
+
 async def game_loop(room: GameRoom):
+    # 等兩位玩家到齊：由 handle_client 叫醒，不輪詢
     while not room.started:
-        await asyncio.sleep(0.02)
-        if room.ready() and not room.started:
-            room.started = True
-            now = int(time.time()*1000)
-            room.start_ms = now
-            room.last_drop_ms = {"P1": now, "P2": now}
-            room.last_gravity_update_ms = now
+        room.wakeup.clear()
+        if room.ready():
+            room.begin(int(time.time()*1000))
+            break
+        await room.wakeup.wait()
 
-    print(f"[GameServer] Game loop started")
+    log.info("Game loop started")
     last_total_lines = 0  # 追蹤上次的總行數
+    dirty = True
     while not room.done:
+        room.wakeup.clear()
+        room.tick += 1
         now = int(time.time()*1000)
         
-        # ✅ 定期檢查掉線超時
-        if now % 1000 < TICK_MS:  # 每秒檢查一次
-            await check_early_end(room)
+        # ✅ 掉線超時（deadline 已排進 next_deadline_ms，這裡只是 O(1) 檢查）
+        await check_early_end(room)
         
         if room.done:
-            print(f"[GameServer] Early end detected, broadcasting results...", flush=True)
+            log.info("Early end detected, broadcasting results", reason=room.early_end_reason)
             break
 
         if now - room.start_ms >= room.duration_sec*1000:
@@ -391,11 +537,16 @@ async def game_loop(room: GameRoom):
 
         elapsed_sec = (now - room.start_ms) // 1000
         if room.gravity_mode == "progressive":
-            if now - room.last_gravity_update_ms >= 30000:
+            if room.next_gravity_ms is not None and now >= room.next_gravity_ms:
                 changed, old_ms, new_ms = room.update_gravity(elapsed_sec)
+                interval_sec = max(1, int(room.gravity_cfg["intervalSec"]))
+                room.next_gravity_ms = room.start_ms + (elapsed_sec // interval_sec + 1) * interval_sec * 1000
+                if room.drop_ms <= int(room.gravity_cfg["minDropMs"]):
+                    room.next_gravity_ms = None
                 if changed:
                     room.last_gravity_update_ms = now
-                    print(f"[GameServer] Gravity update: {old_ms}ms -> {new_ms}ms (elapsed: {elapsed_sec}s)")
+                    room.recorder.drop_change(now, room.tick, new_ms)
+                    log.info("Gravity update", old_ms=old_ms, new_ms=new_ms, elapsed_sec=elapsed_sec)
                     all_conns = [c for c in room.conns.values() if c is not None] + room.spectators
                     await broadcast(all_conns, {
                         "type":"GRAVITY_UPDATE",
@@ -403,13 +554,36 @@ async def game_loop(room: GameRoom):
                         "reason":f"Time {elapsed_sec}s",
                         "at":now
                     })
-        elif room.gravity_mode == "level":
+
+        # 輸入一到就處理（不再每 tick 最多 8 個）
+        for role in ["P1","P2"]:
+            eng = room.engine[role]
+            q = room.input_queues[role]
+            while not q.empty():
+                seq, act = q.get_nowait()
+                eng.apply_action(act)
+                room.recorder.action(now, room.tick, role, act)
+                room.acked_seq[role] = seq
+                dirty = True
+
+        # 重力：每位玩家各自的 deadline
+        for role in ["P1","P2"]:
+            due = room.last_drop_ms[role] + room.drop_ms
+            if now >= due:
+                # 落後不到一格就對齊 deadline（不累積誤差），落後太多就從現在重新起算
+                room.last_drop_ms[role] = due if now - due < room.drop_ms else now
+                room.engine[role].soft_drop()
+                room.recorder.gravity_drop(now, room.tick, role)
+                dirty = True
+
+        if room.gravity_mode == "level":
             current_total_lines = room.engine["P1"].lines + room.engine["P2"].lines
             if current_total_lines != last_total_lines:
                 last_total_lines = current_total_lines
                 changed, old_ms, new_ms = room.update_gravity(elapsed_sec)
                 if changed:
-                    print(f"[GameServer] Level update: {old_ms}ms -> {new_ms}ms (total lines: {current_total_lines})")
+                    room.recorder.drop_change(now, room.tick, new_ms)
+                    log.info("Level update", old_ms=old_ms, new_ms=new_ms, total_lines=current_total_lines)
                     all_conns = [c for c in room.conns.values() if c is not None] + room.spectators
                     await broadcast(all_conns, {
                         "type":"GRAVITY_UPDATE",
@@ -418,74 +592,31 @@ async def game_loop(room: GameRoom):
                         "at":now
                     })
 
-        for role in ["P1","P2"]:
-            eng = room.engine[role]
-            for _ in range(8):
-                if room.input_queues[role].empty(): 
-                    break
-                act = await room.input_queues[role].get()
-                if act == "LEFT":
-                    eng.move(-1, 0)
-                elif act == "RIGHT":
-                    eng.move(1, 0)
-                elif act == "CW":
-                    eng.rotate(+1)
-                elif act == "CCW":
-                    eng.rotate(-1)
-                elif act == "SOFT":
-                    eng.soft_drop()
-                elif act == "HARD":
-                    eng.hard_drop()
-                elif act == "HOLD":
-                    eng.hold_swap()
-
-        for role in ["P1","P2"]:
-            eng = room.engine[role]
-            if now - room.last_drop_ms[role] >= room.drop_ms:
-                room.last_drop_ms[role] = now
-                eng.soft_drop()
-
         if room.any_topout():
             room.done = True
 
-        if now - room.last_snapshot_ms >= SNAPSHOT_MS:
-            room.last_snapshot_ms = now
-            snap = {
-                "type":"SNAPSHOT",
-                "at":now,
-                "remainMs":max(0, room.duration_sec*1000 - (now-room.start_ms)),
-                "currentDropMs":room.drop_ms,
-                "players":[]
-            }
-            for role in ["P1","P2"]:
-                eng = room.engine[role]
-                conn = room.conns.get(role)
-                player_name = conn.name if conn else f"Player{role[-1]}"
-                s = eng.snapshot()
-                board = [row[:] for row in s.board]
-                if eng.active is not None:
-                    for (cx, cy) in eng._cells(eng.active):
-                        if 0 <= cy < 20 and 0 <= cx < 10:
-                            board[cy][cx] = PID[eng.active.shape]
-                snap["players"].append({
-                    "role": role,
-                    "name": player_name,
-                    "board": board,
-                    "active": s.active,
-                    "hold": s.hold,
-                    "next": s.nextq,
-                    "score": s.score,
-                    "lines": s.lines,
-                    "level": s.level,
-                    "blocksCleared": s.blocks_cleared,
-                })
-            all_conns = [c for c in room.conns.values() if c is not None] + room.spectators
-            await broadcast(all_conns, snap)
+        # 新加入 / 要求重同步的連線也要盡快拿到 keyframe
+        if any(c.need_keyframe for c in list(room.conns.values()) + room.spectators if c is not None):
+            dirty = True
 
-        await asyncio.sleep(TICK_MS/1000.0)
+        # 狀態推送：有變動就推（限流 PUSH_MIN_MS），沒變動只送 heartbeat
+        since_push = now - room.last_snapshot_ms
+        if (dirty and since_push >= PUSH_MIN_MS) or since_push >= HEARTBEAT_MS or room.done:
+            await push_state(room, now)
+            dirty = False
+
+        if room.done:
+            break
+
+        # 睡到下一個 deadline，或被新的輸入 / 連線變動叫醒
+        timeout = max(0, next_deadline_ms(room, dirty) - int(time.time()*1000)) / 1000.0
+        try:
+            await asyncio.wait_for(room.wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
 
     # 🔧 遊戲結束：立即停止接受新連接
-    print(f"[GameServer] ⚠ Game ended - STOPPING new connections")
+    log.info("Game ended - stopping new connections")
     room.accepting_connections = False
 
     # ✅ 統一走同一個出口（只廣播一次，只通知一次）
@@ -596,9 +727,11 @@ async def broadcast_game_end(room: GameRoom):
         "winDetail": win_detail
     }
     
+    save_replay(room, msg)
+
     # ✅ 廣播給所有還連線的人
     all_conns = [c for c in room.conns.values() if c is not None] + room.spectators
-    print(f"[GameServer] Broadcasting MATCH_END to {len(all_conns)} connections", flush=True)
+    log.info("Broadcasting MATCH_END", connections=len(all_conns))
     await broadcast(all_conns, msg)
     
     # 踢出觀戰者
@@ -614,21 +747,45 @@ async def broadcast_game_end(room: GameRoom):
             pass
     room.spectators.clear()
     
-    # ✅ 通知 Lobby 踢人並關房
-    notify_lobby_and_close(room)
+    # ✅ 通知 Lobby 踢人並關房（連同結果，讓 Lobby 記統計 / 排行榜）
+    notify_lobby_and_close(room, msg)
     
     # 給客戶端時間處理
     await asyncio.sleep(1.5)
 
 
-def notify_lobby_and_close(room):
-    """通知 Lobby 遊戲結束並踢出所有人"""
+def save_replay(room: GameRoom, end_msg: dict):
+    """
+    把這局的紀錄檔寫到 --replayDir（seed + 依序的操作，幾 KB）；沒設 --replayDir / REPLAY_DIR 就不錄。
+    資料夾裡只留最新的 --replayKeep 個
+    """
+    if not room.started or not getattr(ARGS, "replayDir", None):
+        return
+    players = {}
+    for role in ["P1", "P2"]:
+        c = room.conns.get(role)
+        players[role] = {"username": c.user_id if c else None, "name": c.name if c else role}
+    end = {k: end_msg.get(k) for k in ("reason", "winnerRole", "winDetail", "results")}
+    path = os.path.join(ARGS.replayDir, f"{ARGS.roomId}-{room.start_ms}{REPLAY_SUFFIX}")
+    try:
+        final = {role: final_state(room.engine[role]) for role in ["P1", "P2"]}
+        room.recorder.save(path, players, end, final)
+        log.info("Replay saved", path=path, events=len(room.recorder.events))
+        removed = prune_replays(ARGS.replayDir, ARGS.replayKeep)
+        if removed:
+            log.info("Old replays removed", count=removed)
+    except Exception as e:
+        log.warning("Failed to save replay", error=str(e))
+
+
+def notify_lobby_and_close(room, end_msg=None):
+    """通知 Lobby 遊戲結束並踢出所有人；end_msg 是 MATCH_END（有的話一起回報勝負與各玩家成績）"""
     try:
         lobby_host = get_lobby_connect_host() or getattr(ARGS, "lobbyHost", None)
         lobby_port = int(getattr(ARGS, "lobbyPort", 0) or os.getenv("LOBBY_PORT", "0"))
         
         if not lobby_host or not lobby_port:
-            print(f"[GameServer] No lobby info, skip notify", flush=True)
+            log.info("No lobby info, skip notify")
             return
         
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -649,23 +806,31 @@ def notify_lobby_and_close(room):
             "winnerUsername": (p1_conn.user_id if winner_role == "P1" and p1_conn else
                                p2_conn.user_id if winner_role == "P2" and p2_conn else None),
         }
+        if end_msg:
+            payload["reason"] = end_msg.get("reason") or payload["reason"]
+            payload["winnerRole"] = end_msg.get("winnerRole")
+            payload["winnerUsername"] = end_msg.get("winnerUsername")
+            payload["results"] = [
+                {k: r.get(k) for k in ("username", "score", "lines", "maxCombo")}
+                for r in end_msg.get("results", [])
+            ]
         
-        msg = json.dumps(payload, ensure_ascii=False) + "\n"
+        msg = json.dumps(room_ticket.sign_callback(payload), ensure_ascii=False) + "\n"
         sock.sendall(msg.encode("utf-8"))
-        print(f"[GameServer] ✓ Notified lobby (kick_all=True)", flush=True)
+        log.info("Notified lobby", kick_all=True)
         
         try:
             resp_data = sock.recv(4096).decode("utf-8").strip()
             if resp_data:
                 resp = json.loads(resp_data)
-                print(f"[GameServer] Lobby response: {resp}", flush=True)
+                log.debug("Lobby response", resp=resp)
         except:
             pass
         
         sock.close()
         
     except Exception as e:
-        print(f"[GameServer] Failed to notify lobby: {e}", flush=True)
+        log.warning("Failed to notify lobby", error=str(e))
         
 async def main():
     ap = argparse.ArgumentParser()
@@ -693,6 +858,9 @@ async def main():
     ap.add_argument("--seed", type=int, default=None)
     ap.add_argument("--gravityMode", default="progressive")
     ap.add_argument("--gravityConfig", default=None)
+    # 錄影要明確開啟（lobby 會把資料夾指到 server/data 底下），不寫進遊戲自己的資料夾
+    ap.add_argument("--replayDir", default=os.getenv("REPLAY_DIR") or None)
+    ap.add_argument("--replayKeep", type=int, default=int(os.getenv("REPLAY_KEEP", "200")))
     args = ap.parse_args()
 
     global ARGS
@@ -700,7 +868,7 @@ async def main():
     
     # 🔧 驗證 port
     if args.port == 0:
-        print("[GameServer] Error: No port specified (use --port or GAME_PORT env)", flush=True)
+        log.error("No port specified (use --port or GAME_PORT env)")
         sys.exit(1)
     
     gravity_config = None
@@ -729,7 +897,7 @@ async def main():
 
     try:
         server = await asyncio.start_server(_handle, host="0.0.0.0", port=args.port)
-        print(f"[GameServer] Listening @ {args.port}  seed={room.seed}  dropMs={room.drop_ms}  duration={room.duration_sec}s")
+        log.info("Listening", port=args.port, seed=room.seed, drop_ms=room.drop_ms, duration_sec=room.duration_sec)
         
         # 並行運行伺服器和遊戲循環
         async with server:
@@ -740,7 +908,7 @@ async def main():
             await loop_task
             
             # 遊戲結束後立即關閉伺服器
-            print("[GameServer] ⚠ Closing server socket...")
+            log.info("Closing server socket")
             server.close()
             await server.wait_closed()
             
@@ -751,9 +919,9 @@ async def main():
             except asyncio.CancelledError:
                 pass
             
-            print("[GameServer] ✓ Server closed")
+            log.info("Server closed")
             await asyncio.sleep(2.0)
-            print("[GameServer] Closing remaining connections...")
+            log.info("Closing remaining connections")
             for role, conn in room.conns.items():
                 if conn:
                     try:
@@ -761,12 +929,10 @@ async def main():
                         await conn.writer.wait_closed()
                     except:
                         pass
-            print("[GameServer] ✓✓✓ Shutdown complete, exiting...")
+            log.info("Shutdown complete, exiting")
     
     except Exception as e:
-        print(f"[GameServer] Fatal error: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception("Fatal error", error=str(e))
     
     finally:
         if server:
@@ -775,14 +941,14 @@ async def main():
                 await server.wait_closed()
             except:
                 pass
-        print("[GameServer] Process terminating...")
+        log.info("Process terminating")
         sys.exit(0)
 
 if __name__ == "__main__":
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
-        print("\n[GameServer] Interrupted")
+        log.info("Interrupted")
     finally:
-        print("[GameServer] Bye")
+        log.info("Bye")
         sys.exit(0)
\ No newline at end of file
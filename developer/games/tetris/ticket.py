@@ -0,0 +1,57 @@
+# developer\games\tetris\ticket.py
+# 房間票驗證（與 server/common/auth.py 的 verify_ticket 相同格式；
+# 上傳的遊戲套件不能 import server 端的 common，所以放一份在這裡）
+#
+#   ticket = <payload>.<簽章>（base64url），payload = {"u": user, "r": role, "room": 房號, "exp": ...}
+#   簽章 = HMAC-SHA256(ROOM_KEY, payload)；ROOM_KEY 由 lobby 啟動遊戲 server 時放進環境變數
+#
+# 沒有 ROOM_KEY（直接手動跑 server、bench、replay）時 enabled() 為 False，HELLO 不檢查票
+#
+# 回呼 lobby（game_finished）時用 sign_callback 簽整個 payload（與 auth.callback_signature 相同算法）
+import base64, hashlib, hmac, json, os, time
+
+ROOM_KEY = os.getenv("ROOM_KEY") or None
+ROOM_ID = os.getenv("ROOM_ID") or None
+
+
+def enabled() -> bool:
+    return ROOM_KEY is not None
+
+
+def _b64d(s: str) -> bytes:
+    return base64.urlsafe_b64decode(s + "=" * (-len(s) % 4))
+
+
+def verify(ticket, key: str = None, room_id: str = None):
+    """合法就回傳 {"user", "role", "room", "exp"}，否則 None"""
+    key = key or ROOM_KEY
+    room_id = room_id or ROOM_ID
+    if not key or not isinstance(ticket, str) or ticket.count(".") != 1:
+        return None
+    payload, sig = ticket.split(".")
+    want = hmac.new(key.encode("ascii"), payload.encode("ascii", "replace"), hashlib.sha256).digest()
+    try:
+        if not hmac.compare_digest(want, _b64d(sig)):
+            return None
+        claims = json.loads(_b64d(payload))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(claims, dict) or "room" not in claims:
+        return None
+    if claims.get("exp") is not None and claims["exp"] <= time.time():
+        return None
+    if room_id is not None and claims["room"] != room_id:
+        return None
+    return {"user": claims.get("u"), "role": claims.get("r"), "room": claims["room"], "exp": claims.get("exp")}
+
+
+def sign_callback(payload: dict, key: str = None) -> dict:
+    """加上 ts 與 sig（HMAC-SHA256(ROOM_KEY, 排序好的 JSON)）；沒有 ROOM_KEY 就原樣回傳"""
+    key = key or ROOM_KEY
+    if not key:
+        return payload
+    body = {k: v for k, v in payload.items() if k != "sig"}
+    body["ts"] = int(time.time())
+    raw = json.dumps(body, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    body["sig"] = hmac.new(key.encode("ascii"), raw, hashlib.sha256).hexdigest()
+    return body
@@ -1,5 +1,5 @@
 # sample_games/rps3/start_server.py - 完整版本
-import os, socket, threading, json, time
+import os, socket, threading, json, time, hmac, hashlib
 
 HOST = os.getenv("GAME_HOST", "127.0.0.1")
 PORT = int(os.getenv("GAME_PORT", "0"))
@@ -298,6 +298,19 @@ def get_lobby_connect_host():
         return "127.0.0.1"
     return lobby_host
 
+def sign_callback(payload: dict) -> dict:
+    """
+    回呼 lobby 的 payload 加上 ts 與 sig（HMAC-SHA256(ROOM_KEY, 排序好的 JSON)），
+    lobby 靠它確認真的是這個房間的遊戲 server 送的；沒有 ROOM_KEY 就原樣送
+    """
+    key = os.getenv("ROOM_KEY")
+    if not key:
+        return payload
+    body = dict(payload, ts=int(time.time()))
+    raw = json.dumps(body, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    body["sig"] = hmac.new(key.encode("ascii"), raw, hashlib.sha256).hexdigest()
+    return body
+
 def notify_lobby_game_finished_kick_all():
     lobby_host = get_lobby_connect_host()
     lobby_port = os.getenv("LOBBY_PORT")
@@ -308,11 +321,11 @@ def notify_lobby_game_finished_kick_all():
     
     try:
         with socket.create_connection((lobby_host, int(lobby_port)), timeout=2) as s:
-            s.sendall((json.dumps({
+            s.sendall((json.dumps(sign_callback({
                 "kind": "game_finished",
                 "room_id": room_id,
                 "kick_all": True
-            }) + "\n").encode("utf-8"))
+            })) + "\n").encode("utf-8"))
             try:
                 s.recv(4096)
             except Exception:
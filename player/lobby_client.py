@@ -1,6 +1,6 @@
 # player/lobby_client.py - 最終交作業版（自動判斷連線目標 + SSE 房間 UI + 未登入自動回登入）
 
-import os, sys, json, asyncio, base64, zipfile, io, shutil, subprocess, socket, signal
+import os, sys, json, asyncio, base64, zipfile, io, shutil, subprocess, socket, signal, threading, time
 from pathlib import Path
 
 ROOT = Path(__file__).resolve().parents[1]
@@ -129,6 +129,286 @@ def get_local_client_dir(player, game, version):
         return base
     return None
 
+# ----------------- 背景預先下載 ----------------- #
+# 登入後開一條背景 thread 定期看 list_games：已安裝 / 最近玩過的遊戲一出新版就先下載好
+# （限速、一次一個），建房 / 加入 / 配對時就不用等下載。
+# 安裝一律先解壓到 <遊戲>/.tmp-* 再 rename 成 <遊戲>/<版本>，不會留下解到一半的版本。
+# 背景 / 進房時的下載只「加」新版本：正在執行的版本、上次玩的版本都不刪；
+# 只有在商城手動下載時才清掉其他舊版本（正在執行的照樣保留）。
+# 環境變數 PREFETCH_INTERVAL（秒，預設 60，0 = 關閉背景下載）、PREFETCH_KBPS（KB/s，預設 512，0 = 不限速）
+PREFETCH_INTERVAL = float(os.getenv("PREFETCH_INTERVAL", "60"))
+PREFETCH_KBPS = float(os.getenv("PREFETCH_KBPS", "512"))
+PREFETCH_MIN_KBPS = 16   # 限速的下限：lobby 送回應時要求對方至少 8 KB/s（common/dispatch.py WRITE_MIN_RATE）
+RECENT_DAYS = 30
+RECENT_FILE = "recent.json"   # downloads/<玩家>/recent.json：{遊戲: {"ts": 最後一次啟動的時間, "version": 版本}}
+
+_running = []                 # [(遊戲, 版本, Popen)]：這個 client 開起來的遊戲，清舊版本時跳過
+_running_lock = threading.Lock()
+
+def _load_recent(player) -> dict:
+    try:
+        recent = json.loads((DOWNLOADS_ROOT / player / RECENT_FILE).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    # 舊格式 {遊戲: 時間}
+    return {g: (v if isinstance(v, dict) else {"ts": v}) for g, v in recent.items()}
+
+def mark_played(player, game, version):
+    recent = _load_recent(player)
+    recent[game] = {"ts": int(time.time()), "version": version}
+    path = DOWNLOADS_ROOT / player / RECENT_FILE
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{RECENT_FILE}.tmp")
+    tmp.write_text(json.dumps(recent, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, path)
+
+def installed_versions(player, game) -> list:
+    base = DOWNLOADS_ROOT / player / game
+    if not base.is_dir():
+        return []
+    return [d.name for d in base.iterdir() if d.is_dir() and not d.name.startswith(".")]
+
+def running_versions(game) -> set:
+    with _running_lock:
+        _running[:] = [r for r in _running if r[2].poll() is None]
+        return {v for g, v, _ in _running if g == game}
+
+def prune_versions(player, game, keep: set):
+    """刪掉 keep 以外的版本（正在執行的版本一律保留）"""
+    base = DOWNLOADS_ROOT / player / game
+    keep = set(keep) | running_versions(game)
+    for sub in base.iterdir():
+        if sub.is_dir() and sub.name not in keep and not sub.name.startswith(".tmp-"):
+            shutil.rmtree(sub, ignore_errors=True)
+
+def install_package(player, game, version, data: bytes, prune_all: bool = False) -> Path:
+    """
+    解壓到暫存資料夾再 rename 成 <版本>。
+    prune_all（商城手動下載）：其他舊版本全部清掉；否則保留上次玩的版本
+    """
+    base = DOWNLOADS_ROOT / player / game
+    base.mkdir(parents=True, exist_ok=True)
+    tmp = base / f".tmp-{version}-{os.getpid()}-{threading.get_ident()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    try:
+        safe_extract_zip(data, tmp)
+    except Exception:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+    dest = base / version
+    if dest.exists():
+        # 同一版重新下載：舊的先移開（rename 不能蓋掉非空資料夾）
+        os.replace(dest, base / f".old-{version}-{os.getpid()}-{threading.get_ident()}")
+    os.replace(tmp, dest)
+
+    keep = {version}
+    if not prune_all:
+        last = _load_recent(player).get(game, {}).get("version")
+        if last:
+            keep.add(last)
+    prune_versions(player, game, keep)
+    return dest
+
+def download_package(token, name, kbps=lambda: 0) -> dict:
+    """
+    download_game（整包 base64 在同一行回應裡）；kbps() > 0 時照這個速度讀，
+    讀得慢 TCP 視窗就會把伺服器端的送出速度一起壓下來。每讀一塊都重新看 kbps()，中途可以改成不限速
+    """
+    try:
+        s = socket.create_connection((LOBBY_HOST, LOBBY_PORT), timeout=30)
+    except OSError as e:
+        return {"ok": False, "error": f"無法連線到大廳伺服器：{e}"}
+    try:
+        s.sendall((json.dumps({"kind": "download_game", "token": token, "name": name},
+                              ensure_ascii=False) + "\n").encode("utf-8"))
+        buf = bytearray()
+        started = time.monotonic()
+        while not buf.endswith(b"\n"):
+            chunk = s.recv(64 * 1024)
+            if not chunk:
+                break
+            buf += chunk
+            while True:
+                rate = kbps()
+                if rate > 0:
+                    rate = max(rate, PREFETCH_MIN_KBPS)
+                ahead = len(buf) / (rate * 1024) - (time.monotonic() - started) if rate > 0 else 0
+                if ahead <= 0:
+                    break
+                time.sleep(min(ahead, 0.2))
+        return json.loads(buf.decode("utf-8"))
+    except (OSError, ValueError) as e:
+        return {"ok": False, "error": f"下載失敗：{e}"}
+    finally:
+        s.close()
+
+class Prefetcher:
+    def __init__(self, token, player):
+        self.token = token
+        self.player = player
+        self.latest = {}            # 遊戲 -> 伺服器上的最新版本（最近一次 list_games 看到的）
+        self.notes = []             # 背景更新好的版本，主選單顯示一次
+        self._locks = {}            # 遊戲 -> 下載 / 安裝鎖（背景跟前景不會同時裝同一個遊戲）
+        self._urgent = set()        # 前景正在等的遊戲：背景下載到一半也改成不限速
+        self._mu = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if PREFETCH_INTERVAL <= 0:
+            return
+        self._thread = threading.Thread(target=self._loop, name="prefetch", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def observe(self, games: dict):
+        """前景剛拿到 list_games 的結果：順便交給背景看有沒有新版本"""
+        with self._mu:
+            self.latest = {name: info.get("latest") for name, info in (games or {}).items()}
+        self._wake.set()
+
+    def pop_notes(self) -> list:
+        with self._mu:
+            notes, self.notes = self.notes, []
+        return notes
+
+    def wanted(self) -> list:
+        """已安裝（但不是最新版）或最近 RECENT_DAYS 天玩過、本機還沒有最新版的遊戲"""
+        recent = _load_recent(self.player)
+        cutoff = time.time() - RECENT_DAYS * 86400
+        with self._mu:
+            latest = dict(self.latest)
+        return [(g, v) for g, v in sorted(latest.items())
+                if v and not has_local_game_version(self.player, g, v)
+                and (installed_versions(self.player, g) or recent.get(g, {}).get("ts", 0) >= cutoff)]
+
+    def ensure(self, game, version=None, background=False, prune_all=False):
+        """
+        確保本機有 game 的 version（None = 伺服器最新版），沒有就下載安裝。
+        回傳 (安裝好的版本, 錯誤訊息)；前景呼叫不限速，背景呼叫照 PREFETCH_KBPS。
+        prune_all 只給商城手動下載用（見 install_package）
+        """
+        with self._mu:
+            lock = self._locks.setdefault(game, threading.Lock())
+            if not background:
+                self._urgent.add(game)
+        try:
+            with lock:
+                if version and has_local_game_version(self.player, game, version):
+                    return version, None
+                if background and self._stop.is_set():
+                    return None, "已停止"
+                resp = download_package(
+                    self.token, game,
+                    kbps=lambda: 0 if game in self._urgent else PREFETCH_KBPS)
+                if not resp.get("ok"):
+                    if is_not_logged_in(resp) and not background:
+                        raise AuthExpired()
+                    return None, resp.get("error") or "無法下載"
+                data = base64.b64decode(resp["zip_b64"].encode("utf-8"))
+                install_package(self.player, game, resp["version"], data, prune_all=prune_all)
+                return resp["version"], None
+        finally:
+            if not background:
+                with self._mu:
+                    self._urgent.discard(game)
+
+    def _loop(self):
+        refresh = True
+        while not self._stop.is_set():
+            try:
+                if refresh:
+                    resp = send_req_sync({"kind": "list_games", "token": self.token})
+                    if is_not_logged_in(resp):
+                        return
+                    if resp.get("ok"):
+                        with self._mu:
+                            self.latest = {n: i.get("latest") for n, i in resp.get("games", {}).items()}
+                for game, version in self.wanted():
+                    if self._stop.is_set():
+                        return
+                    got, err = self.ensure(game, version, background=True)
+                    if got and err is None:
+                        with self._mu:
+                            self.notes.append(f"{game}@{got}")
+            except Exception:
+                pass  # 背景更新失敗不影響前景，下一輪再試
+            self._wake.clear()
+            # 被 observe 叫醒時已經有新的列表，不用再問一次
+            refresh = not self._wake.wait(PREFETCH_INTERVAL)
+
+PREFETCH = None  # 登入後建立，登出時停掉
+
+def ensure_local_version(player, game, version) -> bool:
+    """建房 / 加入 / 配對前呼叫：本機沒有這個版本就直接下載（背景正在下載就改成不限速並等它）"""
+    if has_local_game_version(player, game, version):
+        return True
+    if PREFETCH is None:
+        return False
+    print(f"⬇ 本機還沒有 {game}@{version}，正在下載...")
+    got, err = PREFETCH.ensure(game, version)
+    if err:
+        print(f"✗ 無法下載：{err}")
+        return False
+    if not has_local_game_version(player, game, version):
+        print(f"✗ 伺服器目前提供的版本是 {got}，與房間的 {version} 不同")
+        return False
+    print(f"✓ 已下載 {game}@{version}")
+    return True
+
+def launch_game_client(player, room_id, game, version, host, port, ticket=None) -> bool:
+    """
+    用本機已下載的遊戲 client 連到 host:port（玩家連遊戲伺服器，觀戰者連轉播）
+    ticket：lobby 發的房間票，遊戲 client 在 HELLO 帶上，遊戲 server 才認得這個玩家
+    """
+    client_dir = get_local_client_dir(player, game, version)
+    if client_dir is None:
+        return False
+    manifest = json.load(open(client_dir / "manifest.json", "r", encoding="utf-8"))
+    entry = manifest.get("entry_client", "start_client.py")
+
+    env = os.environ.copy()
+    env.update({
+        "GAME_HOST": host,
+        "GAME_PORT": str(port),
+        "ROOM_ID": room_id,
+        "GAME_NAME": game,
+        "GAME_VERSION": version,
+        "PLAYER_USERNAME": player,
+        "PLAYER_NAME": player,
+        "ROOM_TICKET": ticket or "",
+    })
+
+    print(f"\n🎮 正在啟動遊戲客戶端：{entry}")
+    try:
+        mark_played(player, game, version)
+    except OSError:
+        pass
+
+    if os.name == "nt":
+        print("【注意】遊戲將在新視窗中執行")
+        proc = subprocess.Popen(
+            [sys.executable, entry],
+            cwd=str(client_dir),
+            env=env,
+            creationflags=subprocess.CREATE_NEW_CONSOLE
+        )
+    else:
+        print("【注意】遊戲將在當前終端執行")
+        proc = subprocess.Popen(
+            [sys.executable, entry],
+            cwd=str(client_dir),
+            env=env
+        )
+    with _running_lock:
+        _running.append((game, version, proc))
+    return True
+
 def clear_screen():
     os.system("cls" if os.name == "nt" else "clear")
 
@@ -166,6 +446,16 @@ async def send_req(payload):
     except Exception as e:
         return {"ok": False, "error": f"連線錯誤：{e}"}
 
+def send_req_sync(payload, timeout=10):
+    """同 send_req，給背景 thread 用（不經過 event loop）"""
+    try:
+        with socket.create_connection((LOBBY_HOST, LOBBY_PORT), timeout=timeout) as s:
+            s.sendall((json.dumps(payload, ensure_ascii=False) + "\n").encode("utf-8"))
+            with s.makefile("rb") as f:
+                return json.loads(f.readline().decode("utf-8"))
+    except (OSError, ValueError) as e:
+        return {"ok": False, "error": f"連線錯誤：{e}"}
+
 async def send_req_auth(payload):
     resp = await send_req(payload)
     if is_not_logged_in(resp):
@@ -176,6 +466,8 @@ async def fetch_playable_games(token):
     resp = await send_req_auth({"kind":"list_games","token":token})
     if not resp.get("ok"):
         print(resp); return {}
+    if PREFETCH is not None:
+        PREFETCH.observe(resp.get("games", {}))
     return resp.get("games", {})
 
 def print_game_menu(games: dict):
@@ -201,6 +493,115 @@ async def fetch_rooms(token):
         print(resp); return {}
     return resp.get("rooms", {})
 
+REVIEW_SORTS = {"1": ("recent", "最新"), "2": ("rating_desc", "高分優先"), "3": ("rating_asc", "低分優先")}
+
+async def browse_reviews(token, name):
+    """分頁瀏覽評論（list_reviews），每頁 10 則"""
+    sort, label = REVIEW_SORTS["1"]
+    offset = 0
+    while True:
+        resp = await send_req_auth({"kind": "list_reviews", "token": token, "name": name,
+                                    "sort": sort, "offset": offset, "limit": 10})
+        if not resp.get("ok"):
+            print(resp.get("error")); return
+        total = resp.get("total", 0)
+        page = resp.get("reviews", [])
+        print(f"\n--- 評論（{label}）{offset + 1 if page else 0}-{offset + len(page)} / 共 {total} 則 ---")
+        for rv in page:
+            print(f"- {rv.get('user')}：{rv.get('rating', '?')} 分")
+            text = (rv.get("text") or "").strip()
+            if text:
+                print(f"  {text}")
+
+        nxt = resp.get("next_offset")
+        opts = "n) 下一頁  " if nxt is not None else ""
+        opts += "p) 上一頁  " if offset > 0 else ""
+        c = input(f"{opts}1) 最新 2) 高分優先 3) 低分優先  Enter) 返回：").strip().lower()
+        if c == "n" and nxt is not None:
+            offset = nxt
+        elif c == "p" and offset > 0:
+            offset = max(0, offset - 10)
+        elif c in REVIEW_SORTS:
+            sort, label = REVIEW_SORTS[c]
+            offset = 0
+        else:
+            return
+
+async def search_games_menu(token):
+    """關鍵字 + 條件搜尋（search_games），每頁 10 筆"""
+    query = input("關鍵字（名稱 / 作者 / 描述，可留空）：").strip()
+    req = {"kind": "search_games", "token": token, "query": query, "limit": 10, "facets": True}
+    t = input("類型 CLI / GUI（留空不限）：").strip().upper()
+    if t:
+        req["type"] = t
+    p = input("遊玩人數（留空不限）：").strip()
+    if p.isdigit():
+        req["max_players"] = int(p)
+    r = input("最低平均評分 0~5（留空不限）：").strip()
+    try:
+        if r:
+            req["min_rating"] = float(r)
+    except ValueError:
+        print("評分格式錯誤，忽略此條件")
+
+    offset = 0
+    while True:
+        resp = await send_req_auth({**req, "offset": offset})
+        if not resp.get("ok"):
+            print(resp.get("error")); return
+        games = resp.get("games", [])
+        total = resp.get("total", 0)
+        print(f"\n# 搜尋結果 {offset + 1 if games else 0}-{offset + len(games)} / 共 {total} 筆")
+        for g in games:
+            avg, cnt = g.get("avg_rating"), g.get("review_count", 0)
+            rating_str = f"{avg} 分／{cnt} 則" if (avg is not None and cnt > 0) else "尚無評分"
+            print(f"- {g.get('display_name')} ({g['name']})  作者: {g.get('author')}  "
+                  f"[{g.get('type')}, {g.get('max_players')}人]  最新版: {g.get('latest')}  評分: {rating_str}")
+        facets = resp.get("facets")
+        if facets and offset == 0 and total:
+            print("  類型：" + "、".join(f"{k} {v}" for k, v in facets.get("type", {}).items()))
+            print("  人數：" + "、".join(f"{k}人 {v}" for k, v in sorted(facets.get("max_players", {}).items())))
+        nxt = resp.get("next_offset")
+        if nxt is None or input("n) 下一頁  Enter) 結束：").strip().lower() != "n":
+            return
+        offset = nxt
+
+STAT_LABELS = {"played": "開局", "finished": "完成", "wins": "勝", "losses": "敗", "draws": "和",
+               "best_score": "最高分", "total_lines": "總消行", "best_combo": "最高連擊"}
+BOARD_METRICS = {"1": "wins", "2": "best_score", "3": "total_lines", "4": "best_combo", "5": "played"}
+
+async def show_my_stats(token):
+    resp = await send_req_auth({"kind": "player_stats", "token": token})
+    if not resp.get("ok"):
+        print(resp.get("error")); return
+    games = resp.get("games", {})
+    if not games:
+        print("還沒有任何對局紀錄。"); return
+    print(f"\n# {resp.get('user')} 的對局統計")
+    for name, c in sorted(games.items()):
+        print(f"- {name}：" + "  ".join(f"{label} {c.get(k, 0)}" for k, label in STAT_LABELS.items()))
+
+async def show_leaderboard(token):
+    games = await fetch_playable_games(token)
+    items = print_game_menu(games)
+    if not items:
+        return
+    idx = ask_choice("請選擇遊戲編號：", set(str(i) for i in range(1, len(items) + 1)))
+    name, _ = items[int(idx) - 1]
+    print("指標：" + "  ".join(f"{k}) {STAT_LABELS[m]}" for k, m in BOARD_METRICS.items()))
+    metric = BOARD_METRICS[ask_choice("選擇 (1-5): ", set(BOARD_METRICS))]
+    resp = await send_req_auth({"kind": "leaderboard", "token": token, "name": name, "metric": metric, "limit": 10})
+    if not resp.get("ok"):
+        print(resp.get("error")); return
+    print(f"\n# {name} 排行榜（{STAT_LABELS[metric]}，共 {resp.get('total', 0)} 人上榜）")
+    for row in resp.get("top", []):
+        print(f"{row['rank']:>3}. {row['user']:<16} {row['value']}")
+    me = resp.get("me") or {}
+    if me.get("rank"):
+        print(f"你的名次：第 {me['rank']} 名（{me['value']}）")
+    else:
+        print("你還沒上榜。")
+
 def print_room_menu(rooms: dict):
     if not rooms:
         print("【目前沒有房間】")
@@ -220,6 +621,78 @@ def print_room_menu(rooms: dict):
         print(f"     已就緒: {', '.join(ready_players) if ready_players else '無'}")
     return items
 
+# ----------------- 快速配對 ----------------- #
+
+async def quick_match(token, player):
+    """
+    排進 (遊戲, 最新版) 的配對隊伍：lobby 湊滿人數就直接開房，房間資訊從同一條連線推回來。
+    回傳 match_found 事件（配對成功）或 None（失敗時已經等使用者按過 Enter）
+    """
+    games = await fetch_playable_games(token)
+    items = print_game_menu(games)
+    if not items:
+        input("\n(按 Enter 繼續) ")
+        return None
+    idx = ask_choice("請輸入欲配對的遊戲編號：", set(str(i) for i in range(1, len(items) + 1)))
+    name, info = items[int(idx) - 1]
+
+    latest_ver = info.get("latest")
+    if not latest_ver or not ensure_local_version(player, name, latest_ver):
+        print("❌ 你目前尚未下載這款遊戲的最新版。")
+        print("   請先到『商城』→『下載 / 更新遊戲』下載後，再開始配對。")
+        input("\n(按 Enter 繼續) ")
+        return None
+
+    try:
+        reader, writer = await asyncio.open_connection(LOBBY_HOST, LOBBY_PORT)
+    except OSError as e:
+        print(f"✗ 無法連線到大廳伺服器：{e}")
+        input("\n(按 Enter 繼續) ")
+        return None
+    try:
+        line = json.dumps({"kind": "queue_for_match", "token": token, "game": name, "version": latest_ver}) + "\n"
+        writer.write(line.encode("utf-8"))
+        await writer.drain()
+
+        resp = json.loads((await reader.readline()).decode("utf-8") or "{}")
+        if is_not_logged_in(resp):
+            raise AuthExpired()
+        if not resp.get("ok"):
+            print(f"✗ {resp.get('error')}")
+            input("\n(按 Enter 繼續) ")
+            return None
+
+        print(f"⏳ 配對中：{name}@{resp.get('version')}（{resp.get('group_size')} 人一局，"
+              f"目前排第 {resp.get('position') or '-'} 位）")
+        print("   按 Enter 取消配對")
+
+        # 等配對結果的同時等 Enter；配對先到的話，這個 Enter 就當作「進入房間」
+        loop = asyncio.get_event_loop()
+        key = loop.run_in_executor(None, input, "")
+        event = asyncio.ensure_future(reader.readline())
+        done, _ = await asyncio.wait({key, event}, return_when=asyncio.FIRST_COMPLETED)
+        if event not in done:
+            await send_req_auth({"kind": "leave_queue", "token": token})
+        data = await event
+    finally:
+        writer.close()
+
+    msg = json.loads(data.decode("utf-8")) if data else {"event": "match_failed", "error": "與大廳的連線中斷"}
+    if msg.get("event") != "match_found":
+        print(f"✗ {msg.get('error') or '已取消配對'}")
+        if key.done():
+            input("\n(按 Enter 繼續) ")
+        else:
+            print("\n(按 Enter 繼續) ", end="", flush=True)
+            await key
+        return None
+
+    print(f"✓ 配對成功：{msg['room_id']}（{', '.join(msg.get('players', []))}）")
+    if not key.done():
+        print("按 Enter 進入房間並啟動遊戲 ", end="", flush=True)
+        await key
+    return msg
+
 # ----------------- SSE 房間 UI（保持原邏輯，改用 send_req_auth） ----------------- #
 
 class AsyncRoomUI:
@@ -255,6 +728,8 @@ class AsyncRoomUI:
 
             if "room" in resp:
                 self.room_info = resp["room"]
+                # 快速配對的房間一進來就已經是 agreed（遊戲已啟動），不要再觸發一次自動開始
+                self.last_start_state = (self.room_info or {}).get("start", {}).get("state")
                 self.display()
 
             return True
@@ -311,43 +786,13 @@ class AsyncRoomUI:
 
         self.game_started = True
 
-        if not has_local_game_version(self.player, self.join_info["game"], self.join_info["version"]):
+        if not ensure_local_version(self.player, self.join_info["game"], self.join_info["version"]):
             print("❌ 請先去商城下載最新版遊戲")
             self.game_started = False
             return
 
-        client_dir = get_local_client_dir(self.player, self.join_info["game"], self.join_info["version"])
-        manifest = json.load(open(client_dir / "manifest.json", "r", encoding="utf-8"))
-        entry = manifest.get("entry_client", "start_client.py")
-
-        env = os.environ.copy()
-        env.update({
-            "GAME_HOST": self.join_info["host"],
-            "GAME_PORT": str(self.join_info["port"]),
-            "ROOM_ID": self.room_id,
-            "GAME_NAME": self.join_info["game"],
-            "GAME_VERSION": self.join_info["version"],
-            "PLAYER_USERNAME": self.player,
-            "PLAYER_NAME": self.player
-        })
-
-        print(f"\n🎮 正在啟動遊戲客戶端：{entry}")
-
-        if os.name == "nt":
-            print("【注意】遊戲將在新視窗中執行")
-            subprocess.Popen(
-                [sys.executable, entry],
-                cwd=str(client_dir),
-                env=env,
-                creationflags=subprocess.CREATE_NEW_CONSOLE
-            )
-        else:
-            print("【注意】遊戲將在當前終端執行")
-            subprocess.Popen(
-                [sys.executable, entry],
-                cwd=str(client_dir),
-                env=env
-            )
+        launch_game_client(self.player, self.room_id, self.join_info["game"], self.join_info["version"],
+                           self.join_info["host"], self.join_info["port"], self.join_info.get("ticket"))
 
         print("✓ 遊戲客戶端已啟動")
 
@@ -545,6 +990,7 @@ async def room_interface(token, player, room_id, join_info):
 # ----------------- 主流程 ----------------- #
 
 async def async_main():
+    global PREFETCH
     token = None
     player = None
 
@@ -586,14 +1032,20 @@ async def async_main():
             else:
                 return
 
+        # 背景預先下載：登入期間一直跑，登出 / 登入失效時停掉
+        PREFETCH = Prefetcher(token, player)
+        PREFETCH.start()
+
         # ---------- 主選單 ----------
         while token is not None:
             clear_screen()
             print("=== Lobby 主選單 ===")
             print(f"(Lobby Server: {LOBBY_HOST}:{LOBBY_PORT})")
+            for note in PREFETCH.pop_notes():
+                print(f"⬇ 背景已更新：{note}")
             print("1) 商城 → 瀏覽遊戲/詳細資訊/下載更新")
             print("2) 大廳 → 建立/查看/加入房間")
-            print("3) 我的紀錄 → 評分與評論")
+            print("3) 我的紀錄 → 評分與評論 / 對局統計 / 排行榜")
             print("4) 登出並返回登入選單")
             print("5) 離開")
             choice = ask_choice("請選擇 (1-5): ", set("12345"))
@@ -608,8 +1060,9 @@ async def async_main():
                         print("1) 瀏覽遊戲列表")
                         print("2) 查看遊戲詳細資訊")
                         print("3) 下載 / 更新遊戲")
-                        print("4) 返回")
-                        c2 = ask_choice("選擇 (1-4): ", set("1234"))
+                        print("4) 搜尋遊戲")
+                        print("5) 返回")
+                        c2 = ask_choice("選擇 (1-5): ", set("12345"))
 
                         if c2 == "1":
                             games = await fetch_playable_games(token)
@@ -641,14 +1094,24 @@ async def async_main():
                                 else:
                                     print("平均評分：尚無評論")
 
+                                hist = d.get("rating_histogram") or {}
+                                if cnt > 0 and hist:
+                                    for star in "54321":
+                                        n = hist.get(star, 0)
+                                        print(f"  {star} 分 {'█' * round(20 * n / cnt):<20} {n}")
+
+                                # 詳細資訊只帶最新幾則評論
                                 reviews = d.get("reviews", {})
                                 if reviews:
-                                    print("\n--- 評論列表 ---")
+                                    print("\n--- 最新評論 ---")
                                     for user, rv in reviews.items():
                                         print(f"- {user}：{rv.get('rating', '?')} 分")
                                         text = (rv.get("text") or "").strip()
                                         if text:
                                             print(f"  {text}")
+                                    if cnt > len(reviews):
+                                        if input(f"\n還有 {cnt - len(reviews)} 則評論，輸入 m 查看全部：").strip().lower() == "m":
+                                            await browse_reviews(token, name)
                                 else:
                                     print("\n目前還沒有任何評論。")
                             else:
@@ -667,34 +1130,21 @@ async def async_main():
                             name, info = items[int(idx)-1]
 
                             print(f"\n正在向伺服器請求 {name} 最新版本安裝包...")
-                            resp = await send_req_auth({
-                                "kind": "download_game",
-                                "token": token,
-                                "name": name
-                            })
-                            if not resp.get("ok"):
-                                print("✗ 無法下載：", resp.get("error"))
+                            version, err = PREFETCH.ensure(name, prune_all=True)
+                            if err:
+                                print("✗ 無法下載：", err)
                                 input("\n(按 Enter 繼續) ")
                                 continue
 
-                            version = resp["version"]
-                            zip_b64 = resp["zip_b64"]
-                            data = base64.b64decode(zip_b64.encode("utf-8"))
-
-                            base_dir = DOWNLOADS_ROOT / player / name
-                            if base_dir.exists():
-                                for sub in base_dir.iterdir():
-                                    if sub.is_dir():
-                                        shutil.rmtree(sub, ignore_errors=True)
-
-                            dest = base_dir / version
-                            dest.mkdir(parents=True, exist_ok=True)
-                            safe_extract_zip(data, dest)
-
+                            dest = DOWNLOADS_ROOT / player / name / version
                             print(f"✓ 已下載 {name}@{version} 到 {dest}")
                             print("  之前的舊版本已自動清除。")
                             input("\n(按 Enter 繼續) ")
 
+                        elif c2 == "4":
+                            await search_games_menu(token)
+                            input("\n(按 Enter 繼續) ")
+
                         else:
                             break
 
@@ -707,8 +1157,10 @@ async def async_main():
                         print("1) 建立房間")
                         print("2) 查看房間列表")
                         print("3) 加入房間（輸入房間 ID）")
-                        print("4) 返回")
-                        c2 = ask_choice("選擇 (1-4): ", set("1234"))
+                        print("4) 觀戰房間（輸入房間 ID）")
+                        print("5) 快速配對（自動湊人開房）")
+                        print("6) 返回")
+                        c2 = ask_choice("選擇 (1-6): ", set("123456"))
 
                         if c2 == "1":
                             games = await fetch_playable_games(token)
@@ -727,7 +1179,7 @@ async def async_main():
                                 input("\n(按 Enter 繼續) ")
                                 continue
 
-                            if not has_local_game_version(player, name, latest_ver):
+                            if not ensure_local_version(player, name, latest_ver):
                                 print("❌ 你目前尚未下載這款遊戲的最新版。")
                                 print("   請先到『商城』→『下載 / 更新遊戲』下載後，再建立房間。")
                                 input("\n(按 Enter 繼續) ")
@@ -788,7 +1240,7 @@ async def async_main():
                                 input("\n(按 Enter 繼續) ")
                                 continue
 
-                            if not has_local_game_version(player, game_name, latest_ver):
+                            if not ensure_local_version(player, game_name, latest_ver):
                                 print("❌ 你目前尚未下載此遊戲的最新版。")
                                 print("   請先到『商城』下載 / 更新遊戲。")
                                 input("\n(按 Enter 繼續) ")
@@ -804,13 +1256,65 @@ async def async_main():
                             await asyncio.sleep(1)
                             await room_interface(token, player, rid, join)
 
+                        elif c2 == "4":
+                            rooms = await fetch_rooms(token)
+                            items = print_room_menu(rooms)
+                            if not items:
+                                input("\n目前沒有房間可以觀戰。(按 Enter 繼續) ")
+                                continue
+
+                            print()
+                            rid = input("請輸入要觀戰的房間 ID（或 Enter 返回）：").strip()
+                            if not rid:
+                                continue
+
+                            spec = await send_req_auth({"kind": "spectate_room", "token": token, "room_id": rid})
+                            if not spec.get("ok"):
+                                print(f"✗ {spec.get('error')}")
+                                input("\n(按 Enter 繼續) ")
+                                continue
+
+                            if not ensure_local_version(player, spec["game"], spec["version"]):
+                                print("❌ 你目前尚未下載此房間使用的遊戲版本。")
+                                print("   請先到『商城』下載 / 更新遊戲。")
+                                input("\n(按 Enter 繼續) ")
+                                continue
+
+                            via = "觀戰轉播" if spec.get("via_relay") else "遊戲伺服器"
+                            print(f"🎥 透過{via}觀戰：{spec['host']}:{spec['port']}")
+                            launch_game_client(player, rid, spec["game"], spec["version"],
+                                               spec["host"], spec["port"], spec.get("ticket"))
+                            input("\n(按 Enter 返回大廳) ")
+
+                        elif c2 == "5":
+                            match = await quick_match(token, player)
+                            if match is None:
+                                continue
+                            launch_game_client(player, match["room_id"], match["game"], match["version"],
+                                               match["host"], match["port"], match.get("ticket"))
+                            await asyncio.sleep(1)
+                            await room_interface(token, player, match["room_id"], match)
+
                         else:
                             break
 
                 elif choice == "3":
                     clear_screen()
-                    print("=== 我的紀錄 → 評分與評論 ===")
+                    print("=== 我的紀錄 ===")
                     print(f"(Lobby Server: {LOBBY_HOST}:{LOBBY_PORT})")
+                    print("1) 評分與評論")
+                    print("2) 我的對局統計")
+                    print("3) 排行榜")
+                    c3 = ask_choice("選擇 (1-3): ", set("123"))
+
+                    if c3 == "2":
+                        await show_my_stats(token)
+                        input("\n(按 Enter 繼續) ")
+                        continue
+                    if c3 == "3":
+                        await show_leaderboard(token)
+                        input("\n(按 Enter 繼續) ")
+                        continue
 
                     games = await fetch_playable_games(token)
                     items = print_game_menu(games)
@@ -861,6 +1365,7 @@ async def async_main():
                             pass
                     token = None
                     player = None
+                    PREFETCH.stop()
                     print("已登出，返回登入選單。")
                     input("\n(按 Enter 繼續) ")
                     break
@@ -871,6 +1376,7 @@ async def async_main():
                             await send_req({"kind": "logout", "token": token})
                         except Exception:
                             pass
+                    PREFETCH.stop()
                     print("再見～")
                     return
 
@@ -878,6 +1384,7 @@ async def async_main():
                 print("\n⚠ 你的登入已失效或被登出，請重新登入。")
                 token = None
                 player = None
+                PREFETCH.stop()
                 input("(按 Enter 返回登入介面) ")
                 break
 
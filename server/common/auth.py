@@ -1,74 +1,405 @@
 # common/auth.py
-import uuid
-import time
+# 登入 session（token → user / role）：
+#   - 同一個 (role, user) 同時只能有一個 session：已登入時再登入會被拒絕（不踢掉舊的）
+#   - 閒置過期（sliding expiry，有設 SESSION_TTL 才開）：每次 verify_token 成功都會把到期時間往後推 TOKEN_TTL 秒
+#     （為了少寫幾次，距離上次續期不到 REFRESH_EVERY 秒就不續）
+#   - session 最晚在登入 token 的 exp（SESSION_MAX_AGE）就到期，續期也不會超過；
+#     token 過期後 session 就跟著消失，不會佔著 (role, user) 讓人再也登不進來
+#   - 兩種 store：
+#       memory          預設；到期時間放在 heap，每次只看 heap 頂端，過期處理 O(log n)
+#       sqlite:<路徑>   sessions 存在 SQLite（WAL），重啟後 session 還在，
+#                       多個 lobby / dev worker 行程指到同一個檔案就能共用登入狀態；
+#                       (role, user) 的 UNIQUE index 讓「只能登入一次」跨行程也成立
+#
+# token 是 HMAC-SHA256 簽章過的 claims（<payload>.<簽章>，都是 base64url）：
+#   - 登入 token：{"u": user, "r": role, "jti": session id, "iat", "exp"}
+#       verify_token 先在本機驗簽章與 exp（亂打的 token 連 store 都不用查），再到 store 確認沒被登出 / 閒置過期；
+#       SESSION_STATELESS=1 時只驗簽章，任何拿到同一把 SECRET 的 lobby worker 都能獨立驗證（登出只能等 exp）
+#   - 房間票（issue_token(user, role, room=...)）：再多一個 "room"，用 room_key(room_id) 簽，
+#       不進 store；lobby 啟動遊戲 server 時只給它自己房間的 key（ROOM_KEY），
+#       遊戲 server 用 verify_ticket 在本機確認「這個連線真的是 lobby 放進這個房間的某某人」
+#   - 遊戲 server 回呼 lobby（game_finished）：整個 payload 用同一把 ROOM_KEY 簽（callback_signature），
+#       放在 "sig"，另帶 "ts"；lobby 用 verify_callback 確認真的是那個房間的遊戲 server 送的
+#
+# 設定：configure(store, ttl)，或環境變數 SESSION_STORE（memory / sqlite:path）、
+#      SESSION_TTL（秒，0 / 不設 = 永不過期，預設不過期）；相對路徑以 server/data 為準
+#      SESSION_SECRET：簽章金鑰（多台機器要設成一樣）；沒設就用 server/data/session_secret（第一次自動產生）
+#      SESSION_MAX_AGE：登入 token 本身的有效期限（秒，預設 12 小時）
+#      ROOM_TICKET_TTL：房間票的有效期限（秒，預設 6 小時）
+import base64
+import hashlib
+import heapq
+import hmac
+import json
+import os
+import sqlite3
 import threading
+import time
+import uuid
+from pathlib import Path
 
 _LOCK = threading.RLock()
 
-# token -> { "user": "abc", "role": "player", "ts": 12345 }
-SESSIONS = {}
+# token 閒置多久過期（None = 不過期）
+TOKEN_TTL = float(os.getenv("SESSION_TTL", "0")) or None
 
-# (role, user) -> token
-USER_ACTIVE = {}
+SESSION_MAX_AGE = float(os.getenv("SESSION_MAX_AGE", str(12 * 3600)))
+ROOM_TICKET_TTL = float(os.getenv("ROOM_TICKET_TTL", str(6 * 3600)))
+STATELESS = os.getenv("SESSION_STATELESS", "") not in ("", "0")
 
-# token 存活時間（None = 不檢查）
-TOKEN_TTL = None
+_store = None
+_secret = None
 
 
-def _cleanup_expired():
-    if TOKEN_TTL is None:
-        return
+# ----------------- 簽章 ----------------- #
 
-    now = time.time()
-    expired = []
+def _b64e(b: bytes) -> str:
+    return base64.urlsafe_b64encode(b).rstrip(b"=").decode("ascii")
+
+
+def _b64d(s: str) -> bytes:
+    return base64.urlsafe_b64decode(s + "=" * (-len(s) % 4))
+
+
+def _load_secret() -> bytes:
+    env = os.getenv("SESSION_SECRET")
+    if env:
+        return env.encode("utf-8")
+    from common import db
+    path = db.DATA_DIR / "session_secret"
+    try:
+        # O_EXCL：同一台機器上的多個 worker 同時啟動時，只有一個會寫入
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        for _ in range(50):
+            data = path.read_bytes().strip()
+            if data:
+                return data
+            time.sleep(0.02)
+        raise RuntimeError(f"session secret 檔案是空的：{path}")
+    data = _b64e(os.urandom(32)).encode("ascii")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    return data
+
+
+def _get_secret() -> bytes:
+    global _secret
+    if _secret is None:
+        with _LOCK:
+            if _secret is None:
+                _secret = _load_secret()
+    return _secret
+
+
+def room_key(room_id: str) -> str:
+    """某個房間專用的簽章金鑰（給遊戲 server 的 ROOM_KEY；拿到它也簽不出別的房間或登入 token）"""
+    return hmac.new(_get_secret(), b"room:" + room_id.encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+def _sign(claims: dict, key: bytes) -> str:
+    payload = _b64e(json.dumps(claims, separators=(",", ":"), ensure_ascii=False).encode("utf-8"))
+    sig = hmac.new(key, payload.encode("ascii"), hashlib.sha256).digest()
+    return f"{payload}.{_b64e(sig)}"
+
+
+def _unsign(token, key: bytes, now: float):
+    """簽章正確且未過期就回傳 claims，否則 None"""
+    if not isinstance(token, str) or token.count(".") != 1:
+        return None
+    payload, sig = token.split(".")
+    want = hmac.new(key, payload.encode("ascii", "replace"), hashlib.sha256).digest()
+    try:
+        if not hmac.compare_digest(want, _b64d(sig)):
+            return None
+        claims = json.loads(_b64d(payload))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(claims, dict):
+        return None
+    exp = claims.get("exp")
+    if exp is not None and exp <= now:
+        return None
+    return claims
 
-    for token, info in list(SESSIONS.items()):
-        if now - info["ts"] > TOKEN_TTL:
-            expired.append(token)
 
-    for token in expired:
-        info = SESSIONS.pop(token, None)
+def verify_ticket(ticket, key, room_id: str = None):
+    """
+    在本機驗證房間票（遊戲 server 用；key 是 ROOM_KEY）
+    回傳 {"user", "role", "room", "exp"}，不合法 / 過期 / 不是這個房間就回傳 None
+    """
+    if isinstance(key, str):
+        key = key.encode("ascii")
+    claims = _unsign(ticket, key, time.time())
+    if not claims or "room" not in claims:
+        return None
+    if room_id is not None and claims["room"] != room_id:
+        return None
+    return {"user": claims.get("u"), "role": claims.get("r"), "room": claims["room"], "exp": claims.get("exp")}
+
+
+CALLBACK_MAX_SKEW = 120  # 回呼的 ts 與 lobby 時間最多差幾秒（擋重送舊的回呼）
+
+
+def callback_signature(payload: dict, key) -> str:
+    """
+    遊戲 server → lobby 回呼的簽章：HMAC-SHA256(ROOM_KEY, 去掉 "sig" 後的 payload 排序好的 JSON) 的 hex。
+    遊戲套件不能 import 這裡，各自放一份同樣算法（見 developer/games/*/start_server.py）
+    """
+    if isinstance(key, str):
+        key = key.encode("ascii")
+    body = {k: v for k, v in payload.items() if k != "sig"}
+    raw = json.dumps(body, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    return hmac.new(key, raw, hashlib.sha256).hexdigest()
+
+
+def verify_callback(payload: dict, room_id: str) -> bool:
+    """payload 是 room_id 那個房間的遊戲 server 簽的，且 ts 在 CALLBACK_MAX_SKEW 秒內"""
+    sig, ts = payload.get("sig"), payload.get("ts")
+    if not isinstance(sig, str) or not isinstance(ts, (int, float)) or isinstance(ts, bool):
+        return False
+    if abs(time.time() - ts) > CALLBACK_MAX_SKEW:
+        return False
+    return hmac.compare_digest(sig, callback_signature(payload, room_key(room_id)))
+
+
+def _refresh_every(ttl):
+    return min(60.0, ttl / 20) if ttl else None
+
+
+def _expires_at(now, ttl, deadline):
+    """閒置到期時間與 token exp 取比較早的（都沒有 = 不過期）"""
+    idle = now + ttl if ttl else None
+    if idle is None:
+        return deadline
+    return idle if deadline is None else min(idle, deadline)
+
+
+class MemoryStore:
+    """單一行程內的 session；重啟就全部登出"""
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self.refresh_every = _refresh_every(ttl)
+        # session id（token 裡的 jti）-> { "user": "abc", "role": "player", "ts": 最後續期時間,
+        #                                  "expires": 到期時間, "deadline": token 的 exp }
+        self.sessions = {}
+        # (role, user) -> session id
+        self.active = {}
+        # (expires, token)；續期時不更新 heap，輪到它時發現 expires 變大了再放回去
+        self._heap = []
+
+    def _drop(self, token):
+        info = self.sessions.pop(token, None)
         if not info:
-            continue
+            return
         key = (info["role"], info["user"])
-        if USER_ACTIVE.get(key) == token:
-            USER_ACTIVE.pop(key, None)
+        if self.active.get(key) == token:
+            self.active.pop(key, None)
+
+    def expire(self, now):
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            exp, token = heapq.heappop(heap)
+            info = self.sessions.get(token)
+            if not info:
+                continue
+            if info["expires"] > exp:
+                heapq.heappush(heap, (info["expires"], token))
+            else:
+                self._drop(token)
+
+    def issue(self, token, user, role, now, deadline=None):
+        self.expire(now)
+        key = (role, user)
+        if key in self.active:
+            return None
+        expires = _expires_at(now, self.ttl, deadline)
+        self.sessions[token] = {"user": user, "role": role, "ts": now, "expires": expires, "deadline": deadline}
+        self.active[key] = token
+        if expires is not None:
+            heapq.heappush(self._heap, (expires, token))
+        return token
+
+    def get(self, token, now):
+        self.expire(now)
+        info = self.sessions.get(token)
+        if not info:
+            return None
+        if self.ttl and now - info["ts"] >= self.refresh_every:
+            info["ts"] = now
+            info["expires"] = _expires_at(now, self.ttl, info["deadline"])
+        return info
+
+    def revoke(self, token):
+        self._drop(token)
+
+    def count(self):
+        return len(self.sessions)
+
+
+class SqliteStore:
+    """SQLite 上的 session；每條 thread 一個連線，行程之間靠 SQLite 的檔案鎖協調"""
+
+    EXPIRE_EVERY = 5.0   # 整批刪過期 session 的最短間隔（秒）
+
+    def __init__(self, path, ttl=None):
+        self.path = str(path)
+        self.ttl = ttl
+        self.refresh_every = _refresh_every(ttl)
+        self._local = threading.local()
+        self._last_expire = 0.0
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        with self._conn() as c:
+            c.execute("""CREATE TABLE IF NOT EXISTS sessions (
+                token   TEXT PRIMARY KEY,
+                user    TEXT NOT NULL,
+                role    TEXT NOT NULL,
+                ts      REAL NOT NULL,
+                expires REAL,
+                deadline REAL
+            )""")
+            # 舊的 sessions.sqlite3 沒有 deadline 欄位
+            if "deadline" not in {row[1] for row in c.execute("PRAGMA table_info(sessions)")}:
+                c.execute("ALTER TABLE sessions ADD COLUMN deadline REAL")
+            c.execute("CREATE UNIQUE INDEX IF NOT EXISTS sessions_user ON sessions(role, user)")
+            c.execute("CREATE INDEX IF NOT EXISTS sessions_expires ON sessions(expires)")
+
+    def _conn(self):
+        c = getattr(self._local, "conn", None)
+        if c is None:
+            c = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            c.execute("PRAGMA journal_mode=WAL")
+            c.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = c
+        return c
+
+    def expire(self, now):
+        if now - self._last_expire < self.EXPIRE_EVERY:
+            return
+        self._last_expire = now
+        self._conn().execute("DELETE FROM sessions WHERE expires IS NOT NULL AND expires <= ?", (now,))
+
+    def issue(self, token, user, role, now, deadline=None):
+        self.expire(now)
+        c = self._conn()
+        expires = _expires_at(now, self.ttl, deadline)
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            # 同一個使用者的舊 session 若已過期（但還沒被整批清掉），不能擋住新的登入
+            c.execute("DELETE FROM sessions WHERE role = ? AND user = ? AND expires IS NOT NULL AND expires <= ?",
+                      (role, user, now))
+            c.execute("INSERT INTO sessions (token, user, role, ts, expires, deadline) VALUES (?, ?, ?, ?, ?, ?)",
+                      (token, user, role, now, expires, deadline))
+        except sqlite3.IntegrityError:
+            c.execute("ROLLBACK")
+            return None
+        except Exception:
+            c.execute("ROLLBACK")
+            raise
+        c.execute("COMMIT")
+        return token
+
+    def get(self, token, now):
+        self.expire(now)
+        c = self._conn()
+        row = c.execute("SELECT user, role, ts, expires, deadline FROM sessions WHERE token = ?",
+                        (token,)).fetchone()
+        if not row:
+            return None
+        user, role, ts, expires, deadline = row
+        if expires is not None and expires <= now:
+            c.execute("DELETE FROM sessions WHERE token = ?", (token,))
+            return None
+        if self.ttl and now - ts >= self.refresh_every:
+            ts, expires = now, _expires_at(now, self.ttl, deadline)
+            c.execute("UPDATE sessions SET ts = ?, expires = ? WHERE token = ?", (ts, expires, token))
+        return {"user": user, "role": role, "ts": ts, "expires": expires, "deadline": deadline}
+
+    def revoke(self, token):
+        self._conn().execute("DELETE FROM sessions WHERE token = ?", (token,))
+
+    def count(self):
+        return self._conn().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
 
+def _make_store(spec, ttl):
+    if not isinstance(spec, str):
+        return spec
+    if spec.startswith("sqlite:"):
+        path = Path(spec[len("sqlite:"):] or "sessions.sqlite3")
+        if not path.is_absolute():
+            from common import db
+            path = db.DATA_DIR / path
+        return SqliteStore(path, ttl)
+    if spec in ("", "memory"):
+        return MemoryStore(ttl)
+    raise ValueError(f"unknown session store: {spec}")
 
-def issue_token(user: str, role: str) -> str | None:
+
+def configure(store=None, ttl=...):
     """
-    發 token：
-      - 如果這個 user 在這個 role 已登入 → 回傳 None（拒絕新的登入）
-      - 沒登入 → 建立新登入
+    換 session store（啟動時呼叫一次；已登入的 session 不會搬過去）
+      store  "memory" / "sqlite:path" / 自訂物件；None = 看環境變數 SESSION_STORE
+      ttl    閒置幾秒過期；不給 = 沿用 TOKEN_TTL，None = 不過期
     """
-    _cleanup_expired()
+    global _store, TOKEN_TTL
+    with _LOCK:
+        if ttl is not ...:
+            TOKEN_TTL = ttl or None
+        spec = store if store is not None else os.getenv("SESSION_STORE", "memory")
+        _store = _make_store(spec, TOKEN_TTL)
+        return _store
+
+
+def _get_store():
+    return _store if _store is not None else configure()
+
 
-    key = (role, user)
+def issue_token(user: str, role: str, room: str = None, ttl: float = None) -> str | None:
+    """
+    發 token：
+      - room 沒給 → 登入 token
+          - 如果這個 user 在這個 role 已登入 → 回傳 None（拒絕新的登入）
+          - 沒登入 → 建立新登入
+      - room 有給 → 這個房間的房間票（不影響登入狀態，預設 ROOM_TICKET_TTL 後過期）
+    """
+    now = time.time()
+    if room is not None:
+        claims = {"u": user, "r": role, "room": room, "iat": int(now), "exp": now + (ttl or ROOM_TICKET_TTL)}
+        return _sign(claims, room_key(room).encode("ascii"))
 
+    sid = uuid.uuid4().hex
+    exp = now + (ttl or SESSION_MAX_AGE)
     with _LOCK:
-        if key in USER_ACTIVE:
-            # ★★★ 重要：拒絕新的登入，不踢掉舊的
+        if not _get_store().issue(sid, user, role, now, exp):
             return None
-
-        token = uuid.uuid4().hex
-        info = {
-            "user": user,
-            "role": role,
-            "ts": time.time(),
-        }
-        SESSIONS[token] = info
-        USER_ACTIVE[key] = token
-        return token
+    claims = {"u": user, "r": role, "jti": sid, "iat": int(now), "exp": exp}
+    return _sign(claims, _get_secret())
 
 
 def verify_token(token: str | None, role: str | None = None):
     if not token:
         return None
 
-    _cleanup_expired()
+    now = time.time()
+    # 先不看 exp 驗簽章：簽章對但過期的 token 要順便把 store 裡的 session 清掉
+    claims = _unsign(token, _get_secret(), 0)
+    if not claims or "jti" not in claims:
+        return None
+    exp = claims.get("exp")
+    if exp is not None and exp <= now:
+        if not STATELESS:
+            with _LOCK:
+                _get_store().revoke(claims["jti"])
+        return None
+    if role and claims.get("r") != role:
+        return None
+    if STATELESS:
+        return {"user": claims["u"], "role": claims["r"], "ts": claims.get("iat"), "expires": claims.get("exp")}
 
     with _LOCK:
-        info = SESSIONS.get(token)
+        info = _get_store().get(claims["jti"], now)
         if not info:
             return None
 
@@ -82,11 +413,15 @@ def revoke_token(token: str | None):
     if not token:
         return
 
+    # 登出不看 exp：過期的 token 也要能把 store 裡的 session 清掉
+    claims = _unsign(token, _get_secret(), 0)
+    if not claims or "jti" not in claims:
+        return
+
     with _LOCK:
-        info = SESSIONS.pop(token, None)
-        if not info:
-            return
+        _get_store().revoke(claims["jti"])
 
-        key = (info["role"], info["user"])
-        if USER_ACTIVE.get(key) == token:
-            USER_ACTIVE.pop(key, None)
+
+def session_count() -> int:
+    with _LOCK:
+        return _get_store().count()
@@ -0,0 +1,286 @@
+# common/catalog.py
+# 遊戲商城搜尋索引（記憶體內，lobby 的 search_games 用）：
+#   - 倒排索引：token -> {遊戲: 權重}，欄位來自 games.json 最新版本的 manifest
+#       name / display_name 權重 3、author 2、description 1
+#     英數字切成小寫單字，並索引每個前綴（輸入 "tet" 就找得到 tetris）；
+#     中日韓文字逐字 + 相鄰兩字索引（查詢也同樣切，等於子字串比對）
+#   - facet：type（CLI / GUI）、max_players 各一個 {值: 遊戲集合}，評分每 0.1 分一桶（回傳時併成 1~5 星）
+#   - 沒有關鍵字時用預先排好（評分高 → 名稱）的清單邊走邊過濾，不必每次排序全部遊戲
+#   - 增量更新：dev server 上傳 / 下架時呼叫 update / remove，評分改變時 update_rating；
+#     lobby 啟動時 rebuild 一次（main.py 讓兩個 server 跑在同一個行程，共用這份索引）
+import bisect, heapq, re, threading
+
+NAME_WEIGHT = 3
+AUTHOR_WEIGHT = 2
+DESC_WEIGHT = 1
+MAX_PREFIX = 20
+MAX_LIMIT = 100
+
+_WORD = re.compile(r"[0-9a-z]+|[぀-ヿ㐀-鿿가-힯]+")
+
+_lock = threading.RLock()
+_docs = {}          # name -> 搜尋結果要回傳的欄位
+_postings = {}      # token -> {name: weight}
+_doc_tokens = {}    # name -> {token: weight}（移除 / 更新時用）
+_by_type = {}       # "CLI" -> {name}
+_by_players = {}    # 2 -> {name}
+_by_rating = {}     # 0（尚無評分）/ 10..50（平均分數 × 10）-> {name}
+_ranked = []        # 全部遊戲依 _rank_key 排好（bisect 增量維護），沒有關鍵字時直接從頭取
+_pos = None         # name -> 在 _ranked 的位置（關鍵字排序用的整數 key），_ranked 變動後重建
+
+
+def _tokens(text: str, prefixes: bool) -> set:
+    out = set()
+    for w in _WORD.findall((text or "").lower()):
+        if w.isascii():
+            if prefixes:
+                out.update(w[:i] for i in range(1, min(len(w), MAX_PREFIX) + 1))
+            else:
+                out.add(w[:MAX_PREFIX])
+        elif prefixes or len(w) == 1:
+            out.update(w)
+            out.update(w[i:i + 2] for i in range(len(w) - 1))
+        else:
+            # 查詢時兩字一組就夠了（單字一定也在）
+            out.update(w[i:i + 2] for i in range(len(w) - 1))
+    return out
+
+
+def _rating_bucket(avg) -> int:
+    return 0 if avg is None else max(10, min(50, int(avg * 10)))
+
+
+def _rank_key(d: dict):
+    return (-(d["avg_rating"] or 0), -d["review_count"], d["name"])
+
+
+def _rank_positions() -> dict:
+    global _pos
+    if _pos is None:
+        _pos = {k[2]: i for i, k in enumerate(_ranked)}
+    return _pos
+
+
+def _rank_remove(d: dict):
+    global _pos
+    _pos = None
+    key = _rank_key(d)
+    i = bisect.bisect_left(_ranked, key)
+    if i < len(_ranked) and _ranked[i] == key:
+        del _ranked[i]
+
+
+def _unindex(name: str):
+    d = _docs.pop(name, None)
+    if d is None:
+        return
+    _rank_remove(d)
+    for tok in _doc_tokens.pop(name, {}):
+        post = _postings.get(tok)
+        if post is not None:
+            post.pop(name, None)
+            if not post:
+                del _postings[tok]
+    for facet, key in ((_by_type, d["type"]), (_by_players, d["max_players"]),
+                       (_by_rating, _rating_bucket(d["avg_rating"]))):
+        s = facet.get(key)
+        if s is not None:
+            s.discard(name)
+            if not s:
+                del facet[key]
+
+
+def _index(name: str, g: dict, ranked: bool = True):
+    latest = g.get("latest")
+    manifest = ((g.get("versions") or {}).get(latest) or {}).get("manifest") or {}
+    try:
+        max_players = int(manifest.get("max_players", 2))
+    except (TypeError, ValueError):
+        max_players = 2
+    d = {
+        "name": name,
+        "display_name": manifest.get("display_name", name),
+        "description": manifest.get("description", ""),
+        "author": g.get("author"),
+        "type": str(manifest.get("type", "Unknown")).upper(),
+        "max_players": max_players,
+        "latest": latest,
+        "avg_rating": g.get("avg_rating"),
+        "review_count": g.get("review_count", 0) or 0,
+    }
+    toks = {}
+    for text, weight in ((name, NAME_WEIGHT), (d["display_name"], NAME_WEIGHT),
+                         (d["author"], AUTHOR_WEIGHT), (d["description"], DESC_WEIGHT)):
+        for tok in _tokens(str(text or ""), prefixes=True):
+            if toks.get(tok, 0) < weight:
+                toks[tok] = weight
+    _docs[name] = d
+    _doc_tokens[name] = toks
+    for tok, weight in toks.items():
+        _postings.setdefault(tok, {})[name] = weight
+    _by_type.setdefault(d["type"], set()).add(name)
+    _by_players.setdefault(max_players, set()).add(name)
+    _by_rating.setdefault(_rating_bucket(d["avg_rating"]), set()).add(name)
+    if ranked:
+        bisect.insort(_ranked, _rank_key(d))
+        global _pos
+        _pos = None
+
+
+# ----------------- 更新 ----------------- #
+
+def update(name: str, g: dict):
+    """上傳 / 更新後呼叫；下架（status != active）的遊戲會從索引移除"""
+    with _lock:
+        _unindex(name)
+        if isinstance(g, dict) and g.get("status", "active") == "active":
+            _index(name, g)
+
+
+def remove(name: str):
+    with _lock:
+        _unindex(name)
+
+
+def update_rating(name: str, avg_rating, review_count: int):
+    with _lock:
+        d = _docs.get(name)
+        if d is None:
+            return
+        _rank_remove(d)
+        old, new = _rating_bucket(d["avg_rating"]), _rating_bucket(avg_rating)
+        if old != new:
+            _by_rating[old].discard(name)
+            if not _by_rating[old]:
+                del _by_rating[old]
+            _by_rating.setdefault(new, set()).add(name)
+        d["avg_rating"], d["review_count"] = avg_rating, review_count or 0
+        bisect.insort(_ranked, _rank_key(d))
+
+
+def rebuild(games: dict):
+    global _pos
+    with _lock:
+        for name in list(_docs):
+            _unindex(name)
+        for name, g in (games or {}).items():
+            if isinstance(g, dict) and g.get("status", "active") == "active":
+                _index(name, g, ranked=False)
+        _ranked[:] = sorted(_rank_key(d) for d in _docs.values())
+        _pos = None
+
+
+# ----------------- 查詢 ----------------- #
+
+def _union(facet: dict, keys) -> set:
+    sets = [facet[k] for k in keys if k in facet]
+    if len(sets) == 1:
+        return sets[0]
+    return set().union(*sets)
+
+
+def _filter_set(types, players, min_rating, max_rating):
+    """facet 條件的候選集合（唯讀，可能直接是索引裡的集合）；沒有任何條件回傳 None（= 全部）"""
+    sets = []
+    if types:
+        sets.append(_union(_by_type, types))
+    if players:
+        sets.append(_union(_by_players, players))
+    if min_rating is not None or max_rating is not None:
+        # 有評分條件就不含尚無評分的遊戲；中間的桶整桶收，只有邊界兩桶要看實際分數
+        lo = _rating_bucket(min_rating) if min_rating is not None else 10
+        hi = _rating_bucket(max_rating) if max_rating is not None else 50
+        cand = set()
+        for b in range(lo, hi + 1):
+            bucket = _by_rating.get(b, ())
+            if lo < b < hi:
+                cand |= bucket
+                continue
+            for name in bucket:
+                avg = _docs[name]["avg_rating"]
+                if (min_rating is None or avg >= min_rating) and (max_rating is None or avg <= max_rating):
+                    cand.add(name)
+        sets.append(cand)
+    if not sets:
+        return None
+    sets.sort(key=len)
+    out = sets[0]
+    for s in sets[1:]:
+        out = out & s
+    return out
+
+
+def _facet_counts(names) -> dict:
+    def count(facet, group=lambda k: k):
+        out = {}
+        for k, v in facet.items():
+            n = len(v) if names is None else len(names & v)
+            if n:
+                out[group(k)] = out.get(group(k), 0) + n
+        return out
+    # 評分：0 = 尚無評分，1~5 = 平均分數的整數部分
+    return {"type": count(_by_type), "max_players": count(_by_players),
+            "rating": count(_by_rating, lambda b: b // 10)}
+
+
+def search(query: str = "", types=None, players=None, min_rating=None, max_rating=None,
+           offset: int = 0, limit: int = 20, facets: bool = False) -> dict:
+    """
+    關鍵字（全部 token 都要命中）+ facet 過濾，依相關度 → 評分 → 名稱排序。
+    回傳 {"total", "games": [...], "next_offset"}；facets=True 時多一個命中結果的 facet 計數
+    """
+    offset = max(0, int(offset or 0))
+    limit = max(1, min(MAX_LIMIT, int(limit or 20)))
+    types = [str(t).upper() for t in (types or [])]
+    players = [int(p) for p in (players or [])]
+    want = offset + limit
+
+    with _lock:
+        allowed = _filter_set(types, players, min_rating, max_rating)
+        q = _tokens(query, prefixes=False)
+
+        if q:
+            posts = sorted((_postings.get(t, {}) for t in q), key=len)
+            names = set(posts[0])
+            for post in posts[1:]:
+                if not names:
+                    break
+                names &= post.keys()
+            if allowed is not None:
+                names &= allowed
+            total = len(names)
+            # 分數高的在前，同分照 _ranked 的順序；合成一個整數 key，比 tuple 比較快很多
+            pos, span = _rank_positions(), len(_ranked) + 1
+            if len(posts) == 1:
+                post = posts[0]
+                key = lambda n: pos[n] - post[n] * span
+            else:
+                key = lambda n: pos[n] - sum(p[n] for p in posts) * span
+            top = heapq.nsmallest(want, names, key=key)
+        else:
+            names = allowed
+            if allowed is None:
+                total, top = len(_ranked), [k[2] for k in _ranked[:want]]
+            else:
+                total, top = len(allowed), []
+                for k in _ranked:
+                    if k[2] in allowed:
+                        top.append(k[2])
+                        if len(top) >= want:
+                            break
+
+        page = top[offset:want]
+        end = offset + len(page)
+        resp = {
+            "total": total,
+            "games": [dict(_docs[n]) for n in page],
+            "next_offset": end if end < total else None,
+        }
+        if facets:
+            resp["facets"] = _facet_counts(names)
+        return resp
+
+
+def stats() -> dict:
+    with _lock:
+        return {"games": len(_docs), "tokens": len(_postings)}
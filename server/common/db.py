@@ -1,26 +1,247 @@
 # server/common/db.py
-import json, threading
+# JSON 檔案 DB：
+#   - save 一律寫到同資料夾的暫存檔 → flush → (fsync) → rename 蓋掉正式檔，
+#     寫到一半當機 / 磁碟滿，正式檔仍是上一份完整內容
+#   - rename 前先把舊的正式檔改名成 <name>.bak，保留「上一個好的版本」
+#   - load 讀到壞掉的 JSON（或正式檔不見 / 是空檔、只剩 .bak）時改讀 .bak，
+#     壞掉的檔案改名成 <name>.corrupt-<時間> 留著查，不會在下一次 save 時被默默蓋掉
+#
+# 耐久性（環境變數 DB_DURABILITY）：
+#   fsync  預設；每次 save 都 fsync 檔案與資料夾，回傳時保證已落盤
+#   batch  save 只做 rename（其他行程馬上讀得到），背景 thread 每 DB_FSYNC_INTERVAL 秒
+#          把這段期間寫過的檔案一起 fsync；斷電最多遺失這麼久的寫入，但 save 的延遲穩定
+#   none   不 fsync（只防行程當掉，不防斷電；測試 / 壓測用）
+#
+# 寫入時機（環境變數 DB_COMMIT，或 configure(commit=...)）：
+#   sync   預設；save 回傳時已寫進檔案
+#   group  group commit：save 只把序列化後的內容記成「待寫入」，背景 flusher 每 DB_COMMIT_INTERVAL 秒
+#          每個檔案最多寫一次（只寫最後一版）；同一行程的 load 會直接讀到待寫入的內容。
+#          檔案內容最多落後 DB_COMMIT_INTERVAL 秒（加上一次寫檔時間）；flush() 立即寫出，結束時 atexit 也會 flush。
+#          注意：其他「行程」讀同一個檔案會看到最多落後這麼久的內容
+import atexit, json, os, threading, time
+from contextlib import contextmanager
 from pathlib import Path
 
+from common import metrics
+from common.log import get_logger
+
 DATA_DIR = Path(__file__).resolve().parents[1] / "data"
 DATA_DIR.mkdir(exist_ok=True, parents=True)
 _lock = threading.RLock()
 
+DURABILITY = os.getenv("DB_DURABILITY", "fsync")
+FSYNC_INTERVAL = float(os.getenv("DB_FSYNC_INTERVAL", "0.2"))
+BACKUP_SUFFIX = ".bak"
+
+log = get_logger("db")
+
+COMMIT = os.getenv("DB_COMMIT", "sync")
+COMMIT_INTERVAL = float(os.getenv("DB_COMMIT_INTERVAL", "0.2"))
+
+_pending = {}               # group 模式：name -> 還沒寫出的最新內容（bytes）
+_flush_lock = threading.Lock()   # 寫出必須依序：同一個檔案不能舊的蓋掉新的
+_flush_wakeup = threading.Event()
+_flusher = None
+_stats = {"saves": 0, "writes": 0}
+
+_unsynced = set()           # batch 模式：已 rename、還沒 fsync 的檔案
+_unsynced_cv = threading.Condition(threading.Lock())
+_syncer = None
+
 def _path(name: str) -> Path:
     return DATA_DIR / name
 
+@contextmanager
+def _locked(op: str):
+    """取得 _lock，並把等鎖時間 / 持有時間記到目前請求的 metrics"""
+    t0 = time.perf_counter()
+    _lock.acquire()
+    t1 = time.perf_counter()
+    try:
+        yield
+    finally:
+        _lock.release()
+        metrics.record_db(op, t1 - t0, time.perf_counter() - t1)
+
+def _fsync_dir(d: Path):
+    # Windows 不能 open 資料夾；rename 在 NTFS 上本來就會寫 journal
+    if os.name == "nt":
+        return
+    fd = os.open(d, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def _fsync_path(p: Path):
+    try:
+        with open(p, "rb") as f:
+            os.fsync(f.fileno())
+    except FileNotFoundError:
+        pass
+
+def _syncer_loop():
+    while True:
+        with _unsynced_cv:
+            while not _unsynced:
+                _unsynced_cv.wait()
+        time.sleep(FSYNC_INTERVAL)
+        with _unsynced_cv:
+            batch = list(_unsynced)
+            _unsynced.clear()
+        t0 = time.perf_counter()
+        for p in batch:
+            _fsync_path(p)
+        for d in {p.parent for p in batch}:
+            _fsync_dir(d)
+        metrics.record_db("fsync_batch", 0.0, time.perf_counter() - t0)
+
+def _schedule_fsync(p: Path):
+    global _syncer
+    with _unsynced_cv:
+        _unsynced.add(p)
+        if _syncer is None:
+            _syncer = threading.Thread(target=_syncer_loop, name="db-fsync", daemon=True)
+            _syncer.start()
+        _unsynced_cv.notify()
+
+def _read(p: Path):
+    """
+    回傳 (資料, 是否成功)；檔案不存在 / 空檔（repo 內附的 data/*.json 是空的）算失敗但不算壞掉，
+    讀檔錯誤（可能只是暫時的）也不改名，只有內容真的不是 JSON 才隔離
+    """
+    try:
+        text = p.read_text(encoding="utf-8")
+    except FileNotFoundError:
+        return None, False
+    except UnicodeDecodeError as e:
+        log.error("JSON 檔案毀損", file=str(p), error=str(e))
+        _quarantine(p)
+        return None, False
+    except OSError as e:
+        log.error("讀取 JSON 檔案失敗", file=str(p), error=str(e))
+        return None, False
+    if not text.strip():
+        return None, False
+    try:
+        return json.loads(text), True
+    except json.JSONDecodeError as e:
+        log.error("JSON 檔案毀損", file=str(p), error=str(e))
+        _quarantine(p)
+        return None, False
+
+def _quarantine(p: Path):
+    try:
+        os.replace(p, p.with_name(f"{p.name}.corrupt-{int(time.time())}"))
+    except OSError:
+        pass
+
+def _write_atomic(p: Path, data: bytes):
+    tmp = p.with_name(f".{p.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(tmp, "wb") as f:
+            f.write(data)
+            f.flush()
+            if DURABILITY == "fsync":
+                os.fsync(f.fileno())
+        if p.exists():
+            # 上一個好的版本：兩次 rename 之間當機時，load 會從 .bak 讀回來
+            os.replace(p, p.with_name(p.name + BACKUP_SUFFIX))
+        os.replace(tmp, p)
+    except BaseException:
+        try:
+            tmp.unlink()
+        except OSError:
+            pass
+        raise
+    if DURABILITY == "fsync":
+        _fsync_dir(p.parent)
+    elif DURABILITY == "batch":
+        _schedule_fsync(p)
+
 def load(name: str, default=None):
     p = _path(name)
-    with _lock:
-        if not p.exists():
-            return default if default is not None else {}
-        try:
-            return json.loads(p.read_text(encoding="utf-8"))
-        except Exception:
+    with _locked("load"):
+        pending = _pending.get(name)
+        if pending is not None:
+            return json.loads(pending)
+        data, ok = _read(p)
+        if not ok:
+            bak = p.with_name(p.name + BACKUP_SUFFIX)
+            data, ok = _read(bak)
+            if ok:
+                log.warning("改用上一個版本", file=name, backup=bak.name)
+        if not ok:
             return default if default is not None else {}
+        return data
 
 def save(name: str, obj):
     p = _path(name)
-    with _lock:
-        p.write_text(json.dumps(obj, indent=2, ensure_ascii=False), encoding="utf-8")
+    data = json.dumps(obj, indent=2, ensure_ascii=False).encode("utf-8")
+    if COMMIT == "group":
+        with _locked("save"):
+            _stats["saves"] += 1
+            _pending[name] = data
+        _ensure_flusher()
+        _flush_wakeup.set()
+        return True
+    with _locked("save"):
+        _pending.pop(name, None)
+        _stats["saves"] += 1
+        _stats["writes"] += 1
+        _write_atomic(p, data)
         return True
+
+# ----------------- group commit ----------------- #
+
+def _ensure_flusher():
+    global _flusher
+    if _flusher is not None:
+        return
+    with _flush_lock:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flusher_loop, name="db-flush", daemon=True)
+            _flusher.start()
+            atexit.register(flush)
+
+def _flusher_loop():
+    while True:
+        # 沒有待寫入就睡著；第一筆 save 進來後最多再等 COMMIT_INTERVAL，這段期間的 save 一起寫
+        _flush_wakeup.wait()
+        time.sleep(COMMIT_INTERVAL)
+        _flush_wakeup.clear()
+        try:
+            with metrics.scope(metrics.registry("process"), "_db_flush"):
+                flush()
+        except Exception as e:
+            log.exception("背景寫入失敗", error=str(e))
+
+def flush():
+    """把所有待寫入的內容寫出（group 模式；sync 模式下什麼都不做）；回傳寫了幾個檔案"""
+    with _flush_lock:
+        with _lock:
+            batch = list(_pending.items())
+        written = 0
+        for name, data in batch:
+            _write_atomic(_path(name), data)
+            written += 1
+            with _lock:
+                # 寫檔期間又被 save 過就留著，下一輪再寫
+                if _pending.get(name) is data:
+                    del _pending[name]
+                _stats["writes"] += 1
+        return written
+
+def configure(commit: str = None, interval: float = None):
+    """切換 sync / group（切回 sync 時先把待寫入的寫完）"""
+    global COMMIT, COMMIT_INTERVAL
+    if interval is not None:
+        COMMIT_INTERVAL = float(interval)
+    if commit is not None and commit != COMMIT:
+        if commit != "group":
+            flush()
+        COMMIT = commit
+
+def stats() -> dict:
+    with _lock:
+        return {"commit": COMMIT, "saves": _stats["saves"], "writes": _stats["writes"], "pending": len(_pending)}
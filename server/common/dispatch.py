@@ -0,0 +1,338 @@
+# common/dispatch.py
+# 表格式的請求分派（lobby / dev server 共用）：
+#
+#   api = Dispatcher("lobby", metrics=METRICS, log=conn_log)
+#
+#   @api.kind("join_room", auth="player", fields=[Field("room_id", required="缺少 room_id")])
+#   def handle_join_room(req):
+#       req.user, req.args["room_id"] ...
+#
+#   - 每個 kind 的欄位 schema 在註冊時就編譯好，請求進來只在入口驗證一次；
+#     handler 拿到的 req.args 已經是轉好型別、strip 過的值
+#   - auth：None / "player" / "developer" / "admin"（本機或 ADMIN_KEY），驗過的 session 放在 req.session
+#   - middleware：fn(req, call_next) -> resp
+#       stage="pre"  在驗證之前（例如依來源 IP 限流、tracing）
+#       stage="post" 在驗證之後（req.user / req.args 已可用，例如依使用者限流）
+#     整條呼叫鏈在 register / use 時就組好，請求時只有一次 dict 查表
+#   - 讀一行 JSON、metrics 記錄、例外處理、回應編碼都在 handle_conn 統一處理，
+#     新的 kind 只要註冊就自動有 metrics 與 middleware
+import json, socket, time, uuid
+
+from common import auth, metrics
+
+READ_TIMEOUT = 2.0      # 單次 recv 的 timeout
+READ_MAX_TIMEOUTS = 3   # 連續幾次 timeout 還沒讀到一整行就放棄
+# 送回應的 timeout 依大小給（sendall 的 timeout 是算整個送完）：至少 WRITE_MIN_TIMEOUT 秒，
+# 對方至少要有 WRITE_MIN_RATE bytes/s（client 限速下載大包時不會被 READ_TIMEOUT 切斷）
+WRITE_MIN_TIMEOUT = 30.0
+WRITE_MIN_RATE = 8 * 1024
+
+
+def auth_fail():
+    return {"ok": False, "error": "未登入", "code": "NOT_LOGGED_IN"}
+
+
+def bad_request(msg: str):
+    return {"ok": False, "error": msg, "code": "BAD_REQUEST"}
+
+
+class Field:
+    """
+    一個欄位的宣告：
+      type      str（預設，會 strip）/ int / bool / dict / list / object（原樣）
+      required  缺少或空值時回傳的錯誤訊息；None 代表選填
+      default   選填時的預設值（str 預設 ""）
+      check     (fn, 錯誤訊息)：轉好型別後的額外檢查
+    """
+
+    __slots__ = ("name", "type", "required", "default", "check")
+
+    def __init__(self, name: str, type=str, required: str = None, default=None, check=None):
+        self.name = name
+        self.type = type
+        self.required = required
+        self.default = default
+        self.check = check
+
+
+def _compile_field(f: Field):
+    """把 Field 轉成 fn(payload) -> (value, error)"""
+    name, required, check = f.name, f.required, f.check
+    bad = required or f"欄位 {name} 格式錯誤"
+
+    if f.type is str:
+        default = f.default if f.default is not None else ""
+
+        def conv(v):
+            if v is None:
+                return default, None
+            return (v if isinstance(v, str) else str(v)).strip(), None
+    elif f.type is int:
+        def conv(v):
+            if v is None or v == "":
+                return f.default, None
+            try:
+                return int(v), None
+            except (TypeError, ValueError):
+                return None, bad
+    elif f.type is bool:
+        def conv(v):
+            return (bool(v) if v is not None else bool(f.default)), None
+    elif f.type in (dict, list):
+        typ = f.type
+
+        def conv(v):
+            if v is None:
+                return (f.default if f.default is not None else typ()), None
+            return (v, None) if isinstance(v, typ) else (None, bad)
+    else:
+        def conv(v):
+            return (v if v is not None else f.default), None
+
+    def parse(payload):
+        value, err = conv(payload.get(name))
+        if err:
+            return None, err
+        if required and (value is None or value == "" or value == {} or value == []):
+            return None, required
+        if check and value is not None and not check[0](value):
+            return None, check[1]
+        return value, None
+
+    return name, parse
+
+
+class Request:
+    __slots__ = ("kind", "payload", "args", "session", "addr", "conn", "trace_id", "req_bytes", "started")
+
+    def __init__(self, kind, payload: dict, addr, conn, req_bytes: int):
+        self.kind = kind
+        self.payload = payload
+        self.args = {}
+        self.session = None
+        self.addr = addr
+        self.conn = conn
+        self.trace_id = None
+        self.req_bytes = req_bytes
+        self.started = time.perf_counter()
+
+    @property
+    def user(self):
+        return self.session["user"] if self.session else None
+
+    @property
+    def token(self):
+        return self.payload.get("token")
+
+
+class Endpoint:
+    __slots__ = ("kind", "handler", "auth", "fields", "after", "call")
+
+    def __init__(self, kind, handler, auth_mode, fields, after):
+        self.kind = kind
+        self.handler = handler
+        self.auth = auth_mode
+        self.fields = [_compile_field(f) for f in fields]
+        self.after = after
+        self.call = None
+
+
+def _check_auth(mode, req: Request):
+    if mode is None:
+        return None
+    if mode == "admin":
+        if metrics.admin_allowed(req.addr, req.payload):
+            return None
+        return {"ok": False, "error": "沒有權限", "code": "FORBIDDEN"}
+    if callable(mode):
+        return mode(req)
+    session = auth.verify_token(req.payload.get("token"), role=mode)
+    if not session:
+        return auth_fail()
+    req.session = session
+    return None
+
+
+class Dispatcher:
+    def __init__(self, name: str, metrics=None, log=None):
+        self.name = name
+        self.metrics = metrics
+        self.log = log
+        self.endpoints = {}
+        self._pre = []
+        self._post = []
+
+    # ---------- 註冊 ----------
+    def kind(self, kind: str, auth=None, fields=(), after=None):
+        """
+        decorator：註冊一個 kind
+          auth   None / "player" / "developer" / "admin" / fn(req) -> 錯誤 dict 或 None
+          fields Field 列表，依序驗證，第一個錯誤就回傳
+          after  fn(req, resp)：回應送出後呼叫（例如 subscribe_room 保持連線）
+        """
+        def deco(fn):
+            ep = Endpoint(kind, fn, auth, fields, after)
+            self.endpoints[kind] = ep
+            self._build(ep)
+            return fn
+        return deco
+
+    def use(self, middleware, stage: str = "post"):
+        (self._pre if stage == "pre" else self._post).append(middleware)
+        for ep in self.endpoints.values():
+            self._build(ep)
+
+    def _build(self, ep: Endpoint):
+        """組好 pre middleware → auth / 欄位驗證 → post middleware → handler"""
+        handler = ep.handler
+        call = handler
+        for mw in reversed(self._post):
+            call = (lambda mw, nxt: lambda req: mw(req, nxt))(mw, call)
+        inner = call
+        fields, mode = ep.fields, ep.auth
+
+        def validated(req):
+            err = _check_auth(mode, req)
+            if err:
+                return err
+            args = req.args
+            payload = req.payload
+            for name, parse in fields:
+                value, err = parse(payload)
+                if err:
+                    return bad_request(err)
+                args[name] = value
+            return inner(req)
+
+        call = validated
+        for mw in reversed(self._pre):
+            call = (lambda mw, nxt: lambda req: mw(req, nxt))(mw, call)
+        ep.call = call
+
+    # ---------- 分派 ----------
+    def dispatch(self, req: Request) -> dict:
+        ep = self.endpoints.get(req.kind)
+        if ep is None:
+            return {"ok": False, "error": f"unknown kind: {req.kind}"}
+        return ep.call(req)
+
+    def handle_conn(self, conn, addr, on_reply=None):
+        """
+        一條連線 = 一行 JSON 請求 + 一行 JSON 回應（after hook 可以讓連線繼續開著）
+        on_reply：回應送出（或連線出錯）後、after hook 之前呼叫一次，例如歸還准入名額
+        """
+        def replied():
+            nonlocal on_reply
+            if on_reply is not None:
+                cb, on_reply = on_reply, None
+                cb()
+
+        try:
+            line = _read_line(conn)
+            if not line:
+                return
+            try:
+                payload = json.loads(line.decode("utf-8", errors="ignore"))
+                if not isinstance(payload, dict):
+                    raise ValueError("request must be a JSON object")
+            except ValueError as e:
+                if self.log:
+                    self.log.warning("JSON decode error", addr=addr, error=str(e), raw=line[:200])
+                _send(conn, {"ok": False, "error": "Invalid JSON"})
+                return
+
+            kind = payload.get("kind")
+            if self.log:
+                self.log.debug("Received", addr=addr, kind=kind, bytes=len(line))
+            req = Request(kind, payload, addr, conn, len(line))
+
+            if self.metrics is not None:
+                with self.metrics.track(kind, len(line)) as done:
+                    resp = self.dispatch(req)
+                    out = _encode(resp)
+                    done(resp, len(out))
+            else:
+                resp = self.dispatch(req)
+                out = _encode(resp)
+            _send_bytes(conn, out)
+            replied()
+
+            ep = self.endpoints.get(kind)
+            if ep is not None and ep.after is not None and isinstance(resp, dict) and resp.get("ok"):
+                ep.after(req, resp)
+
+        except Exception as e:
+            if self.log:
+                self.log.exception("Error handling connection", addr=addr, error=str(e))
+            try:
+                _send(conn, {"ok": False, "error": str(e)})
+            except Exception:
+                pass
+        finally:
+            replied()
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+
+def _read_line(conn) -> bytes:
+    """讀到第一個 \\n（或對方關閉 / 連續 timeout）；大檔上傳時避免反覆拼接 bytes"""
+    conn.settimeout(READ_TIMEOUT)
+    chunks = []
+    timeouts = 0
+    while timeouts < READ_MAX_TIMEOUTS:
+        try:
+            chunk = conn.recv(65536)
+        except socket.timeout:
+            timeouts += 1
+            continue
+        if not chunk:
+            break
+        timeouts = 0
+        nl = chunk.find(b"\n")
+        if nl >= 0:
+            chunks.append(chunk[:nl])
+            break
+        chunks.append(chunk)
+    return b"".join(chunks).strip()
+
+
+def _encode(resp) -> bytes:
+    return (json.dumps(resp, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def _send_bytes(conn, out: bytes):
+    conn.settimeout(max(WRITE_MIN_TIMEOUT, len(out) / WRITE_MIN_RATE))
+    try:
+        conn.sendall(out)
+    finally:
+        # after hook（subscribe_room 等保持的連線）之後的推送照舊用短 timeout，卡住的訂閱者不會拖住廣播
+        conn.settimeout(READ_TIMEOUT)
+
+
+def _send(conn, resp):
+    _send_bytes(conn, _encode(resp))
+
+
+# ----------------- 內建 middleware ----------------- #
+
+def tracing(log, slow_ms: float = 500.0, sample: float = None):
+    """
+    每個請求一個 trace_id（客戶端帶 trace_id 就沿用並在回應裡帶回）；
+    處理時間超過 slow_ms 記一筆 warning，其他的以 debug（可取樣）記錄
+    """
+    def mw(req, call_next):
+        given = req.payload.get("trace_id")
+        req.trace_id = str(given) if given else uuid.uuid4().hex[:12]
+        t0 = time.perf_counter()
+        resp = call_next(req)
+        ms = (time.perf_counter() - t0) * 1000
+        if ms >= slow_ms:
+            log.warning("slow request", kind=req.kind, trace=req.trace_id, ms=round(ms, 1), user=req.user)
+        else:
+            log.debug("request", kind=req.kind, trace=req.trace_id, ms=round(ms, 2), sample=sample)
+        if given and isinstance(resp, dict):
+            resp = dict(resp, trace_id=req.trace_id)
+        return resp
+    return mw
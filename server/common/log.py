@@ -0,0 +1,191 @@
+# common/log.py
+# 結構化、非同步、限流的 log（取代 hot path 上的 print(..., flush=True)）：
+#   - 呼叫端只把 LogRecord 丟進有上限的 queue（put_nowait，滿了就丟掉並計數），
+#     真正寫 stdout 的是背景 QueueListener thread → request thread 不會被 stdout / pipe 卡住
+#   - 每筆紀錄 = 事件文字 + key=value 欄位；LOG_FORMAT=json 時一行一個 JSON
+#   - 同一個 (logger, 事件) 每秒超過 LOG_RATE 筆就先壓下來，下一筆放行時附上 suppressed=N
+#     （WARNING 以上不限流）
+#   - sample=0.01：只留下該比例的紀錄，給高頻的 debug 用
+#   - get_logger("lobby.room", room=room_id)：依元件 / 房間分開的 logger，欄位自動帶上
+#
+# 環境變數：LOG_LEVEL（預設 INFO）、LOG_FORMAT（text / json）、
+#          LOG_RATE（每秒每事件，預設 20）、LOG_QUEUE（queue 上限，預設 10000）
+import atexit, json, logging, logging.handlers, os, queue, random, sys, threading, time
+
+ROOT_NAME = "gamestore"
+
+_setup_lock = threading.Lock()
+_handler = None
+_listener = None
+
+
+class DropQueueHandler(logging.handlers.QueueHandler):
+    """queue 滿了就丟掉，絕不等待"""
+
+    def __init__(self, q):
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # 同一個行程內不需要先 format 成字串，交給 listener thread 做
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class RateLimitFilter(logging.Filter):
+    """每個 (logger, 事件) 一個 token bucket"""
+
+    MAX_KEYS = 4096
+
+    def __init__(self, rate: float, burst: float = None):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self._buckets = {}  # key -> [tokens, last, suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record) -> bool:
+        if self.rate <= 0 or record.levelno >= logging.WARNING:
+            return True
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            b = self._buckets.get(key)
+            if b is None:
+                if len(self._buckets) >= self.MAX_KEYS:
+                    self._buckets.clear()
+                b = self._buckets[key] = [self.burst, now, 0]
+            tokens = min(self.burst, b[0] + (now - b[1]) * self.rate)
+            b[1] = now
+            if tokens < 1.0:
+                b[0] = tokens
+                b[2] += 1
+                return False
+            b[0] = tokens - 1.0
+            if b[2]:
+                record.suppressed = b[2]
+                b[2] = 0
+        return True
+
+
+def _fmt_value(v) -> str:
+    s = v if isinstance(v, str) else json.dumps(v, ensure_ascii=False, default=str)
+    return json.dumps(s, ensure_ascii=False) if (" " in s or "=" in s or not s) else s
+
+
+class StructFormatter(logging.Formatter):
+    def __init__(self, as_json: bool = False):
+        super().__init__()
+        self.as_json = as_json
+
+    def format(self, record) -> str:
+        fields = dict(getattr(record, "fields", None) or {})
+        if getattr(record, "suppressed", 0):
+            fields["suppressed"] = record.suppressed
+        event = record.getMessage()
+        if self.as_json:
+            out = {"ts": round(record.created, 3), "level": record.levelname, "logger": record.name,
+                   "event": event, **fields}
+            if record.exc_info:
+                out["exc"] = self.formatException(record.exc_info)
+            return json.dumps(out, ensure_ascii=False, default=str)
+
+        ts = time.strftime("%H:%M:%S", time.localtime(record.created)) + f".{int(record.msecs):03d}"
+        line = f"{ts} {record.levelname:<7} [{record.name}] {event}"
+        if fields:
+            line += " " + " ".join(f"{k}={_fmt_value(v)}" for k, v in fields.items())
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+def setup(level=None, stream=None, fmt=None, rate=None, queue_size=None):
+    """設定根 logger（重複呼叫只有第一次有效）"""
+    global _handler, _listener
+    with _setup_lock:
+        if _listener is not None:
+            return
+        level = level or os.getenv("LOG_LEVEL", "INFO")
+        fmt = fmt or os.getenv("LOG_FORMAT", "text")
+        rate = float(rate if rate is not None else os.getenv("LOG_RATE", "20"))
+        queue_size = int(queue_size or os.getenv("LOG_QUEUE", "10000"))
+
+        out = logging.StreamHandler(stream or sys.stdout)
+        out.setFormatter(StructFormatter(as_json=(fmt == "json")))
+
+        q = queue.Queue(maxsize=queue_size)
+        _handler = DropQueueHandler(q)
+        _handler.addFilter(RateLimitFilter(rate))
+        _listener = logging.handlers.QueueListener(q, out)
+        _listener.start()
+
+        root = logging.getLogger(ROOT_NAME)
+        root.setLevel(level.upper() if isinstance(level, str) else level)
+        root.addHandler(_handler)
+        root.propagate = False
+        atexit.register(shutdown)
+
+
+def shutdown():
+    """把 queue 裡剩下的紀錄寫完（結束前呼叫；atexit 也會呼叫）"""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+def stats() -> dict:
+    if _handler is None:
+        return {"dropped": 0, "queued": 0}
+    return {"dropped": _handler.dropped, "queued": _handler.queue.qsize()}
+
+
+class StructLogger:
+    """log.info("事件", key=value, ...)；bind(**ctx) 產生帶固定欄位的子 logger"""
+
+    __slots__ = ("_logger", "_ctx")
+
+    def __init__(self, logger: logging.Logger, ctx: dict = None):
+        self._logger = logger
+        self._ctx = ctx or {}
+
+    def bind(self, **ctx) -> "StructLogger":
+        return StructLogger(self._logger, {**self._ctx, **ctx})
+
+    def is_enabled(self, level) -> bool:
+        return self._logger.isEnabledFor(level)
+
+    def _log(self, level, event, sample, exc_info, fields):
+        if not self._logger.isEnabledFor(level):
+            return
+        if sample is not None and random.random() >= sample:
+            return
+        if self._ctx:
+            fields = {**self._ctx, **fields}
+        self._logger.log(level, event, exc_info=exc_info, extra={"fields": fields})
+
+    def debug(self, event, *, sample=None, **fields):
+        self._log(logging.DEBUG, event, sample, None, fields)
+
+    def info(self, event, *, sample=None, **fields):
+        self._log(logging.INFO, event, sample, None, fields)
+
+    def warning(self, event, *, sample=None, **fields):
+        self._log(logging.WARNING, event, sample, None, fields)
+
+    def error(self, event, *, sample=None, **fields):
+        self._log(logging.ERROR, event, sample, None, fields)
+
+    def exception(self, event, **fields):
+        self._log(logging.ERROR, event, None, True, fields)
+
+
+def get_logger(component: str, **ctx) -> StructLogger:
+    setup()
+    return StructLogger(logging.getLogger(f"{ROOT_NAME}.{component}"), ctx)
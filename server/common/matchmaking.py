@@ -0,0 +1,284 @@
+# common/matchmaking.py
+# 自動配對（lobby 的 queue_for_match 用）：
+#   MatchQueue  每個 key（(遊戲, 版本)）一條 FIFO；湊滿 group_size 人就整組拿出來，
+#               丟給 on_group(key, entries) 在背景 thread 開房，不卡住最後一個排進來的人
+#               每個排隊的人一個 Entry：request thread 在 Entry.wait() 上等結果（配到 / 取消 / 逾時 / 斷線）
+#   WarmPool    每個 key 預先開好幾個遊戲 server（配對成功時直接拿來用，省掉啟動的幾秒）；
+#               只替有人排過的 key 補貨，超過 ttl 沒用到就收掉
+#
+# 遊戲 / 房間相關的細節（怎麼開 server、怎麼寫 rooms.json）都由 lobby 傳進來的 callback 處理
+import select, socket, threading, time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from common.log import get_logger
+
+log = get_logger("matchmaking")
+
+
+def _key_str(key) -> str:
+    return "@".join(map(str, key)) if isinstance(key, tuple) else str(key)
+
+
+def _peer_closed(conn) -> bool:
+    """排隊的連線是不是已經被 client 關掉（client 在排隊期間不會再送東西）"""
+    try:
+        r, _, _ = select.select([conn], [], [], 0)
+        if not r:
+            return False
+        return conn.recv(1, socket.MSG_PEEK) == b""
+    except (OSError, ValueError):
+        return True
+
+
+class Entry:
+    __slots__ = ("user", "key", "conn", "queued_at", "result", "_done")
+
+    def __init__(self, user, key, conn):
+        self.user = user
+        self.key = key
+        self.conn = conn
+        self.queued_at = time.monotonic()
+        self.result = None
+        self._done = threading.Event()
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def gone(self) -> bool:
+        return self.conn is not None and _peer_closed(self.conn)
+
+    def resolve(self, result: dict) -> bool:
+        """只有第一次有效（配到 / 取消 / 逾時只會發生一個）"""
+        if self._done.is_set():
+            return False
+        self.result = result
+        self._done.set()
+        return True
+
+    def wait(self, queue: "MatchQueue", timeout: float) -> dict:
+        """
+        等結果。client 斷線 / 逾時就把自己移出隊伍；
+        移除失敗代表剛好已經被湊成一組，照樣等開房結果（斷線的話開房時會被剔除）
+        """
+        deadline = time.monotonic() + timeout
+        while not self._done.wait(min(1.0, max(0.0, deadline - time.monotonic()))):
+            if self.gone():
+                queue.leave(entry=self, result={"event": "match_cancelled", "error": "連線中斷"})
+                if self.done:
+                    return None
+            elif time.monotonic() >= deadline:
+                queue.leave(entry=self, result={"event": "match_timeout", "error": "等待配對逾時，請再試一次"})
+                deadline += 30      # 已經在開房：再給一點時間
+        return self.result
+
+
+class MatchQueue:
+    def __init__(self, on_group, workers: int = 4):
+        self.on_group = on_group
+        self._lock = threading.Lock()
+        self._queues = {}       # key -> deque[Entry]
+        self._sizes = {}        # key -> group_size
+        self._by_user = {}      # user -> Entry（一個人同時只排一條）
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="match")
+        self._stats = {"queued": 0, "matched": 0, "groups": 0, "cancelled": 0, "wait_ms_total": 0.0}
+
+    def join(self, key, user, group_size: int, conn=None) -> Entry:
+        """排進 key 的隊伍（原本排在別的隊伍會先被取消）；湊滿就在背景開房"""
+        entry = Entry(user, key, conn)
+        with self._lock:
+            old = self._remove_locked(user)
+            self._queues.setdefault(key, deque()).append(entry)
+            self._sizes[key] = group_size
+            self._by_user[user] = entry
+            self._stats["queued"] += 1
+            groups = self._take_groups_locked(key)
+        if old is not None:
+            old.resolve({"event": "match_cancelled", "error": "已改排其他隊伍"})
+        for group in groups:
+            self._pool.submit(self._form, key, group)
+        return entry
+
+    def _take_groups_locked(self, key) -> list:
+        q, size = self._queues.get(key), self._sizes.get(key, 2)
+        groups = []
+        while q is not None and len(q) >= size:
+            group = [q.popleft() for _ in range(size)]
+            for e in group:
+                self._by_user.pop(e.user, None)
+            groups.append(group)
+        if q is not None and not q:
+            self._queues.pop(key, None)
+        return groups
+
+    def _form(self, key, group):
+        # 排隊期間斷線 / 已取消的人剔除，其他人排回最前面（保留原本的等待時間）
+        live = [e for e in group if not e.done and not e.gone()]
+        if len(live) < len(group):
+            with self._lock:
+                self._stats["cancelled"] += len(group) - len(live)
+                q = self._queues.setdefault(key, deque())
+                for e in reversed(live):
+                    q.appendleft(e)
+                    self._by_user[e.user] = e
+                groups = self._take_groups_locked(key)
+            for e in group:
+                if e not in live:
+                    e.resolve({"event": "match_cancelled", "error": "連線中斷"})
+            for g in groups:
+                self._form(key, g)
+            return
+
+        now = time.monotonic()
+        with self._lock:
+            self._stats["groups"] += 1
+            self._stats["matched"] += len(group)
+            self._stats["wait_ms_total"] += sum((now - e.queued_at) * 1000 for e in group)
+        try:
+            self.on_group(key, group)
+        except Exception as e:
+            log.exception("開房失敗", key=_key_str(key), error=str(e))
+            for entry in group:
+                entry.resolve({"event": "match_failed", "error": "配對成功但開房失敗，請再試一次"})
+
+    def _remove_locked(self, user):
+        entry = self._by_user.pop(user, None)
+        if entry is None:
+            return None
+        q = self._queues.get(entry.key)
+        if q is not None:
+            try:
+                q.remove(entry)
+            except ValueError:
+                pass
+            if not q:
+                self._queues.pop(entry.key, None)
+        return entry
+
+    def leave(self, user=None, entry=None, result: dict = None) -> bool:
+        """
+        取消排隊（entry 有給時只有它還在隊伍裡才取消，避免把同一個人新排的那筆取消掉）；
+        已經被湊成一組的回傳 False
+        """
+        with self._lock:
+            if entry is not None:
+                if self._by_user.get(entry.user) is not entry:
+                    return False
+                user = entry.user
+            removed = self._remove_locked(user)
+            if removed is not None:
+                self._stats["cancelled"] += 1
+        if removed is None:
+            return False
+        removed.resolve(result or {"event": "match_cancelled", "error": "已取消排隊"})
+        return True
+
+    def position(self, entry) -> int:
+        with self._lock:
+            q = self._queues.get(entry.key) or ()
+            for i, e in enumerate(q):
+                if e is entry:
+                    return i + 1
+            return 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            s = dict(self._stats)
+            s["waiting"] = {_key_str(k): len(q) for k, q in self._queues.items()}
+        s["avg_wait_ms"] = round(s.pop("wait_ms_total") / s["matched"], 1) if s["matched"] else None
+        return s
+
+
+class WarmPool:
+    """
+    spawn(key) -> server 或 None；alive(server) -> bool；kill(server)
+    size 每個 key 保持幾個（0 = 不預熱）；ttl 秒沒被拿走就收掉
+    """
+
+    def __init__(self, spawn, alive, kill, size: int = 1, ttl: float = 600.0):
+        self.spawn, self.alive, self.kill = spawn, alive, kill
+        self.size = size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._ready = {}        # key -> [(建立時間, server)]
+        self._filling = set()   # 正在補貨的 key
+        self._stats = {"hits": 0, "misses": 0, "spawned": 0, "expired": 0}
+
+    def take(self, key):
+        """拿一個活著的預熱 server；沒有就回傳 None（呼叫端自己現開）"""
+        dead = []
+        server = None
+        with self._lock:
+            ready = self._ready.get(key) or []
+            while ready:
+                _, s = ready.pop(0)
+                if self.alive(s):
+                    server = s
+                    break
+                dead.append(s)
+            self._stats["hits" if server is not None else "misses"] += 1
+        for s in dead:
+            self.kill(s)
+        return server
+
+    def refill(self, key):
+        """背景把 key 補到 size 個（同一個 key 同時只會有一個補貨 thread）"""
+        if self.size <= 0:
+            return
+        with self._lock:
+            if key in self._filling or len(self._ready.get(key) or []) >= self.size:
+                return
+            self._filling.add(key)
+        threading.Thread(target=self._fill, args=(key,), name="warm-pool", daemon=True).start()
+
+    def _fill(self, key):
+        try:
+            while True:
+                with self._lock:
+                    if len(self._ready.get(key) or []) >= self.size:
+                        return
+                s = self.spawn(key)
+                if s is None:
+                    return
+                with self._lock:
+                    self._ready.setdefault(key, []).append((time.monotonic(), s))
+                    self._stats["spawned"] += 1
+        except Exception as e:
+            log.exception("預熱遊戲 server 失敗", key=_key_str(key), error=str(e))
+        finally:
+            with self._lock:
+                self._filling.discard(key)
+
+    def prune(self):
+        """收掉死掉的 / 放太久的（定期呼叫）"""
+        now = time.monotonic()
+        drop = []
+        with self._lock:
+            for key, ready in list(self._ready.items()):
+                keep = []
+                for born, s in ready:
+                    if now - born > self.ttl or not self.alive(s):
+                        drop.append(s)
+                        self._stats["expired"] += 1
+                    else:
+                        keep.append((born, s))
+                if keep:
+                    self._ready[key] = keep
+                else:
+                    del self._ready[key]
+        for s in drop:
+            self.kill(s)
+
+    def close(self):
+        with self._lock:
+            servers = [s for ready in self._ready.values() for _, s in ready]
+            self._ready.clear()
+        for s in servers:
+            self.kill(s)
+
+    def stats(self) -> dict:
+        with self._lock:
+            s = dict(self._stats)
+            s["ready"] = {_key_str(k): len(v) for k, v in self._ready.items()}
+        return s
@@ -0,0 +1,307 @@
+# common/metrics.py
+# 請求層級的效能指標（lobby / dev server 共用）：
+#   - 每個 kind 的處理時間 histogram、請求 / 回應位元組、結果計數（ok / rejected / exception）
+#   - common.db 的等鎖時間與 load / save 本身花的時間，也依「當下在處理哪個 kind」分開記
+# 「當下在處理哪個 kind」放在 thread-local：_handle_conn 進入 track() 後，
+# 同一條 thread 裡呼叫到的 db.load / db.save 都會記到這個 kind 底下。
+#
+# 讀取方式：
+#   - admin kind "metrics"（只接受本機連線，或帶 admin_key = 環境變數 ADMIN_KEY）
+#   - start_http_server(port)：本機的 Prometheus 文字格式端點 GET /metrics
+import os, threading, time
+from contextlib import contextmanager
+
+# 秒
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# 位元組
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+MAX_KINDS = 64              # 亂送的 kind 不能把 label 撐爆，超過就併成 "other"
+UNSCOPED = "-"              # 不在任何請求裡的 db 呼叫（例如背景 thread 忘了設 scope）
+PREFIX = "gamestore"
+ADMIN_KEY = os.getenv("ADMIN_KEY") or None
+
+_local = threading.local()
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+class Histogram:
+    """固定 bucket 的 histogram（非累積計數，輸出時再累加）"""
+
+    __slots__ = ("bounds", "counts", "count", "sum")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)   # 最後一格是 +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, v: float):
+        i = 0
+        for b in self.bounds:
+            if v <= b:
+                break
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += v
+
+    def quantile(self, q: float):
+        """從 bucket 線性內插估計百分位數（落在 +Inf 那格就回傳最後一個邊界）"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for i, c in enumerate(self.counts):
+            if c and seen + c >= rank:
+                if i >= len(self.bounds):
+                    return self.bounds[-1]
+                upper = self.bounds[i]
+                return lower + (upper - lower) * (rank - seen) / c
+            seen += c
+            if i < len(self.bounds):
+                lower = self.bounds[i]
+        return self.bounds[-1]
+
+    def snapshot(self, scale: float = 1.0, digits: int = 3) -> dict:
+        pick = lambda q: None if self.quantile(q) is None else round(self.quantile(q) * scale, digits)
+        return {"count": self.count, "sum": round(self.sum * scale, digits),
+                "p50": pick(0.50), "p90": pick(0.90), "p99": pick(0.99)}
+
+
+class KindMetrics:
+    __slots__ = ("latency", "req_bytes", "resp_bytes", "outcomes", "db")
+
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.req_bytes = Histogram(SIZE_BUCKETS)
+        self.resp_bytes = Histogram(SIZE_BUCKETS)
+        self.outcomes = {"ok": 0, "rejected": 0, "exception": 0}
+        self.db = {}    # op -> (lock wait histogram, op histogram)
+
+
+class Registry:
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.time()
+        self.inflight = 0
+        self._kinds = {}
+        self._lock = threading.Lock()
+
+    def _kind(self, kind) -> KindMetrics:
+        kind = str(kind) if kind is not None else "none"
+        km = self._kinds.get(kind)
+        if km is None:
+            if len(self._kinds) >= MAX_KINDS:
+                kind = "other"
+                km = self._kinds.get(kind)
+            if km is None:
+                km = self._kinds[kind] = KindMetrics()
+        return km
+
+    def observe_request(self, kind, seconds: float, req_bytes: int, resp_bytes: int, outcome: str):
+        with self._lock:
+            km = self._kind(kind)
+            km.latency.observe(seconds)
+            km.req_bytes.observe(req_bytes)
+            if resp_bytes is not None:
+                km.resp_bytes.observe(resp_bytes)
+            km.outcomes[outcome] = km.outcomes.get(outcome, 0) + 1
+
+    def observe_db(self, kind, op: str, waited: float, held: float):
+        with self._lock:
+            km = self._kind(kind)
+            pair = km.db.get(op)
+            if pair is None:
+                pair = km.db[op] = (Histogram(LATENCY_BUCKETS), Histogram(LATENCY_BUCKETS))
+            pair[0].observe(waited)
+            pair[1].observe(held)
+
+    @contextmanager
+    def track(self, kind, req_bytes: int):
+        """包住一次請求的處理；呼叫 done(resp, resp_bytes) 記結果，沒呼叫就當成 exception"""
+        result = {}
+
+        def done(resp, resp_bytes=None):
+            result["outcome"] = "ok" if isinstance(resp, dict) and resp.get("ok") else "rejected"
+            result["bytes"] = resp_bytes
+
+        prev = getattr(_local, "scope", None)
+        _local.scope = (self, kind)
+        with self._lock:
+            self.inflight += 1
+        t0 = time.perf_counter()
+        try:
+            yield done
+        finally:
+            elapsed = time.perf_counter() - t0
+            _local.scope = prev
+            with self._lock:
+                self.inflight -= 1
+            self.observe_request(kind, elapsed, req_bytes, result.get("bytes"),
+                                 result.get("outcome", "exception"))
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            kinds = {}
+            total_sec = sum(km.latency.sum for km in self._kinds.values()) or 1.0
+            for kind, km in sorted(self._kinds.items()):
+                db_stats = {}
+                for op, (wait_h, op_h) in sorted(km.db.items()):
+                    db_stats[op] = {"lock_wait_ms": wait_h.snapshot(1000), "op_ms": op_h.snapshot(1000)}
+                kinds[kind] = {
+                    "requests": km.latency.count,
+                    "outcomes": dict(km.outcomes),
+                    "latency_ms": km.latency.snapshot(1000),
+                    "time_share": round(km.latency.sum / total_sec, 4),
+                    "request_bytes": km.req_bytes.snapshot(1, 0),
+                    "response_bytes": km.resp_bytes.snapshot(1, 0),
+                    "db": db_stats,
+                }
+            return {"server": self.name, "uptime_sec": round(time.time() - self.started, 1),
+                    "inflight": self.inflight, "kinds": kinds}
+
+    def reset(self):
+        with self._lock:
+            self._kinds.clear()
+            self.started = time.time()
+
+
+def registry(name: str) -> Registry:
+    with _registries_lock:
+        reg = _registries.get(name)
+        if reg is None:
+            reg = _registries[name] = Registry(name)
+        return reg
+
+
+@contextmanager
+def scope(reg: Registry, kind: str):
+    """背景 thread 用：讓這段期間的 db 呼叫記到 (reg, kind) 底下"""
+    prev = getattr(_local, "scope", None)
+    _local.scope = (reg, kind)
+    try:
+        yield
+    finally:
+        _local.scope = prev
+
+
+def record_db(op: str, waited: float, held: float):
+    """common.db 呼叫：記到目前 thread 所在的請求底下"""
+    reg, kind = getattr(_local, "scope", None) or (registry("process"), UNSCOPED)
+    reg.observe_db(kind, op, waited, held)
+
+
+def admin_allowed(addr, payload: dict) -> bool:
+    """admin kind 只給本機連線，或帶正確 admin_key 的請求"""
+    if ADMIN_KEY and payload.get("admin_key") == ADMIN_KEY:
+        return True
+    host = addr[0] if isinstance(addr, tuple) and addr else ""
+    return host in ("127.0.0.1", "::1", "localhost")
+
+
+def handle_metrics(reg: Registry, payload: dict, addr) -> dict:
+    """admin kind "metrics"：format=json（預設）/ prometheus，reset=true 會在讀完後歸零"""
+    if not admin_allowed(addr, payload):
+        return {"ok": False, "error": "沒有權限", "code": "FORBIDDEN"}
+    if payload.get("format") == "prometheus":
+        resp = {"ok": True, "text": render_prometheus([reg])}
+    else:
+        resp = {"ok": True, "metrics": reg.snapshot()}
+    if payload.get("reset"):
+        reg.reset()
+    return resp
+
+
+# ----------------- Prometheus 文字格式 ----------------- #
+
+def _fmt_le(b) -> str:
+    return repr(float(b)) if not isinstance(b, int) else str(b)
+
+
+def _histogram_lines(name: str, labels: str, h: Histogram) -> list:
+    lines = []
+    cum = 0
+    for b, c in zip(h.bounds, h.counts):
+        cum += c
+        lines.append(f'{name}_bucket{{{labels},le="{_fmt_le(b)}"}} {cum}')
+    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {h.count}')
+    lines.append(f"{name}_sum{{{labels}}} {h.sum}")
+    lines.append(f"{name}_count{{{labels}}} {h.count}")
+    return lines
+
+
+def _esc(v) -> str:
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render_prometheus(regs=None) -> str:
+    regs = list(_registries.values()) if regs is None else regs
+    series = {
+        "requests_total": ("counter", "Requests handled, by kind and outcome", []),
+        "request_duration_seconds": ("histogram", "Handler latency", []),
+        "request_bytes": ("histogram", "Request line size", []),
+        "response_bytes": ("histogram", "Response line size", []),
+        "db_lock_wait_seconds": ("histogram", "Time waiting for the common.db lock", []),
+        "db_op_seconds": ("histogram", "Time spent inside db.load / db.save", []),
+        "inflight_requests": ("gauge", "Requests currently being handled", []),
+    }
+    for reg in regs:
+        with reg._lock:
+            srv = f'server="{_esc(reg.name)}"'
+            series["inflight_requests"][2].append(f"{PREFIX}_inflight_requests{{{srv}}} {reg.inflight}")
+            for kind, km in sorted(reg._kinds.items()):
+                base = f'{srv},kind="{_esc(kind)}"'
+                for outcome, n in km.outcomes.items():
+                    series["requests_total"][2].append(
+                        f'{PREFIX}_requests_total{{{base},outcome="{outcome}"}} {n}')
+                hist = (("request_duration_seconds", km.latency), ("request_bytes", km.req_bytes),
+                        ("response_bytes", km.resp_bytes))
+                for name, h in hist:
+                    series[name][2].extend(_histogram_lines(f"{PREFIX}_{name}", base, h))
+                for op, (wait_h, op_h) in sorted(km.db.items()):
+                    labels = f'{base},op="{op}"'
+                    series["db_lock_wait_seconds"][2].extend(
+                        _histogram_lines(f"{PREFIX}_db_lock_wait_seconds", labels, wait_h))
+                    series["db_op_seconds"][2].extend(_histogram_lines(f"{PREFIX}_db_op_seconds", labels, op_h))
+
+    out = []
+    for name, (typ, help_text, lines) in series.items():
+        out.append(f"# HELP {PREFIX}_{name} {help_text}")
+        out.append(f"# TYPE {PREFIX}_{name} {typ}")
+        out.extend(lines)
+    return "\n".join(out) + "\n"
+
+
+_http_server = None
+
+
+def start_http_server(port: int, host: str = "127.0.0.1"):
+    """本機 Prometheus 端點（GET /metrics），重複呼叫只會啟動一次"""
+    global _http_server
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class _Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    with _registries_lock:
+        if _http_server is not None:
+            return _http_server
+        _http_server = ThreadingHTTPServer((host, port), _Handler)
+    threading.Thread(target=_http_server.serve_forever, daemon=True).start()
+    print(f"[Metrics] Prometheus endpoint on http://{host}:{_http_server.server_address[1]}/metrics", flush=True)
+    return _http_server
@@ -0,0 +1,230 @@
+# common/passwords.py
+# 密碼雜湊（lobby / dev server 共用）：
+#   - hashlib.scrypt，每個帳號自己的 salt 與參數，存成
+#       "scrypt$<n>$<r>$<p>$<salt>$<hash>"（salt / hash 為 base64）
+#     之後調高成本也不影響舊帳號，登入成功時發現參數舊了再順便重算（needs_rehash）
+#   - scrypt 一次要幾十 ms CPU，放到有上限的 process pool 算，request thread 只是等結果，
+#     不會卡住其他請求的 GIL；排隊中的工作超過 MAX_PENDING 就直接拒絕（PasswordBusy → OVERLOADED）
+#   - 舊資料的明文 "password" 欄位：verify 照樣比對，登入成功後改存 "password_hash"
+#
+# 環境變數：PASSWORD_SCRYPT_N（預設 2**14）、PASSWORD_SCRYPT_R（8）、PASSWORD_SCRYPT_P（1）、
+#          PASSWORD_WORKERS（預設 min(4, CPU 數)）、PASSWORD_MAX_PENDING（預設 64）
+#
+# 調成本：python -m common.passwords --login-rate 50（在 server/ 底下執行）
+import atexit, base64, hashlib, hmac, multiprocessing, os, threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+SCHEME = "scrypt"
+N = int(os.getenv("PASSWORD_SCRYPT_N", str(2 ** 14)))
+R = int(os.getenv("PASSWORD_SCRYPT_R", "8"))
+P = int(os.getenv("PASSWORD_SCRYPT_P", "1"))
+SALT_BYTES = 16
+DKLEN = 32
+WORKERS = int(os.getenv("PASSWORD_WORKERS", "0")) or min(4, os.cpu_count() or 1)
+MAX_PENDING = int(os.getenv("PASSWORD_MAX_PENDING", "64"))
+
+_pool = None
+_pool_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(MAX_PENDING)
+
+
+class PasswordBusy(Exception):
+    """雜湊工作排隊太多，呼叫端應回 OVERLOADED"""
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    # maxmem：OpenSSL 預設上限 32MB，n / r 調高時要跟著放寬
+    return hashlib.scrypt(password.encode("utf-8"), salt=salt, n=n, r=r, p=p,
+                          dklen=DKLEN, maxmem=256 * n * r + (1 << 20))
+
+
+def _b64(b: bytes) -> str:
+    return base64.b64encode(b).decode("ascii")
+
+
+def hash_password_sync(password: str, n: int = None, r: int = None, p: int = None) -> str:
+    n, r, p = n or N, r or R, p or P
+    salt = os.urandom(SALT_BYTES)
+    return f"{SCHEME}${n}${r}${p}${_b64(salt)}${_b64(_scrypt(password, salt, n, r, p))}"
+
+
+def verify_password_sync(password: str, stored: str) -> bool:
+    try:
+        scheme, n, r, p, salt, want = stored.split("$")
+        if scheme != SCHEME:
+            return False
+        got = _scrypt(password, base64.b64decode(salt), int(n), int(r), int(p))
+        return hmac.compare_digest(got, base64.b64decode(want))
+    except (ValueError, TypeError):
+        return False
+
+
+def needs_rehash(stored: str) -> bool:
+    try:
+        scheme, n, r, p, _, _ = stored.split("$")
+        return scheme != SCHEME or (int(n), int(r), int(p)) != (N, R, P)
+    except (ValueError, AttributeError):
+        return True
+
+
+# ----------------- worker pool ----------------- #
+
+def _thread_pool():
+    # 沒辦法開子行程的環境：退回 thread（hashlib.scrypt 計算時會放掉 GIL）
+    return ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="pwhash")
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                try:
+                    # spawn：server 本身是多 thread 的，fork 可能把別的 thread 握著的鎖一起複製過去
+                    # （spawn 的子行程會重新 import 主程式，主程式要有 if __name__ == "__main__"）
+                    _pool = ProcessPoolExecutor(max_workers=WORKERS, mp_context=multiprocessing.get_context("spawn"))
+                except (OSError, NotImplementedError, ImportError):
+                    _pool = _thread_pool()
+                atexit.register(_pool.shutdown, wait=False)
+    return _pool
+
+
+def _fallback_to_threads(broken):
+    global _pool
+    with _pool_lock:
+        if _pool is broken:
+            _pool = _thread_pool()
+            atexit.register(_pool.shutdown, wait=False)
+
+
+def warm_up():
+    """server 啟動時先把 worker 開好，第一個登入的人不用等子行程啟動"""
+    try:
+        _get_pool().submit(needs_rehash, "").result()
+    except Exception:
+        pass
+
+
+def _run(fn, *args):
+    if not _slots.acquire(blocking=False):
+        raise PasswordBusy()
+    try:
+        pool = _get_pool()
+        try:
+            return pool.submit(fn, *args).result()
+        except BrokenProcessPool:
+            # worker 起不來（例如主程式沒有 __main__ 保護）：改用 thread 重算一次
+            _fallback_to_threads(pool)
+            return _get_pool().submit(fn, *args).result()
+    finally:
+        _slots.release()
+
+
+def hash_password(password: str) -> str:
+    """在 worker pool 算雜湊（會等結果；排隊太多時丟 PasswordBusy）"""
+    return _run(hash_password_sync, password)
+
+
+def check_user(rec: dict, password: str):
+    """
+    驗證帳號紀錄 rec 的密碼，回傳 (是否正確, 要寫回的新雜湊或 None)
+      - rec["password_hash"]：scrypt 驗證；參數過時則順便重算
+      - rec["password"]（舊的明文）：直接比對，正確就算出新雜湊讓呼叫端寫回
+    """
+    stored = rec.get("password_hash")
+    if stored:
+        if not _run(verify_password_sync, password, stored):
+            return False, None
+        return True, (hash_password(password) if needs_rehash(stored) else None)
+
+    plain = rec.get("password")
+    if plain is None or not hmac.compare_digest(str(plain).encode("utf-8"), password.encode("utf-8")):
+        return False, None
+    return True, hash_password(password)
+
+
+def set_password(rec: dict, hashed: str):
+    rec["password_hash"] = hashed
+    rec.pop("password", None)
+
+
+def register_user(users_file: str, username: str, password: str) -> bool:
+    """新增帳號（雜湊在 db 鎖外面算）；帳號已存在回傳 False"""
+    from common import db
+    if username in db.load(users_file, {}):
+        return False
+    hashed = hash_password(password)
+    users = db.load(users_file, {})
+    if username in users:
+        return False
+    users[username] = {"password_hash": hashed}
+    db.save(users_file, users)
+    return True
+
+
+def login_user(users_file: str, username: str, password: str) -> bool:
+    """驗證帳密；舊的明文 / 過時參數在登入成功時順便換成新雜湊"""
+    from common import db
+    rec = db.load(users_file, {}).get(username)
+    if not isinstance(rec, dict):
+        return False
+    ok, new_hash = check_user(rec, password)
+    if ok and new_hash:
+        # 算雜湊的這段時間裡檔案可能被改過，重新讀一次只改這個帳號
+        users = db.load(users_file, {})
+        if isinstance(users.get(username), dict):
+            set_password(users[username], new_hash)
+            db.save(users_file, users)
+    return ok
+
+
+# ----------------- 成本調整 ----------------- #
+
+def _bench(args):
+    import time
+    from concurrent.futures import wait
+
+    print(f"[PwBench] workers={args.workers}  target={args.login_rate} logins/s  budget={args.max_ms} ms")
+    print(f"[PwBench] {'n':>8} {'r':>3} {'mem MB':>7} {'ms/hash':>8} {'max/s':>8}  verdict")
+    pick = None
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        pool.submit(hash_password_sync, "warmup", 2 ** 10, 8, 1).result()
+        for log_n in range(args.min_log_n, args.max_log_n + 1):
+            n = 2 ** log_n
+            t0 = time.perf_counter()
+            for _ in range(args.rounds):
+                hash_password_sync("benchmark-password", n, args.r, 1)
+            ms = (time.perf_counter() - t0) / args.rounds * 1000
+
+            # 整個 pool 全速跑的吞吐量
+            jobs = args.rounds * args.workers
+            t0 = time.perf_counter()
+            wait([pool.submit(hash_password_sync, "benchmark-password", n, args.r, 1) for _ in range(jobs)])
+            per_sec = jobs / (time.perf_counter() - t0)
+
+            ok = ms <= args.max_ms and per_sec >= args.login_rate * args.headroom
+            if ok:
+                pick = n
+            mem = 128 * n * args.r / 2 ** 20
+            print(f"[PwBench] {n:>8} {args.r:>3} {mem:>7.1f} {ms:>8.1f} {per_sec:>8.1f}  {'ok' if ok else '-'}")
+
+    if pick:
+        print(f"[PwBench] 建議 PASSWORD_SCRYPT_N={pick} PASSWORD_SCRYPT_R={args.r}（目前 {N}/{R}）")
+    else:
+        print("[PwBench] 沒有符合條件的參數，請增加 workers 或降低 login rate")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="依預期的登入速率挑 scrypt 成本")
+    ap.add_argument("--login-rate", type=float, default=20.0, help="尖峰時每秒登入 / 註冊次數")
+    ap.add_argument("--headroom", type=float, default=2.0, help="吞吐量要是 login rate 的幾倍")
+    ap.add_argument("--max-ms", type=float, default=100.0, help="單次雜湊可接受的延遲上限")
+    ap.add_argument("--workers", type=int, default=WORKERS)
+    ap.add_argument("--r", type=int, default=R)
+    ap.add_argument("--min-log-n", type=int, default=12)
+    ap.add_argument("--max-log-n", type=int, default=17)
+    ap.add_argument("--rounds", type=int, default=5)
+    _bench(ap.parse_args())
@@ -0,0 +1,150 @@
+# common/ratelimit.py
+# 限流 / 准入控制（以 common.dispatch 的 middleware 掛上去）：
+#   - KeyedLimiter：每個 (key, kind) 一個 token bucket，key 是來源 IP 或登入的使用者
+#       rules = {"*": [每秒, burst], "create_room": [0.2, 2], "list_rooms": None, ...}
+#       "*" 是沒特別列出的 kind 的預設值；None / 0 代表這個 kind 不限
+#   - InflightCap：某些 kind 同時進行中的數量上限（例如 create_room 會 Popen 遊戲 server）
+#   - 超過就立刻回錯誤，不排隊等待：
+#       RATE_LIMITED  這個 IP / 使用者打太快了（附 retry_after_ms）
+#       OVERLOADED    整台機器忙不過來，請稍後再試
+import threading, time
+
+from common.dispatch import Request
+
+
+def rate_limited(retry_after: float):
+    return {"ok": False, "error": "請求太頻繁，請稍後再試", "code": "RATE_LIMITED",
+            "retry_after_ms": int(retry_after * 1000) + 1}
+
+
+def overloaded(msg: str = "伺服器忙碌中，請稍後再試"):
+    return {"ok": False, "error": msg, "code": "OVERLOADED"}
+
+
+class KeyedLimiter:
+    """每個 (key, kind) 一個 token bucket；bucket 只在被用到時補 token"""
+
+    MAX_KEYS = 50000
+
+    def __init__(self, name: str, rules: dict, exempt=()):
+        self.name = name
+        self.rules = {}
+        for kind, rule in (rules or {}).items():
+            if rule and float(rule[0]) > 0:
+                self.rules[kind] = (float(rule[0]), float(rule[1]) if len(rule) > 1 else max(1.0, float(rule[0])))
+            else:
+                self.rules[kind] = None
+        self.default = self.rules.pop("*", None)
+        self.exempt = set(exempt)
+        self.rejected = 0
+        self._buckets = {}  # (key, kind) -> [tokens, last]
+        self._lock = threading.Lock()
+
+    def rule(self, kind):
+        return self.rules.get(kind, self.default)
+
+    def take(self, key, kind) -> float:
+        """拿一個 token；成功回傳 0，失敗回傳還要等幾秒"""
+        if key is None or key in self.exempt:
+            return 0.0
+        rule = self.rule(kind)
+        if rule is None:
+            return 0.0
+        rate, burst = rule
+        bkey = (key, kind)
+        now = time.monotonic()
+        with self._lock:
+            b = self._buckets.get(bkey)
+            if b is None:
+                if len(self._buckets) >= self.MAX_KEYS:
+                    self._prune(now)
+                b = self._buckets[bkey] = [burst, now]
+            tokens = min(burst, b[0] + (now - b[1]) * rate)
+            b[1] = now
+            if tokens < 1.0:
+                b[0] = tokens
+                self.rejected += 1
+                return (1.0 - tokens) / rate
+            b[0] = tokens - 1.0
+            return 0.0
+
+    def _prune(self, now):
+        """丟掉已經補滿的 bucket（等同沒建立過）；還是太多就全部重來"""
+        for bkey, (tokens, last) in list(self._buckets.items()):
+            rule = self.rule(bkey[1])
+            if rule is None or tokens + (now - last) * rule[0] >= rule[1]:
+                del self._buckets[bkey]
+        if len(self._buckets) >= self.MAX_KEYS:
+            self._buckets.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"keys": len(self._buckets), "rejected": self.rejected}
+
+
+class InflightCap:
+    """同時進行中的請求數上限；滿了直接拒絕（不等待）"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.inflight = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def try_enter(self) -> bool:
+        with self._lock:
+            if self.limit and self.inflight >= self.limit:
+                self.rejected += 1
+                return False
+            self.inflight += 1
+            return True
+
+    def leave(self):
+        with self._lock:
+            self.inflight -= 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"limit": self.limit, "inflight": self.inflight, "rejected": self.rejected}
+
+
+# ----------------- middleware ----------------- #
+
+def _client_ip(req: Request):
+    return req.addr[0] if isinstance(req.addr, tuple) and req.addr else None
+
+
+def limit_by_ip(limiter: KeyedLimiter):
+    """stage="pre"：還沒驗 token 就先依來源 IP 擋掉（連 verify_token 都省下來）"""
+    def mw(req, call_next):
+        wait = limiter.take(_client_ip(req), req.kind)
+        if wait:
+            return rate_limited(wait)
+        return call_next(req)
+    return mw
+
+
+def limit_by_user(limiter: KeyedLimiter):
+    """stage="post"：驗證過後依登入的使用者限流（未登入的 kind 沒有 req.user，不受影響）"""
+    def mw(req, call_next):
+        wait = limiter.take(req.user, req.kind)
+        if wait:
+            return rate_limited(wait)
+        return call_next(req)
+    return mw
+
+
+def cap_inflight(kinds, cap: InflightCap, msg: str = None):
+    """只對指定的 kind 計數；stage="post" 時，驗證失敗的請求不會占用名額"""
+    kinds = frozenset(kinds)
+
+    def mw(req, call_next):
+        if req.kind not in kinds:
+            return call_next(req)
+        if not cap.try_enter():
+            return overloaded(msg) if msg else overloaded()
+        try:
+            return call_next(req)
+        finally:
+            cap.leave()
+    return mw
@@ -0,0 +1,166 @@
+# common/reviews.py
+# 遊戲評論（lobby / dev server 共用）：
+#   - 評論本文放在各遊戲自己的檔案 data/reviews/<遊戲>.json（{user: {rating, text, ts}}），
+#     不再塞在 games.json 裡 → 列表 / 詳細頁 / 上傳都不用跟著讀寫所有評論
+#   - games.json 只留彙總 g["rating"] = {"count", "sum", "hist": {"1".."5"}}，
+#     新增 / 修改評論時增量更新（改評論先扣掉舊分數），不用每次重算全部
+#     avg_rating / review_count 兩個舊欄位照樣維護，舊 client 不受影響
+#   - 評論查詢分頁：page(game, sort, offset, limit)，sort = recent / rating_desc / rating_asc；
+#     排好序的索引快取在記憶體，只有那個遊戲有新評論時才重排
+#   - 詳細頁只帶彙總 + 最新 PREVIEW 則（preview），大小與評論數無關
+import threading, time
+from urllib.parse import quote
+
+from common import db
+
+REVIEWS_DIR = "reviews"
+PREVIEW = 5
+MAX_PAGE = 50
+SORTS = ("recent", "rating_desc", "rating_asc")
+
+_lock = threading.RLock()   # 評論檔 + games.json 彙總一起改，避免兩個人同時評分互相蓋掉
+_index = {}                 # game -> {sort: [(user, review), ...]}
+
+
+def _file(game: str) -> str:
+    return f"{REVIEWS_DIR}/{quote(game, safe='')}.json"
+
+
+def _save(game: str, revs: dict):
+    # DATA_DIR 可能在 import 之後才被換掉（loadgen），寫的時候再建資料夾
+    (db.DATA_DIR / REVIEWS_DIR).mkdir(parents=True, exist_ok=True)
+    db.save(_file(game), revs)
+
+
+def empty_summary() -> dict:
+    return {"count": 0, "sum": 0, "hist": {str(i): 0 for i in range(1, 6)}}
+
+
+def _add(summary: dict, rating: int, sign: int = 1):
+    summary["count"] += sign
+    summary["sum"] += sign * rating
+    key = str(rating)
+    summary["hist"][key] = summary["hist"].get(key, 0) + sign
+
+
+def summarize(reviews: dict) -> dict:
+    s = empty_summary()
+    for rv in reviews.values():
+        try:
+            _add(s, int(rv.get("rating")))
+        except (TypeError, ValueError):
+            pass
+    return s
+
+
+def summary_fields(g: dict) -> dict:
+    """詳細頁 / 我的遊戲用的彙總欄位"""
+    s = g.get("rating") or empty_summary()
+    n = s.get("count", 0)
+    return {
+        "avg_rating": round(s["sum"] / n, 2) if n else None,
+        "review_count": n,
+        "rating_histogram": dict(s.get("hist") or {}),
+    }
+
+
+def load(game: str) -> dict:
+    revs = db.load(_file(game), {})
+    return revs if isinstance(revs, dict) else {}
+
+
+def put(games_file: str, game: str, user: str, rating: int, text: str):
+    """新增 / 更新 user 對 game 的評論；回傳更新後的 summary_fields，遊戲不存在回傳 None"""
+    with _lock:
+        games = db.load(games_file, {})
+        g = games.get(game)
+        if g is None:
+            return None
+
+        revs = load(game)
+        old = revs.get(user)
+        summary = g.get("rating") or summarize(revs)
+        if old is not None:
+            try:
+                _add(summary, int(old.get("rating")), -1)
+            except (TypeError, ValueError):
+                pass
+        _add(summary, rating)
+
+        revs[user] = {"rating": rating, "text": text, "ts": int(time.time())}
+        _save(game, revs)
+
+        g["rating"] = summary
+        g.update({k: v for k, v in summary_fields(g).items() if k != "rating_histogram"})
+        db.save(games_file, games)
+        _index.pop(game, None)
+        return summary_fields(g)
+
+
+def _sorted(game: str, sort: str) -> list:
+    with _lock:
+        idx = _index.get(game)
+        if idx is None:
+            idx = _index[game] = {}
+        items = idx.get(sort)
+        if items is None:
+            items = list(load(game).items())
+            if sort == "recent":
+                items.sort(key=lambda kv: kv[1].get("ts") or 0, reverse=True)
+            else:
+                # 同分的新評論排前面
+                sign = 1 if sort == "rating_asc" else -1
+                items.sort(key=lambda kv: (sign * (kv[1].get("rating") or 0), -(kv[1].get("ts") or 0)))
+            idx[sort] = items
+        return items
+
+
+def page(game: str, sort: str = "recent", offset: int = 0, limit: int = 10) -> dict:
+    """一頁評論：{"reviews": [{user, rating, text, ts}, ...], "total", "next_offset"（沒有下一頁為 None）}"""
+    if sort not in SORTS:
+        sort = "recent"
+    offset = max(0, int(offset or 0))
+    limit = max(1, min(MAX_PAGE, int(limit or 10)))
+    items = _sorted(game, sort)
+    chunk = items[offset:offset + limit]
+    end = offset + len(chunk)
+    return {
+        "sort": sort,
+        "offset": offset,
+        "total": len(items),
+        "next_offset": end if end < len(items) else None,
+        "reviews": [{"user": u, "rating": rv.get("rating"), "text": rv.get("text", ""), "ts": rv.get("ts")}
+                    for u, rv in chunk],
+    }
+
+
+def preview(game: str) -> dict:
+    """最新 PREVIEW 則，{user: {rating, text, ts}}（沿用舊的 reviews 欄位格式）"""
+    return {r["user"]: {"rating": r["rating"], "text": r["text"], "ts": r["ts"]}
+            for r in page(game, "recent", 0, PREVIEW)["reviews"]}
+
+
+def migrate(games_file: str) -> int:
+    """把 games.json 裡舊的內嵌 reviews 搬到評論檔並補上彙總（啟動時呼叫，重複呼叫無害）；回傳搬了幾個遊戲"""
+    with _lock:
+        games = db.load(games_file, {})
+        moved = 0
+        for game, g in games.items():
+            if not isinstance(g, dict):
+                continue
+            inline = g.pop("reviews", None)
+            if inline is None and "rating" in g:
+                continue
+            revs = load(game)
+            if isinstance(inline, dict):
+                for user, rv in inline.items():
+                    if isinstance(rv, dict) and user not in revs:
+                        revs[user] = rv
+                _save(game, revs)
+            g["rating"] = summarize(revs)
+            g.update({k: v for k, v in summary_fields(g).items() if k != "rating_histogram"})
+            _index.pop(game, None)
+            moved += 1
+        if moved:
+            db.save(games_file, games)
+        return moved
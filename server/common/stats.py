@@ -0,0 +1,271 @@
+# common/stats.py
+# 對局統計 / 排行榜（lobby 用）：
+#   - 事件記錄：每個遊戲一個只會 append 的 data/stats/<遊戲>.log，一行一個精簡的 JSON 事件
+#       {"e": "s", "t": 時間, "room": 房號, "v": 版本, "p": [玩家, ...]}                    對局開始
+#       {"e": "f", "t": ..., "room": ..., "r": 結束原因, "w": 贏家, "d": 是否平手,
+#        "p": {玩家: [score, lines, maxCombo], ...}}                                         對局結束
+#     開局不再改寫整個 player_users.json，只 append 一行
+#   - 計數器：每個 (遊戲, 玩家) 一組 played / finished / wins / losses / draws /
+#     best_score / total_score / total_lines / best_combo，套用事件時增量更新
+#   - 排行榜：每個 (遊戲, 指標) 一條依 (-值, 玩家) 排好的 list，bisect 增量維護；
+#     前 N 名直接切片，個人名次 bisect 一次，查詢都不用掃歷史
+#   - 啟動：讀 data/stats/snapshot.json（計數器 + 各 log 已套用到的位移），只重播位移之後的事件；
+#     每 SNAPSHOT_EVERY 個事件（以及 flush()）重寫一次 snapshot
+import bisect, json, os, threading, time
+from urllib.parse import quote, unquote
+
+from common import db
+from common.log import get_logger
+
+STATS_DIR = "stats"
+LOG_SUFFIX = ".log"
+SNAPSHOT = f"{STATS_DIR}/snapshot.json"
+SNAPSHOT_EVERY = int(os.getenv("STATS_SNAPSHOT_EVERY", "200"))
+MAX_TOP = 100
+
+COUNTERS = ("played", "finished", "wins", "losses", "draws",
+            "best_score", "total_score", "total_lines", "best_combo")
+BOARDS = ("wins", "played", "best_score", "total_lines", "best_combo")
+
+log = get_logger("stats")
+
+_lock = threading.RLock()
+_loaded = False
+_counters = {}      # game -> {user: {counter: 值}}
+_boards = {}        # game -> {metric: [(-值, user), ...]}
+_offsets = {}       # log 檔名 -> 已套用到的位元組位移
+_since_snapshot = 0
+
+
+def _dir():
+    # DATA_DIR 可能在 import 之後才被換掉（loadgen），用到時再算
+    d = db.DATA_DIR / STATS_DIR
+    d.mkdir(parents=True, exist_ok=True)
+    return d
+
+
+def _log_name(game: str) -> str:
+    return quote(game, safe="") + LOG_SUFFIX
+
+
+# ----------------- 計數器 / 排行榜 ----------------- #
+
+def _board_set(game: str, metric: str, user: str, old: int, new: int):
+    board = _boards.setdefault(game, {}).setdefault(metric, [])
+    if old:
+        i = bisect.bisect_left(board, (-old, user))
+        if i < len(board) and board[i] == (-old, user):
+            del board[i]
+    if new:
+        bisect.insort(board, (-new, user))
+
+
+def _bump(game: str, user: str, changes: dict, sort: bool = True):
+    """changes：counter -> ("+", n) 或 ("max", n)"""
+    c = _counters.setdefault(game, {}).setdefault(user, dict.fromkeys(COUNTERS, 0))
+    for key, (op, n) in changes.items():
+        old = c[key]
+        new = old + n if op == "+" else max(old, n)
+        if new == old:
+            continue
+        c[key] = new
+        if sort and key in BOARDS:
+            _board_set(game, key, user, old, new)
+
+
+def _apply(game: str, ev: dict, sort: bool = True):
+    kind = ev.get("e")
+    if kind == "s":
+        for u in ev.get("p") or []:
+            _bump(game, u, {"played": ("+", 1)}, sort)
+    elif kind == "f":
+        winner, draw = ev.get("w"), ev.get("d")
+        for u, res in (ev.get("p") or {}).items():
+            score, lines, combo = (list(res or []) + [0, 0, 0])[:3]
+            changes = {
+                "finished": ("+", 1),
+                "best_score": ("max", score),
+                "total_score": ("+", score),
+                "total_lines": ("+", lines),
+                "best_combo": ("max", combo),
+            }
+            if winner is not None:
+                changes["wins" if u == winner else "losses"] = ("+", 1)
+            elif draw:
+                changes["draws"] = ("+", 1)
+            _bump(game, u, changes, sort)
+
+
+def _rebuild_boards():
+    _boards.clear()
+    for game, users in _counters.items():
+        boards = _boards[game] = {}
+        for metric in BOARDS:
+            boards[metric] = sorted((-c[metric], u) for u, c in users.items() if c.get(metric))
+
+
+# ----------------- 載入 / snapshot ----------------- #
+
+def _replay(path, start: int) -> int:
+    """從 start 開始套用 path 的事件，回傳套用到的位移；最後一行寫到一半（當機）就截掉"""
+    game = unquote(path.name[:-len(LOG_SUFFIX)])
+    good = start
+    with open(path, "rb+") as f:
+        f.seek(start)
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                _apply(game, json.loads(line), sort=False)
+            except ValueError:
+                log.warning("略過壞掉的事件", file=path.name, offset=good)
+            good += len(line)
+        if f.seek(0, os.SEEK_END) != good:
+            log.warning("截掉寫到一半的事件", file=path.name, offset=good)
+            f.truncate(good)
+    return good
+
+
+def _ensure_loaded():
+    global _loaded
+    if _loaded:
+        return
+    with _lock:
+        if _loaded:
+            return
+        snap = db.load(SNAPSHOT, {})
+        _counters.clear()
+        _counters.update(snap.get("counters") or {})
+        _offsets.clear()
+        _offsets.update(snap.get("offsets") or {})
+        replayed = 0
+        for path in sorted(_dir().glob("*" + LOG_SUFFIX)):
+            start = _offsets.get(path.name, 0)
+            if path.stat().st_size < start:
+                # log 比 snapshot 記得的還短（被手動清掉）：snapshot 不可信，整個重來
+                log.warning("log 比 snapshot 短，重建統計", file=path.name)
+                _counters.clear()
+                _offsets.clear()
+                _loaded = False
+                db.save(SNAPSHOT, {})
+                return _ensure_loaded()
+            _offsets[path.name] = _replay(path, start)
+            replayed += _offsets[path.name] - start
+        _rebuild_boards()
+        _loaded = True
+        log.info("統計載入完成", games=len(_counters), replayed_bytes=replayed)
+
+
+def _snapshot():
+    global _since_snapshot
+    _since_snapshot = 0
+    db.save(SNAPSHOT, {"counters": _counters, "offsets": dict(_offsets)})
+
+
+def load():
+    """lobby 啟動時呼叫（不呼叫的話第一次查詢時才載入）"""
+    _ensure_loaded()
+
+
+def flush():
+    """把目前的計數器寫成 snapshot（結束時呼叫，下次啟動不用重播）"""
+    with _lock:
+        if _loaded:
+            _snapshot()
+
+
+# ----------------- 寫入事件 ----------------- #
+
+def _record(game: str, ev: dict):
+    global _since_snapshot
+    _ensure_loaded()
+    line = (json.dumps(ev, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+    with _lock:
+        path = _dir() / _log_name(game)
+        # 先寫 log 再改記憶體：寫失敗就當作沒發生
+        with open(path, "ab") as f:
+            f.write(line)
+            f.flush()
+            if db.DURABILITY == "fsync":
+                os.fsync(f.fileno())
+        _offsets[path.name] = _offsets.get(path.name, 0) + len(line)
+        _apply(game, ev)
+        _since_snapshot += 1
+        if _since_snapshot >= SNAPSHOT_EVERY:
+            _snapshot()
+
+
+def record_start(game: str, version, room_id, players: list):
+    """對局開始：每個玩家 played + 1"""
+    _record(game, {"e": "s", "t": int(time.time()), "room": room_id, "v": version, "p": list(players)})
+
+
+def record_finish(game: str, room_id, players: list, reason=None, winner=None, results=None):
+    """
+    對局結束。results 是遊戲 server 回報的 [{"username", "score", "lines", "maxCombo"}, ...]；
+    只記 players（這局開始時在房裡的人）裡的帳號。
+    沒有 winner 也沒有 results 時（遊戲沒回報勝負）只算 finished，不算勝負
+    """
+    players = [u for u in players if u]
+    per = {u: [0, 0, 0] for u in players}
+    for r in results or []:
+        u = r.get("username") if isinstance(r, dict) else None
+        if u in per:
+            per[u] = [_int(r.get("score")), _int(r.get("lines")), _int(r.get("maxCombo"))]
+    if winner not in per:
+        winner = None
+    ev = {"e": "f", "t": int(time.time()), "room": room_id, "r": reason, "w": winner,
+          "d": winner is None and bool(results), "p": per}
+    _record(game, ev)
+
+
+def _int(v) -> int:
+    try:
+        return max(0, int(v))
+    except (TypeError, ValueError):
+        return 0
+
+
+# ----------------- 查詢 ----------------- #
+
+def played(user: str, game: str) -> int:
+    """玩過幾局（開局數；舊資料只有結束事件時用完成數）"""
+    _ensure_loaded()
+    with _lock:
+        c = _counters.get(game, {}).get(user) or {}
+        return max(c.get("played", 0), c.get("finished", 0))
+
+
+def player(user: str, game: str = None) -> dict:
+    """{遊戲: 計數器}（指定 game 就只回那一個）"""
+    _ensure_loaded()
+    with _lock:
+        games = [game] if game else list(_counters)
+        return {g: dict(_counters[g][user]) for g in games if user in _counters.get(g, {})}
+
+
+def top(game: str, metric: str = "wins", n: int = 10, user: str = None) -> dict:
+    """前 n 名 [{"rank", "user", "value"}]（同分同名次）；有給 user 時多回傳他的名次（沒上榜為 None）"""
+    _ensure_loaded()
+    n = max(1, min(MAX_TOP, int(n or 10)))
+    with _lock:
+        board = _boards.get(game, {}).get(metric, [])
+        rows, rank = [], 0
+        for i, (v, u) in enumerate(board[:n]):
+            if i == 0 or v != board[i - 1][0]:
+                rank = i + 1
+            rows.append({"rank": rank, "user": u, "value": -v})
+        out = {"metric": metric, "total": len(board), "top": rows}
+        if user is not None:
+            c = _counters.get(game, {}).get(user)
+            value = c.get(metric, 0) if c else 0
+            # (-value,) 排在所有 (-value, user) 前面 → 同分裡的第一個位置
+            out["me"] = {"user": user, "value": value,
+                         "rank": bisect.bisect_left(board, (-value,)) + 1 if value else None}
+        return out
+
+
+def stats() -> dict:
+    with _lock:
+        return {"games": len(_counters), "players": sum(len(u) for u in _counters.values()),
+                "log_bytes": sum(_offsets.values()), "since_snapshot": _since_snapshot}
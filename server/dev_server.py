@@ -1,10 +1,17 @@
 # server/dev_server.py - 完整修正版（含版本驗證 + version_hint + 統一未登入 code + my_games 回饋）
 
-import os, json, base64, socket, threading, time, traceback, zipfile, io, shutil
+import base64, socket, threading, zipfile, io, shutil
 from pathlib import Path
 
 from common import db
 from common import auth
+from common import metrics
+from common import passwords
+from common import reviews
+from common import catalog
+from common.dispatch import Dispatcher, Field, tracing
+from common.ratelimit import overloaded
+from common.log import get_logger
 
 ROOT = Path(__file__).resolve().parents[1]   # 專案根目錄
 SERVER_DIR = Path(__file__).resolve().parent # server/ 資料夾
@@ -13,10 +20,17 @@ DEV_USERS_FILE = "dev_users.json"
 
 UPLOADED_DIR = SERVER_DIR / "uploaded_games"
 
-# ----------------- 統一錯誤回應 ----------------- #
+log = get_logger("dev")
 
-def auth_fail():
-    return {"ok": False, "error": "未登入", "code": "NOT_LOGGED_IN"}
+# 每個 kind 的處理時間 / 位元組 / 錯誤數 / db 等鎖時間（admin kind "metrics" 可讀）
+METRICS = metrics.registry("dev")
+
+# kind → handler / 欄位 schema / 登入需求（見 common/dispatch.py）；
+# 未登入一律回 common.dispatch.auth_fail() 的 NOT_LOGGED_IN
+api = Dispatcher("dev", metrics=METRICS, log=log)
+api.use(tracing(get_logger("dev.trace")), stage="pre")
+
+CREDENTIALS = [Field("username"), Field("password")]
 
 # ----------------- 共用工具：版本處理 ----------------- #
 
@@ -75,25 +89,29 @@ def ensure_user_db():
 
 # ----------------- 帳號相關 ----------------- #
 
-def handle_register(payload):
-    u = payload.get("username","").strip()
-    p = payload.get("password","").strip()
+@api.kind("register", fields=CREDENTIALS)
+def handle_register(req):
+    u = req.args["username"]
+    p = req.args["password"]
     if not u or not p:
         return {"ok": False, "error": "缺少帳號或密碼"}
-    users = db.load(DEV_USERS_FILE, {})
-    if u in users:
+    try:
+        created = passwords.register_user(DEV_USERS_FILE, u, p)
+    except passwords.PasswordBusy:
+        return overloaded()
+    if not created:
         return {"ok": False, "error": "帳號已被使用"}
-    users[u] = {"password": p}
-    db.save(DEV_USERS_FILE, users)
     return {"ok": True, "msg": "註冊成功"}
 
-def handle_login(payload):
-    u = payload.get("username","").strip()
-    p = payload.get("password","").strip()
-    users = db.load(DEV_USERS_FILE, {})
-
-    if u not in users or users[u].get("password") != p:
-        return {"ok": False, "error": "帳號或密碼錯誤"}
+@api.kind("login", fields=CREDENTIALS)
+def handle_login(req):
+    u = req.args["username"]
+    p = req.args["password"]
+    try:
+        if not passwords.login_user(DEV_USERS_FILE, u, p):
+            return {"ok": False, "error": "帳號或密碼錯誤"}
+    except passwords.PasswordBusy:
+        return overloaded()
 
     token = auth.issue_token(u, role="developer")
     if not token:
@@ -107,8 +125,9 @@ def handle_login(payload):
         "msg": "登入成功"
     }
 
-def handle_logout(payload):
-    token = payload.get("token")
+@api.kind("logout")
+def handle_logout(req):
+    token = req.token
     if token:
         auth.revoke_token(token)
     return {"ok": True, "msg": "已登出"}
@@ -127,27 +146,25 @@ def _extract_upload(name, version, zip_b64):
     try:
         with zipfile.ZipFile(io.BytesIO(raw), "r") as z:
             z.extractall(dst)
-        print(f"[DevServer] 已解壓遊戲到: {dst}")
+        log.info("已解壓遊戲", game=name, version=version, dst=str(dst))
         return True, str(dst)
     except Exception as e:
         return False, f"zip 解壓失敗: {e}"
 
-def handle_upload_game(payload):
+@api.kind("upload_game", auth="developer", fields=[
+    Field("name"), Field("version"), Field("manifest", dict), Field("zip_b64"),
+])
+def handle_upload_game(req):
     """
     上傳/更新遊戲：
       - 版本格式必須是 major.minor.patch（例如 1.0.3）
       - 若遊戲已存在，新的版本號必須「嚴格大於」目前 latest
     """
-    token = payload.get("token")
-    tokinfo = auth.verify_token(token, role="developer")
-    if not tokinfo:
-        return auth_fail()
-    developer = tokinfo["user"]
-
-    name = payload.get("name","").strip()
-    version = payload.get("version","").strip()
-    manifest = payload.get("manifest", {})
-    zip_b64 = payload.get("zip_b64","")
+    developer = req.user
+    name = req.args["name"]
+    version = req.args["version"]
+    manifest = req.args["manifest"]
+    zip_b64 = req.args["zip_b64"]
 
     if not name or not version or not manifest or not zip_b64:
         return {"ok": False, "error": "缺少必要欄位"}
@@ -174,8 +191,8 @@ def handle_upload_game(payload):
             "status": "active",
             "versions": {},     # {version_str: {...}}
             "latest": version,
-            # ✅ 與 Lobby 評分系統更相容：預設用 dict
-            "reviews": {},      # { user: {rating,text,ts}, ... }
+            # 評論本文在 data/reviews/，這裡只放彙總（見 common/reviews.py）
+            "rating": reviews.empty_summary(),
             "avg_rating": None,
             "review_count": 0
         }
@@ -220,8 +237,9 @@ def handle_upload_game(payload):
 
     games[name] = game
     db.save(GAMES_FILE, games)
+    catalog.update(name, game)
 
-    print(f"[DevServer] 遊戲 {name}@{version} 上傳成功，status={game['status']}")
+    log.info("遊戲上傳成功", game=name, version=version, status=game["status"])
     return {
         "ok": True,
         "msg": "上傳/更新成功",
@@ -232,13 +250,10 @@ def handle_upload_game(payload):
 
 # ----------------- 下架 / 查詢遊戲 ----------------- #
 
-def handle_remove_game(payload):
-    token = payload.get("token")
-    tokinfo = auth.verify_token(token, role="developer")
-    if not tokinfo:
-        return auth_fail()
-    developer = tokinfo["user"]
-    name = payload.get("name","").strip()
+@api.kind("remove_game", auth="developer", fields=[Field("name")])
+def handle_remove_game(req):
+    developer = req.user
+    name = req.args["name"]
 
     games = db.load(GAMES_FILE, {})
     if name not in games:
@@ -250,6 +265,7 @@ def handle_remove_game(payload):
     game["status"] = "removed"
     games[name] = game
     db.save(GAMES_FILE, games)
+    catalog.remove(name)
     return {
         "ok": True,
         "msg": "已下架。此遊戲不再出現在商城列表，且無法建立新房間。",
@@ -257,27 +273,14 @@ def handle_remove_game(payload):
         "status": game["status"]
     }
 
-def _normalize_reviews_dict(reviews):
-    """
-    Lobby 端可能會把 reviews 存成 dict:
-      { user: {rating, text, ts}, ... }
-    為了兼容舊資料，這裡統一轉成 dict。
-    """
-    if isinstance(reviews, dict):
-        return reviews
-    return {}
-
-def handle_my_games(payload):
+@api.kind("my_games", auth="developer")
+def handle_my_games(req):
     """
     回傳開發者自己的遊戲列表，並把版本排序好（從小到大）。
     ⭐ 只回傳精簡資訊，不包含完整 manifest 和 zip_b64。
     ✅ 新增：回傳玩家評論/評分，讓 developer 看得到回饋
     """
-    token = payload.get("token")
-    tokinfo = auth.verify_token(token, role="developer")
-    if not tokinfo:
-        return auth_fail()
-    developer = tokinfo["user"]
+    developer = req.user
 
     games = db.load(GAMES_FILE, {})
     if not isinstance(games, dict):
@@ -304,55 +307,39 @@ def handle_my_games(payload):
                 "max_players": manifest.get("max_players", 2)
             }
 
-        reviews = _normalize_reviews_dict(info.get("reviews"))
-
-        avg_rating = info.get("avg_rating")
-        review_count = info.get("review_count")
-
-        if (avg_rating is None or review_count is None) and reviews:
-            try:
-                s = sum(int(r.get("rating", 0)) for r in reviews.values())
-                n = len(reviews)
-                avg_rating = round(s / n, 2) if n else None
-                review_count = n
-            except Exception:
-                pass
-
-        if review_count is None:
-            review_count = 0
-
-        simplified_reviews = {}
-        for user, rv in (reviews or {}).items():
-            simplified_reviews[user] = {
-                "rating": rv.get("rating"),
-                "text": rv.get("text", ""),
-                "ts": rv.get("ts")
-            }
-
         result[name] = {
             "status": info.get("status", "active"),
             "latest": info.get("latest"),
             "versions": simplified_versions,
-            "avg_rating": avg_rating,
-            "review_count": review_count,
-            "reviews": simplified_reviews,
+            **reviews.summary_fields(info),
+            # 只帶最新幾則；其餘用 list_reviews 分頁查
+            "reviews": reviews.preview(name),
         }
 
     return {"ok": True, "games": result}
 
-def handle_version_hint(payload):
+@api.kind("list_reviews", auth="developer", fields=[
+    Field("name", required="缺少遊戲名稱"),
+    Field("sort", default="recent", check=(lambda s: s in reviews.SORTS, "sort 必須是 " + " / ".join(reviews.SORTS))),
+    Field("offset", int, default=0),
+    Field("limit", int, default=10),
+])
+def handle_list_reviews(req):
+    name = req.args["name"]
+    game = db.load(GAMES_FILE, {}).get(name)
+    if game is None:
+        return {"ok": False, "error": "遊戲不存在"}
+    if game.get("author") != req.user:
+        return {"ok": False, "error": "不是此遊戲作者"}
+    return {"ok": True, **reviews.page(name, req.args["sort"], req.args["offset"], req.args["limit"])}
+
+@api.kind("version_hint", auth="developer", fields=[Field("name", required="缺少遊戲名稱")])
+def handle_version_hint(req):
     """
     查詢指定遊戲目前 latest + 建議下一個版本號。
     """
-    token = payload.get("token")
-    tokinfo = auth.verify_token(token, role="developer")
-    if not tokinfo:
-        return auth_fail()
-    developer = tokinfo["user"]
-
-    name = payload.get("name","").strip()
-    if not name:
-        return {"ok": False, "error": "缺少遊戲名稱"}
+    developer = req.user
+    name = req.args["name"]
 
     games = db.load(GAMES_FILE, {})
     if not isinstance(games, dict):
@@ -392,53 +379,18 @@ def handle_version_hint(payload):
 
 # ----------------- Server 迴圈 ----------------- #
 
+@api.kind("metrics", auth="admin")
+def handle_metrics(req):
+    """admin：各 kind 的延遲 / 位元組 / 錯誤數 / db 等鎖時間"""
+    return metrics.handle_metrics(METRICS, req.payload, req.addr)
+
 def _handle_conn(conn, addr):
-    try:
-        data = b""
-        while True:
-            chunk = conn.recv(4096)
-            if not chunk:
-                break
-            data += chunk
-            if b"\n" in data:
-                break
-        if not data:
-            conn.close()
-            return
-
-        line = data.split(b"\n", 1)[0].decode("utf-8")
-        req = json.loads(line)
-        kind = req.get("kind")
-
-        if kind == "register":
-            resp = handle_register(req)
-        elif kind == "login":
-            resp = handle_login(req)
-        elif kind == "upload_game":
-            resp = handle_upload_game(req)
-        elif kind == "remove_game":
-            resp = handle_remove_game(req)
-        elif kind == "logout":
-            resp = handle_logout(req)
-        elif kind == "my_games":
-            resp = handle_my_games(req)
-        elif kind == "version_hint":
-            resp = handle_version_hint(req)
-        else:
-            resp = {"ok": False, "error": f"unknown kind: {kind}"}
-
-        conn.sendall((json.dumps(resp, ensure_ascii=False) + "\n").encode("utf-8"))
-    except Exception as e:
-        traceback.print_exc()
-        try:
-            conn.sendall((json.dumps({"ok": False, "error": str(e)}) + "\n").encode("utf-8"))
-        except Exception:
-            pass
-    finally:
-        conn.close()
+    api.handle_conn(conn, addr)
 
 def serve(host, port, stop_event=None):
     ensure_user_db()
+    reviews.migrate(GAMES_FILE)
+    passwords.warm_up()
     ensure_dirs()
 
     s = socket.socket()
@@ -447,12 +399,12 @@ def serve(host, port, stop_event=None):
     s.listen(128)
     s.settimeout(0.5)
 
-    print(f"[DevServer] listening on {host}:{s.getsockname()[1]}")
+    log.info("listening", addr=f"{host}:{s.getsockname()[1]}")
 
     try:
         while True:
             if stop_event is not None and stop_event.is_set():
-                print("[DevServer] stop_event set, exiting serve loop.")
+                log.info("stop_event set, exiting serve loop")
                 break
 
             try:
@@ -460,7 +412,7 @@ def serve(host, port, stop_event=None):
             except socket.timeout:
                 continue
             except OSError as e:
-                print(f"[DevServer] Socket closed / error: {e}")
+                log.warning("Socket closed / error", error=str(e))
                 break
 
             threading.Thread(
@@ -473,4 +425,4 @@ def serve(host, port, stop_event=None):
             s.close()
         except Exception:
             pass
-        print(f"[DevServer] Shutdown complete on {host}:{port}")
+        log.info("Shutdown complete", addr=f"{host}:{port}")
@@ -0,0 +1,706 @@
+# server/loadgen.py - Lobby 壓力測試：模擬大量玩家
+# 預設會在暫存資料夾啟動一個獨立的 LobbyServer（不動到 server/data 與 uploaded_games），
+# 並放一個「假遊戲」：entry_server 只是聽 GAME_PORT 的空殼，開房不會跑真正的遊戲。
+#
+# 每位模擬玩家依 --mix 的權重選一種劇本：
+#   browse - register → login → list_games → game_details → download_game → list_rooms → logout
+#   host   - ... → create_room → subscribe_room → player_ready → 等人到齊 → propose_start
+#            → 等對局開始 → 停留 --hold-sec → leave_room → logout
+#   guest  - ... → list_rooms → join_room → subscribe_room → player_ready → 等開始提議
+#            → respond_start → 停留 → leave_room → logout
+# 玩家依 Poisson 過程抵達（--rate 人/秒），每一步之間有指數分布的思考時間（--think-ms）。
+#
+# 結果輸出成 JSON：每個 kind 的延遲百分位數 / 吞吐量 / 錯誤率 / 傳輸位元組，
+# 以及 Lobby 行程的 thread 數、開啟的 FD 數（Linux 讀 /proc，有 psutil 也可以）。
+#
+# 用法：
+#   python loadgen.py                                  # 200 位玩家，每秒 20 位
+#   python loadgen.py --users 2000 --rate 100 --mix browse=6,host=2,guest=2 --out load.json
+#   python loadgen.py --target 127.0.0.1:12666 --game tetris   # 打既有的 Lobby（不會有 FD 統計）
+import argparse, asyncio, base64, io, json, os, random, shutil, socket, statistics, subprocess, sys, tempfile, time, zipfile
+from collections import Counter, defaultdict
+from pathlib import Path
+
+SERVER_DIR = Path(__file__).resolve().parent
+STUB_GAME = "loadtest"
+STUB_VERSION = "1.0.0"
+DEFAULT_MIX = "browse=6,host=2,guest=2"
+SCENARIOS = ("browse", "host", "guest")
+READ_LIMIT = 16 * 1024 * 1024  # download_game 的整包 zip_b64 只有一行
+SHED_CODES = ("RATE_LIMITED", "OVERLOADED")
+
+# 假遊戲的 server：只負責讓 Lobby 的就緒檢查 / 存活監控連得上；
+# Lobby 行程結束或超過 LOADGEN_STUB_TTL 秒就自己退出，不會留下孤兒行程
+STUB_SERVER = '''\
+import os, socket, time
+port = int(os.environ["GAME_PORT"])
+deadline = time.time() + float(os.environ.get("LOADGEN_STUB_TTL", "600"))
+parent = os.getppid()
+s = socket.socket()
+s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+s.bind((os.environ.get("GAME_HOST", "0.0.0.0"), port))
+s.listen(64)
+s.settimeout(0.5)
+while time.time() < deadline and os.getppid() == parent:
+    try:
+        c, _ = s.accept()
+    except socket.timeout:
+        continue
+    c.close()
+'''
+
+STUB_CLIENT = '''\
+print("loadtest stub client: nothing to play")
+'''
+
+
+def percentiles(samples) -> dict:
+    if not samples:
+        return {}
+    xs = sorted(samples)
+    pick = lambda q: xs[min(len(xs) - 1, int(q * len(xs)))]
+    return {"n": len(xs), "mean": round(statistics.fmean(xs), 3), "p50": round(pick(0.50), 3),
+            "p90": round(pick(0.90), 3), "p99": round(pick(0.99), 3), "max": round(xs[-1], 3)}
+
+
+def parse_mix(text: str) -> dict:
+    mix = {}
+    for part in text.split(","):
+        if not part.strip():
+            continue
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise ValueError(f"unknown scenario in --mix: {name} (choose from {', '.join(SCENARIOS)})")
+        mix[name] = float(weight or 1)
+    if not mix or sum(mix.values()) <= 0:
+        raise ValueError("--mix needs at least one scenario with a positive weight")
+    return mix
+
+
+# ---------------------------------------------------------------------------
+# 本機 Lobby + 假遊戲
+# ---------------------------------------------------------------------------
+def _free_port() -> int:
+    s = socket.socket()
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def _stub_manifest(max_players: int) -> dict:
+    return {
+        "name": STUB_GAME,
+        "display_name": "Load Test Stub",
+        "type": "CLI",
+        "max_players": max_players,
+        "entry_server": "start_server.py",
+        "entry_client": "start_client.py",
+        "description": "Placeholder game used by server/loadgen.py",
+    }
+
+
+def seed_stub_game(data_dir: Path, max_players: int, package_kb: int, seed: int):
+    """把假遊戲放進 uploaded_games/，並在 games.json 登記（跟 dev_server 上架的格式一樣）"""
+    manifest = _stub_manifest(max_players)
+    files = {
+        "manifest.json": json.dumps(manifest, indent=2, ensure_ascii=False).encode("utf-8"),
+        "start_server.py": STUB_SERVER.encode("utf-8"),
+        "start_client.py": STUB_CLIENT.encode("utf-8"),
+    }
+    # download_game 會回傳整包 zip_b64，用不可壓縮的填充檔模擬真實遊戲包的大小
+    if package_kb > 0:
+        files["assets.bin"] = random.Random(seed).randbytes(package_kb * 1024)
+
+    game_dir = data_dir / "uploaded_games" / STUB_GAME / STUB_VERSION
+    game_dir.mkdir(parents=True, exist_ok=True)
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, data in files.items():
+            (game_dir / name).write_bytes(data)
+            zf.writestr(name, data)
+
+    games = {
+        STUB_GAME: {
+            "name": STUB_GAME,
+            "author": "loadgen",
+            "status": "active",
+            "latest": STUB_VERSION,
+            "versions": {STUB_VERSION: {"manifest": manifest,
+                                        "zip_b64": base64.b64encode(buf.getvalue()).decode("ascii")}},
+            "rating": {"count": 0, "sum": 0, "hist": {str(i): 0 for i in range(1, 6)}},
+            "avg_rating": None,
+            "review_count": 0,
+        }
+    }
+    (data_dir / "games.json").write_text(json.dumps(games, ensure_ascii=False), encoding="utf-8")
+
+
+def serve_local_lobby(data_dir: str, port: int, ip_limits: bool = False):
+    """
+    子行程：把 db 與 uploaded_games 指到暫存資料夾後跑 lobby_server.serve
+    所有模擬玩家都來自 127.0.0.1，預設把本機排除在 per-IP 限流之外（per-user 限流照常）
+    """
+    os.environ.setdefault("PUBLIC_HOST", "127.0.0.1")
+    sys.path.insert(0, str(SERVER_DIR))
+    from common import db
+    db.DATA_DIR = Path(data_dir)
+    import lobby_server
+    lobby_server.UPLOADED = Path(data_dir) / "uploaded_games"
+    if not ip_limits:
+        lobby_server.IP_LIMITS.exempt.add("127.0.0.1")
+    lobby_server.serve("127.0.0.1", port)
+
+
+def start_local_lobby(args, data_dir: Path):
+    port = _free_port()
+    env = os.environ.copy()
+    env.update({"PUBLIC_HOST": "127.0.0.1", "LOADGEN_STUB_TTL": str(int(args.stub_ttl))})
+    log = open(data_dir / "lobby.log", "wb")
+    proc = subprocess.Popen(
+        [sys.executable, str(Path(__file__).resolve()), "--serve-lobby", str(data_dir), "--port", str(port)]
+        + (["--ip-limits"] if args.ip_limits else []),
+        cwd=str(SERVER_DIR), env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    for _ in range(100):  # 100 次 × 0.1 秒 = 10 秒
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return proc, port, log
+        except OSError:
+            if proc.poll() is not None:
+                break
+            time.sleep(0.1)
+    proc.kill()
+    log.close()
+    raise RuntimeError(f"local lobby failed to start, see {data_dir / 'lobby.log'}")
+
+
+def _raise_fd_limit():
+    """上千條訂閱連線會撞到預設的 1024 FD 上限；子行程會繼承調高後的值"""
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if hard == resource.RLIM_INFINITY or hard > soft:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard if hard != resource.RLIM_INFINITY else 65536, hard))
+    except Exception:
+        pass
+
+
+def process_usage(pid: int):
+    """(threads, fds)；拿不到就回傳 None"""
+    try:
+        with open(f"/proc/{pid}/status", encoding="utf-8") as f:
+            threads = next(int(line.split()[1]) for line in f if line.startswith("Threads:"))
+        return threads, len(os.listdir(f"/proc/{pid}/fd"))
+    except Exception:
+        pass
+    try:
+        import psutil
+        p = psutil.Process(pid)
+        return p.num_threads(), p.num_fds() if hasattr(p, "num_fds") else p.num_handles()
+    except Exception:
+        return None
+
+
+# ---------------------------------------------------------------------------
+# 統計
+# ---------------------------------------------------------------------------
+class KindStats:
+    def __init__(self):
+        self.latencies = []
+        self.ok = 0
+        self.rejected = 0     # 伺服器回 ok=false
+        self.failed = 0       # 連線失敗 / timeout / 回應不是 JSON
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.errors = Counter()
+
+
+class Stats:
+    def __init__(self):
+        self.kinds = defaultdict(KindStats)
+        self.scenarios = {name: Counter() for name in SCENARIOS}
+        self.matches = Counter()
+        self.pushes = 0
+        self.push_bytes = 0
+        self.open_conns = 0
+        self.max_open_conns = 0
+        self.active_players = 0
+        self.max_active_players = 0
+        self.samples = []     # [t, threads, fds, rooms, open_conns, active_players]
+
+    def conn_opened(self):
+        self.open_conns += 1
+        self.max_open_conns = max(self.max_open_conns, self.open_conns)
+
+    def conn_closed(self):
+        self.open_conns -= 1
+
+    def record(self, kind: str, ms: float, bytes_out: int, bytes_in: int, resp, error: str = None):
+        k = self.kinds[kind]
+        k.latencies.append(ms)
+        k.bytes_out += bytes_out
+        k.bytes_in += bytes_in
+        if error is not None:
+            k.failed += 1
+            k.errors[error] += 1
+        elif resp.get("ok"):
+            k.ok += 1
+        else:
+            k.rejected += 1
+            # 限流 / 過載依 code 歸類（訊息可能隨語系變動）
+            code = resp.get("code")
+            k.errors[code if code in SHED_CODES else str(resp.get("error"))[:80]] += 1
+
+    def report(self, elapsed: float) -> dict:
+        kinds = {}
+        total = bytes_out = bytes_in = errors = 0
+        for name in sorted(self.kinds):
+            k = self.kinds[name]
+            n = len(k.latencies)
+            total += n
+            errors += k.rejected + k.failed
+            bytes_out += k.bytes_out
+            bytes_in += k.bytes_in
+            kinds[name] = {
+                "count": n, "ok": k.ok, "rejected": k.rejected, "failed": k.failed,
+                "error_rate": round((k.rejected + k.failed) / n, 4) if n else 0.0,
+                "rps": round(n / elapsed, 2) if elapsed else None,
+                "latency_ms": percentiles(k.latencies),
+                "bytes_out": k.bytes_out, "bytes_in": k.bytes_in,
+                "top_errors": dict(k.errors.most_common(5)),
+            }
+        return {
+            "duration_sec": round(elapsed, 3),
+            "requests": total,
+            "throughput_rps": round(total / elapsed, 2) if elapsed else None,
+            "error_rate": round(errors / total, 4) if total else 0.0,
+            "bytes_out": bytes_out,
+            "bytes_in": bytes_in + self.push_bytes,
+            "kinds": kinds,
+            "subscriptions": {"pushes": self.pushes, "push_bytes": self.push_bytes},
+            "scenarios": {name: dict(c) for name, c in self.scenarios.items() if c},
+            "matches": dict(self.matches),
+            "client": {"max_open_conns": self.max_open_conns, "max_active_players": self.max_active_players},
+        }
+
+
+def _usage_summary(values) -> dict:
+    values = [v for v in values if v is not None]
+    if not values:
+        return {}
+    return {"start": values[0], "max": max(values), "end": values[-1]}
+
+
+# ---------------------------------------------------------------------------
+# Lobby 連線
+# ---------------------------------------------------------------------------
+class LobbyClient:
+    def __init__(self, host: str, port: int, stats: Stats, timeout: float):
+        self.host = host
+        self.port = port
+        self.stats = stats
+        self.timeout = timeout
+
+    async def _open(self):
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port, limit=READ_LIMIT), self.timeout)
+        self.stats.conn_opened()
+        return reader, writer
+
+    def _close(self, writer):
+        self.stats.conn_closed()
+        try:
+            writer.close()
+        except Exception:
+            pass
+
+    async def call(self, payload: dict) -> dict:
+        """一個請求一條連線（跟 lobby_client 的 send_req 一樣）；失敗回傳 ok=false 的 dict"""
+        kind = payload.get("kind")
+        data = (json.dumps(payload, ensure_ascii=False) + "\n").encode("utf-8")
+        t0 = time.perf_counter()
+        line = b""
+        writer = None
+        try:
+            reader, writer = await self._open()
+            writer.write(data)
+            await writer.drain()
+            line = await asyncio.wait_for(reader.readline(), self.timeout)
+            resp = json.loads(line)
+        except Exception as e:
+            err = type(e).__name__ if not isinstance(e, json.JSONDecodeError) else "BadResponse"
+            self.stats.record(kind, (time.perf_counter() - t0) * 1000, len(data), len(line), None, err)
+            return {"ok": False, "error": err}
+        finally:
+            if writer is not None:
+                self._close(writer)
+        self.stats.record(kind, (time.perf_counter() - t0) * 1000, len(data), len(line), resp)
+        return resp
+
+
+class RoomWatch:
+    """subscribe_room 長連線：持續收 room_update，保留最新的房間狀態"""
+
+    def __init__(self, client: LobbyClient):
+        self.client = client
+        self.room = {}
+        self.changed = asyncio.Event()
+        self.writer = None
+        self.task = None
+
+    async def open(self, token: str, room_id: str) -> bool:
+        stats = self.client.stats
+        data = (json.dumps({"kind": "subscribe_room", "token": token, "room_id": room_id}) + "\n").encode("utf-8")
+        t0 = time.perf_counter()
+        line = b""
+        try:
+            reader, self.writer = await self.client._open()
+            self.writer.write(data)
+            await self.writer.drain()
+            line = await asyncio.wait_for(reader.readline(), self.client.timeout)
+            resp = json.loads(line)
+        except Exception as e:
+            stats.record("subscribe_room", (time.perf_counter() - t0) * 1000, len(data), len(line), None,
+                         type(e).__name__)
+            self.close()
+            return False
+        stats.record("subscribe_room", (time.perf_counter() - t0) * 1000, len(data), len(line), resp)
+        if not resp.get("ok"):
+            self.close()
+            return False
+        self.room = resp.get("room") or {}
+        self.task = asyncio.create_task(self._read_loop(reader))
+        return True
+
+    async def _read_loop(self, reader):
+        stats = self.client.stats
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                stats.pushes += 1
+                stats.push_bytes += len(line)
+                try:
+                    msg = json.loads(line)
+                except Exception:
+                    continue
+                if msg.get("event") == "room_update":
+                    self.room = msg.get("room") or {}
+                    self.changed.set()
+        except Exception:
+            pass
+        finally:
+            self.changed.set()
+
+    async def wait_for(self, pred, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        while not pred(self.room):
+            left = deadline - time.monotonic()
+            if left <= 0 or (self.task is not None and self.task.done()):
+                return pred(self.room)
+            self.changed.clear()
+            try:
+                await asyncio.wait_for(self.changed.wait(), left)
+            except asyncio.TimeoutError:
+                pass
+        return True
+
+    def close(self):
+        if self.task is not None:
+            self.task.cancel()
+        if self.writer is not None:
+            self.client._close(self.writer)
+            self.writer = None
+
+
+# ---------------------------------------------------------------------------
+# 模擬玩家
+# ---------------------------------------------------------------------------
+class Player:
+    def __init__(self, idx: int, args, client: LobbyClient, rnd: random.Random):
+        self.name = f"{args.user_prefix}{idx}"
+        self.args = args
+        self.client = client
+        self.stats = client.stats
+        self.rnd = rnd
+        self.token = None
+
+    async def think(self):
+        if self.args.think_ms > 0:
+            await asyncio.sleep(self.rnd.expovariate(1000.0 / self.args.think_ms))
+
+    async def req(self, kind: str, **fields) -> dict:
+        await self.think()
+        payload = {"kind": kind, **fields}
+        if self.token:
+            payload["token"] = self.token
+        return await self.client.call(payload)
+
+    async def run(self, scenario: str):
+        counters = self.stats.scenarios[scenario]
+        counters["started"] += 1
+        self.stats.active_players += 1
+        self.stats.max_active_players = max(self.stats.max_active_players, self.stats.active_players)
+        try:
+            if not await self.login():
+                counters["aborted"] += 1
+                return
+            await self.browse()
+            if scenario == "host":
+                await self.host()
+            elif scenario == "guest":
+                await self.guest()
+            await self.req("logout")
+            counters["completed"] += 1
+        except Exception:
+            counters["crashed"] += 1
+        finally:
+            self.stats.active_players -= 1
+
+    async def login(self) -> bool:
+        password = "pw-" + self.name
+        await self.req("register", username=self.name, password=password)
+        resp = await self.req("login", username=self.name, password=password)
+        self.token = resp.get("token") if resp.get("ok") else None
+        return bool(self.token)
+
+    async def browse(self):
+        game = self.args.game
+        await self.req("list_games")
+        await self.req("game_details", name=game)
+        if self.rnd.random() < self.args.download_ratio:
+            await self.req("download_game", name=game)
+        await self.req("list_rooms")
+
+    async def host(self):
+        resp = await self.req("create_room", game=self.args.game)
+        if not resp.get("ok"):
+            return
+        room_id = resp["room_id"]
+        max_players = int(resp.get("max_players", 2))
+        watch = RoomWatch(self.client)
+        try:
+            if not await watch.open(self.token, room_id):
+                return
+            await self.req("player_ready", room_id=room_id)
+            full = await watch.wait_for(lambda r: len(r.get("players", [])) >= max_players, self.args.wait_sec)
+            if not full:
+                self.stats.matches["no_opponent"] += 1
+                return
+            await self.req("propose_start", room_id=room_id)
+            started = await watch.wait_for(
+                lambda r: r.get("status") == "in_game" or r.get("start", {}).get("state") == "rejected",
+                self.args.wait_sec)
+            if started and watch.room.get("status") == "in_game":
+                self.stats.matches["started"] += 1
+                await asyncio.sleep(self.args.hold_sec)
+            else:
+                self.stats.matches["start_timeout"] += 1
+        finally:
+            watch.close()
+            await self.req("leave_room", room_id=room_id)
+
+    async def guest(self):
+        room_id = None
+        for _ in range(self.args.join_retries):
+            resp = await self.req("list_rooms")
+            rooms = resp.get("rooms") or {}
+            open_rooms = [rid for rid, r in rooms.items()
+                          if r.get("game") == self.args.game and r.get("status") == "waiting"
+                          and r.get("start", {}).get("state", "idle") == "idle"
+                          and len(r.get("players", [])) < int(r.get("max_players", 2))]
+            if open_rooms:
+                rid = self.rnd.choice(open_rooms)
+                if (await self.req("join_room", room_id=rid)).get("ok"):
+                    room_id = rid
+                    break
+            await asyncio.sleep(self.rnd.uniform(0.2, 1.0))
+        if room_id is None:
+            self.stats.matches["no_room"] += 1
+            return
+
+        watch = RoomWatch(self.client)
+        try:
+            if not await watch.open(self.token, room_id):
+                return
+            await self.req("player_ready", room_id=room_id)
+            proposed = await watch.wait_for(
+                lambda r: r.get("start", {}).get("state") in ("proposed", "agreed") or r.get("status") == "in_game",
+                self.args.wait_sec)
+            if proposed and watch.room.get("start", {}).get("state") == "proposed":
+                await self.req("respond_start", room_id=room_id, accept=True)
+            if await watch.wait_for(lambda r: r.get("status") == "in_game", self.args.wait_sec):
+                await asyncio.sleep(self.args.hold_sec)
+        finally:
+            watch.close()
+            await self.req("leave_room", room_id=room_id)
+
+
+# ---------------------------------------------------------------------------
+# 主流程
+# ---------------------------------------------------------------------------
+def take_sample(stats: Stats, pid, data_dir, t0: float):
+    usage = process_usage(pid) if pid else None
+    rooms = None
+    if data_dir is not None:
+        try:
+            rooms = len(json.loads((data_dir / "rooms.json").read_text(encoding="utf-8")))
+        except Exception:
+            pass
+    stats.samples.append([round(time.perf_counter() - t0, 2), usage[0] if usage else None,
+                          usage[1] if usage else None, rooms, stats.open_conns, stats.active_players])
+
+
+async def sample_loop(stats: Stats, pid, data_dir, interval: float, t0: float):
+    while True:
+        take_sample(stats, pid, data_dir, t0)
+        await asyncio.sleep(interval)
+
+
+async def run_load(args, host: str, port: int, pid, data_dir) -> dict:
+    stats = Stats()
+    client = LobbyClient(host, port, stats, args.timeout)
+    mix = parse_mix(args.mix)
+    names, weights = list(mix), list(mix.values())
+    rnd = random.Random(args.seed)
+
+    t0 = time.perf_counter()
+    sampler = asyncio.create_task(sample_loop(stats, pid, data_dir, args.sample_ms / 1000, t0))
+    tasks = []
+    for i in range(args.users):
+        scenario = rnd.choices(names, weights)[0]
+        player = Player(i, args, client, random.Random(rnd.random()))
+        tasks.append(asyncio.create_task(player.run(scenario)))
+        if args.rate > 0:
+            await asyncio.sleep(rnd.expovariate(args.rate))
+    arrival_sec = time.perf_counter() - t0
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - t0
+    sampler.cancel()
+    take_sample(stats, pid, data_dir, t0)
+    # Lobby 自己量到的 handler / db 時間（admin kind，只接受本機連線）
+    server_metrics = await client.call({"kind": "metrics"})
+    stats.kinds.pop("metrics", None)
+
+    result = stats.report(elapsed)
+    result["arrival_sec"] = round(arrival_sec, 3)
+    result["lobby"] = {
+        "pid": pid,
+        "threads": _usage_summary([s[1] for s in stats.samples]),
+        "fds": _usage_summary([s[2] for s in stats.samples]),
+        "rooms": _usage_summary([s[3] for s in stats.samples]),
+    }
+    result["server_metrics"] = server_metrics.get("metrics")
+    result["server_limits"] = server_metrics.get("limits")   # 限流 / 准入的拒絕數
+    result["server_db"] = server_metrics.get("db")           # save 次數 vs 實際寫檔次數
+    result["timeline"] = stats.samples
+    return result
+
+
+def print_summary(result: dict):
+    out = sys.stderr
+    print(f"[LoadGen] {result['requests']} requests in {result['duration_sec']}s "
+          f"→ {result['throughput_rps']} req/s, error rate {result['error_rate']:.2%}", file=out)
+    print(f"[LoadGen] {'kind':<15}{'count':>7}{'err%':>8}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}"
+          f"{'KB out':>9}{'KB in':>10}", file=out)
+    for name, k in result["kinds"].items():
+        lat = k["latency_ms"]
+        print(f"[LoadGen] {name:<15}{k['count']:>7}{k['error_rate'] * 100:>7.1f}%"
+              f"{lat.get('p50', 0):>9.1f}{lat.get('p90', 0):>9.1f}{lat.get('p99', 0):>9.1f}{lat.get('max', 0):>9.1f}"
+              f"{k['bytes_out'] / 1024:>9.1f}{k['bytes_in'] / 1024:>10.1f}", file=out)
+    server = result.get("server_metrics") or {}
+    top = sorted(server.get("kinds", {}).items(), key=lambda kv: -kv[1]["time_share"])[:5]
+    if top:
+        print("[LoadGen] lobby handler time: " + ", ".join(
+            f"{k} {v['time_share']:.0%} (db wait {sum(d['lock_wait_ms']['sum'] for d in v['db'].values()):.0f}ms)"
+            for k, v in top), file=out)
+    lobby = result["lobby"]
+    if lobby.get("threads"):
+        print(f"[LoadGen] lobby threads {lobby['threads']}  fds {lobby['fds']}  rooms {lobby.get('rooms')}", file=out)
+    print(f"[LoadGen] scenarios {result['scenarios']}  matches {result['matches']}", file=out)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Lobby load generator (JSON output)")
+    ap.add_argument("--users", type=int, default=200, help="模擬玩家總數")
+    ap.add_argument("--rate", type=float, default=20.0, help="每秒抵達的玩家數（Poisson），0 = 一次全部")
+    ap.add_argument("--mix", default=DEFAULT_MIX, help="劇本權重，例如 browse=6,host=2,guest=2")
+    ap.add_argument("--think-ms", type=float, default=200.0, help="每步之間的平均思考時間")
+    ap.add_argument("--hold-sec", type=float, default=5.0, help="對局開始後停留多久才離開房間")
+    ap.add_argument("--wait-sec", type=float, default=20.0, help="等人到齊 / 等開始的上限")
+    ap.add_argument("--join-retries", type=int, default=5, help="guest 找不到房間時重試幾次")
+    ap.add_argument("--download-ratio", type=float, default=0.5, help="會下載遊戲的玩家比例")
+    ap.add_argument("--timeout", type=float, default=30.0, help="單一請求的 timeout（秒）")
+    ap.add_argument("--seed", type=int, default=12345)
+    ap.add_argument("--sample-ms", type=float, default=500.0, help="thread / FD 取樣間隔")
+    ap.add_argument("--max-players", type=int, default=2, help="本機假遊戲的房間人數")
+    ap.add_argument("--package-kb", type=int, default=64, help="本機假遊戲的安裝包大小")
+    ap.add_argument("--stub-ttl", type=float, default=600.0, help="假遊戲 server 最長存活秒數")
+    ap.add_argument("--target", default=None, help="HOST:PORT，打既有的 Lobby 而不是啟動本機 Lobby")
+    ap.add_argument("--game", default=None, help="--target 模式下要用的遊戲名稱")
+    ap.add_argument("--lobby-pid", type=int, default=None, help="--target 模式下要取樣的 Lobby pid")
+    ap.add_argument("--ip-limits", action="store_true", help="本機 Lobby 也套用 per-IP 限流（預設排除 127.0.0.1）")
+    ap.add_argument("--keep-data", action="store_true", help="保留暫存資料夾（含 lobby.log）")
+    ap.add_argument("--out", default=None, help="寫到檔案（預設印到 stdout）")
+    ap.add_argument("--serve-lobby", metavar="DATA_DIR", default=None, help=argparse.SUPPRESS)
+    ap.add_argument("--port", type=int, default=0, help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.serve_lobby:
+        serve_local_lobby(args.serve_lobby, args.port, args.ip_limits)
+        return
+
+    try:
+        parse_mix(args.mix)
+    except ValueError as e:
+        ap.error(str(e))
+    _raise_fd_limit()
+    args.user_prefix = f"lg{random.Random().randrange(16 ** 4):04x}_"
+
+    proc = log = None
+    data_dir = None
+    if args.target:
+        host, _, port = args.target.rpartition(":")
+        port = int(port)
+        if not args.game:
+            ap.error("--target needs --game")
+        pid = args.lobby_pid
+    else:
+        data_dir = Path(tempfile.mkdtemp(prefix="lobby-load-"))
+        args.game = STUB_GAME
+        seed_stub_game(data_dir, args.max_players, args.package_kb, args.seed)
+        proc, port, log = start_local_lobby(args, data_dir)
+        host, pid = "127.0.0.1", proc.pid
+        print(f"[LoadGen] local lobby pid={pid} on 127.0.0.1:{port}  data={data_dir}", file=sys.stderr)
+
+    try:
+        result = asyncio.run(run_load(args, host, port, pid, data_dir))
+    finally:
+        if proc is not None:
+            proc.terminate()
+            try:
+                proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+            log.close()
+        if data_dir is not None:
+            if args.keep_data:
+                print(f"[LoadGen] kept {data_dir}", file=sys.stderr)
+            else:
+                shutil.rmtree(data_dir, ignore_errors=True)
+
+    result["config"] = {k: v for k, v in vars(args).items() if k not in ("serve_lobby", "port", "out")}
+    print_summary(result)
+    text = json.dumps(result, indent=2, ensure_ascii=False)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"[LoadGen] wrote {args.out}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
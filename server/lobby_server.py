@@ -1,7 +1,11 @@
 # server/lobby_server.py - 修正版（版本號一致性 + 遊戲結束自動 reset）
-import os, json, socket, threading, subprocess, time, random, traceback, base64, zipfile, io, re
+import os, json, socket, threading, subprocess, time, random, base64, zipfile, io, re, signal
 from pathlib import Path
-from common import db, auth
+from common import db, auth, metrics, passwords, reviews, catalog, stats
+from common.dispatch import Dispatcher, Field, tracing
+from common.matchmaking import MatchQueue, WarmPool
+from common.ratelimit import KeyedLimiter, InflightCap, limit_by_ip, limit_by_user, cap_inflight, overloaded
+from common.log import get_logger
 
 # Lobby 自己的對外 host/port（讓遊戲 server 知道要打回哪裡）
 LOBBY_HOST = None
@@ -12,18 +16,8 @@ ROOT = Path(__file__).resolve().parents[1]
 SERVER_DIR = Path(__file__).resolve().parent
 CONF = json.loads((ROOT / "config.json").read_text(encoding="utf-8"))
 
-import socket, time, threading
-from common import db
-
-def auth_fail():
-    return {"ok": False, "error": "未登入", "code": "NOT_LOGGED_IN"}
-
-def require_player(payload):
-    token = payload.get("token")
-    t = auth.verify_token(token, role="player")
-    if not t:
-        return None, auth_fail()
-    return t, None
+log = get_logger("lobby")
+conn_log = get_logger("lobby.conn")
 
 # ✅ 修改：使用 public_host 作為房間的對外 IP
 def _detect_local_ip_candidates():
@@ -78,13 +72,62 @@ def pick_public_host(conf):
 
 
 PUBLIC_HOST = pick_public_host(CONF)
-print(f"[Lobby] PUBLIC_HOST selected: {PUBLIC_HOST}", flush=True)
+log.info("PUBLIC_HOST selected", public_host=PUBLIC_HOST)
 
 GAMES_FILE = "games.json"
 PLAYER_USERS_FILE = "player_users.json"
 ROOMS_FILE = "rooms.json"
 UPLOADED = SERVER_DIR / "uploaded_games"
 
+# 每個 kind 的處理時間 / 位元組 / 錯誤數 / db 等鎖時間（admin kind "metrics" 可讀）
+METRICS = metrics.registry("lobby")
+
+# kind → handler / 欄位 schema / 登入需求（見 common/dispatch.py）
+api = Dispatcher("lobby", metrics=METRICS, log=conn_log)
+api.use(tracing(get_logger("lobby.trace")), stage="pre")
+
+# === 限流 / 准入控制 ===
+# [每秒, burst]；"*" 是其他 kind 的預設，None 代表不限。config.json 的 "lobby_limits" 可覆寫任一項
+DEFAULT_LIMITS = {
+    # 同一個來源 IP（NAT 後面可能有好幾個玩家，所以給得比 per_user 寬）
+    "per_ip": {
+        "*": [40, 80],
+        "register": [0.5, 5],
+        "login": [2, 10],
+        "create_room": [1, 5],
+        "download_game": [2, 6],
+        # 遊戲 server 回呼（已驗簽章）；同一台機器上的房間一起結束也夠用
+        "game_finished": [20, 100],
+    },
+    # 同一個登入的使用者
+    "per_user": {
+        "*": [10, 30],
+        "create_room": [0.2, 2],
+        "rate_game": [0.5, 3],
+        "download_game": [0.5, 3],
+    },
+    # create_room 會 Popen 遊戲 server + 找 port，全域同時最多幾個
+    "max_inflight_create_room": 8,
+    # 全部連線（不含 subscribe_room 保持的連線）同時最多幾條，超過在 accept 時就直接回 OVERLOADED
+    "max_inflight_requests": 256,
+}
+LIMITS = {**DEFAULT_LIMITS, **(CONF.get("lobby_limits") or {})}
+for _k in ("per_ip", "per_user"):
+    LIMITS[_k] = {**DEFAULT_LIMITS[_k], **((CONF.get("lobby_limits") or {}).get(_k) or {})}
+
+IP_LIMITS = KeyedLimiter("ip", LIMITS["per_ip"])
+USER_LIMITS = KeyedLimiter("user", LIMITS["per_user"])
+CREATE_ROOM_CAP = InflightCap(int(LIMITS["max_inflight_create_room"] or 0))
+CONN_CAP = InflightCap(int(LIMITS["max_inflight_requests"] or 0))
+
+api.use(limit_by_ip(IP_LIMITS), stage="pre")
+api.use(limit_by_user(USER_LIMITS), stage="post")
+api.use(cap_inflight({"create_room"}, CREATE_ROOM_CAP, "目前建立房間的人太多，請稍後再試"), stage="post")
+
+ROOM_ID = Field("room_id", required="缺少 room_id")
+GAME_NAME = Field("name", required="缺少遊戲名稱")
+CREDENTIALS = [Field("username"), Field("password")]
+
 # === SSE 訂閱管理 ===
 room_subscribers = {}
 subscribers_lock = threading.RLock()
@@ -170,7 +213,8 @@ def _scan_uploaded_games():
                 
                 # 如果正規化版本已存在，保留較新的資料夾
                 if normalized in version_map:
-                    print(f"[Warning] 發現重複版本號：{raw_version} 和 {version_map[normalized]} 都對應到 {normalized}")
+                    log.warning("發現重複版本號", game=gdir.name, folders=[raw_version, version_map[normalized]],
+                                version=normalized)
                     # 可選：比較修改時間，保留較新的
                     old_path = gdir / version_map[normalized]
                     new_path = vdir
@@ -196,25 +240,29 @@ def ensure_user_db():
         users = {}
         db.save(PLAYER_USERS_FILE, users)
 
-def handle_register(payload):
-    u = payload.get("username","").strip()
-    p = payload.get("password","").strip()
+@api.kind("register", fields=CREDENTIALS)
+def handle_register(req):
+    u = req.args["username"]
+    p = req.args["password"]
     if not u or not p:
         return {"ok": False, "error": "缺少帳號或密碼"}
-    users = db.load(PLAYER_USERS_FILE, {})
-    if u in users:
+    try:
+        created = passwords.register_user(PLAYER_USERS_FILE, u, p)
+    except passwords.PasswordBusy:
+        return overloaded()
+    if not created:
         return {"ok": False, "error": "帳號已被使用"}
-    users[u] = {"password": p}
-    db.save(PLAYER_USERS_FILE, users)
     return {"ok": True, "msg": "註冊成功"}
 
-def handle_login(payload):
-    u = payload.get("username","").strip()
-    p = payload.get("password","").strip()
-    users = db.load(PLAYER_USERS_FILE, {})
-
-    if u not in users or users[u].get("password") != p:
-        return {"ok": False, "error": "帳號或密碼錯誤"}
+@api.kind("login", fields=CREDENTIALS)
+def handle_login(req):
+    u = req.args["username"]
+    p = req.args["password"]
+    try:
+        if not passwords.login_user(PLAYER_USERS_FILE, u, p):
+            return {"ok": False, "error": "帳號或密碼錯誤"}
+    except passwords.PasswordBusy:
+        return overloaded()
 
     token = auth.issue_token(u, role="player")
     if not token:
@@ -228,12 +276,9 @@ def handle_login(payload):
         "msg": "登入成功"
     }
 
-def handle_list_games(payload):
+@api.kind("list_games", auth="player")
+def handle_list_games(req):
     """列出遊戲 - 只顯示檔案系統中實際存在且 active 的遊戲（需登入）"""
-    _, err = require_player(payload)
-    if err:
-        return err
-
     fs_games = _scan_uploaded_games()
     db_games = db.load(GAMES_FILE, {})
 
@@ -264,17 +309,64 @@ def handle_list_games(payload):
                 "review_count": db_info.get("review_count", 0),
             }
 
-    print(f"[Lobby] 回傳 {len(result)} 個 active 遊戲：{list(result.keys())}")
+    log.debug("回傳 active 遊戲", count=len(result), games=list(result.keys()))
     return {"ok": True, "games": result}
 
-def handle_player_ready(payload):
-    token = payload.get("token")
-    t = auth.verify_token(token, role="player")
-    if not t:
-        return {"ok": False, "error": "未登入"}
-    player = t["user"]
-    
-    room_id = payload.get("room_id","").strip()
+def _as_list(v):
+    return v if isinstance(v, list) else [v]
+
+def _is_rating(v):
+    return isinstance(v, (int, float)) and not isinstance(v, bool) and 0 <= v <= 5
+
+RATING_RANGE_ERROR = "評分範圍必須是 0~5 的數字"
+
+@api.kind("search_games", auth="player", fields=[
+    Field("query"),
+    Field("type", object, check=(lambda v: all(isinstance(t, str) for t in _as_list(v)),
+                                 "type 必須是字串或字串陣列")),
+    Field("max_players", object, check=(lambda v: all(isinstance(p, int) and not isinstance(p, bool) for p in _as_list(v)),
+                                        "max_players 必須是整數或整數陣列")),
+    Field("min_rating", object, check=(_is_rating, RATING_RANGE_ERROR)),
+    Field("max_rating", object, check=(_is_rating, RATING_RANGE_ERROR)),
+    Field("offset", int, default=0),
+    Field("limit", int, default=20),
+    Field("facets", bool),
+])
+def handle_search_games(req):
+    """關鍵字 + facet（type / max_players / 評分範圍）搜尋商城，索引見 common/catalog.py"""
+    a = req.args
+    result = catalog.search(
+        a["query"],
+        types=_as_list(a["type"]) if a["type"] is not None else None,
+        players=_as_list(a["max_players"]) if a["max_players"] is not None else None,
+        min_rating=a["min_rating"],
+        max_rating=a["max_rating"],
+        offset=a["offset"],
+        limit=a["limit"],
+        facets=a["facets"],
+    )
+    return {"ok": True, **result}
+
+@api.kind("player_stats", auth="player", fields=[Field("user"), Field("name")])
+def handle_player_stats(req):
+    """某個玩家（預設自己）各遊戲的對局統計；name 指定只看一個遊戲"""
+    user = req.args["user"] or req.user
+    return {"ok": True, "user": user, "games": stats.player(user, req.args["name"] or None)}
+
+@api.kind("leaderboard", auth="player", fields=[
+    GAME_NAME,
+    Field("metric", default="wins", check=(lambda m: m in stats.BOARDS, "metric 必須是 " + " / ".join(stats.BOARDS))),
+    Field("limit", int, default=10),
+])
+def handle_leaderboard(req):
+    """某個遊戲某個指標的前幾名，外加自己的名次"""
+    a = req.args
+    return {"ok": True, "name": a["name"], **stats.top(a["name"], a["metric"], a["limit"], user=req.user)}
+
+@api.kind("player_ready", auth="player", fields=[ROOM_ID])
+def handle_player_ready(req):
+    player = req.user
+    room_id = req.args["room_id"]
     rooms = db.load(ROOMS_FILE, {})
     if room_id not in rooms:
         return {"ok": False, "error": "房間不存在"}
@@ -297,14 +389,10 @@ def handle_player_ready(payload):
     
     return {"ok": True, "msg": "已標記為就緒", "ready_players": ready_players}
 
-def handle_player_unready(payload):
-    token = payload.get("token")
-    t = auth.verify_token(token, role="player")
-    if not t:
-        return {"ok": False, "error": "未登入"}
-    player = t["user"]
-    
-    room_id = payload.get("room_id","").strip()
+@api.kind("player_unready", auth="player", fields=[ROOM_ID])
+def handle_player_unready(req):
+    player = req.user
+    room_id = req.args["room_id"]
     rooms = db.load(ROOMS_FILE, {})
     if room_id not in rooms:
         return {"ok": False, "error": "房間不存在"}
@@ -324,94 +412,60 @@ def handle_player_unready(payload):
     
     return {"ok": True, "msg": "已取消就緒"}
 
-def handle_rate_game(payload):
-    token = payload.get("token")
-    t = auth.verify_token(token, role="player")
-    if not t:
-        return {"ok": False, "error": "未登入"}
-    user = t["user"]
-
-    name = (payload.get("name") or "").strip()
-    rating = payload.get("rating")
-    text = (payload.get("text") or "").strip()
-
-    if not name:
-        return {"ok": False, "error": "缺少遊戲名稱"}
-
-    try:
-        rating = int(rating)
-        if rating < 1 or rating > 5:
-            raise ValueError
-    except Exception:
-        return {"ok": False, "error": "評分必須是 1~5 的整數"}
-
-    # 檢查是否玩過
-    users = db.load(PLAYER_USERS_FILE, {})
-    played = users.get(user, {}).get("played", {})
-    # 若 played 不是 dict（例如 list），也先修正一下
-    if not isinstance(played, dict):
-        played = {}
-    played_ok = bool(played.get(name, 0))
+RATING_ERROR = "評分必須是 1~5 的整數"
+
+@api.kind("rate_game", auth="player", fields=[
+    GAME_NAME,
+    Field("rating", int, required=RATING_ERROR, check=(lambda r: 1 <= r <= 5, RATING_ERROR)),
+    Field("text"),
+])
+def handle_rate_game(req):
+    user = req.user
+    name = req.args["name"]
+    rating = req.args["rating"]
+    text = req.args["text"]
+
+    # 檢查是否玩過（統計在記憶體；舊版記在 player_users.json 的 played 也算）
+    played_ok = stats.played(user, name) > 0
+    if not played_ok:
+        played = db.load(PLAYER_USERS_FILE, {}).get(user, {}).get("played", {})
+        played_ok = isinstance(played, dict) and bool(played.get(name, 0))
     if not played_ok:
         return {"ok": False, "error": "必須先玩過此遊戲才能留言/評分"}
 
-    # 讀取遊戲資料
-    games = db.load(GAMES_FILE, {})
-    if name not in games:
+    # 評論本文寫進該遊戲的評論檔，games.json 只增量更新彙總
+    summary = reviews.put(GAMES_FILE, name, user, rating, text)
+    if summary is None:
         return {"ok": False, "error": "遊戲不存在"}
-
-    g = games[name]
-
-    # ⭐ 關鍵：reviews 一律用 dict，舊的 list 直接丟掉重建
-    reviews = g.get("reviews")
-    if not isinstance(reviews, dict):
-        reviews = {}
-
-    reviews[user] = {
-        "rating": rating,
-        "text": text,
-        "ts": int(time.time())
-    }
-    g["reviews"] = reviews
-
-    # 重新計算平均分數
-    if reviews:
-        s = sum(r["rating"] for r in reviews.values())
-        n = len(reviews)
-        g["avg_rating"] = round(s / n, 2)
-        g["review_count"] = n
-    else:
-        g["avg_rating"] = None
-        g["review_count"] = 0
-
-    games[name] = g
-    db.save(GAMES_FILE, games)
+    catalog.update_rating(name, summary["avg_rating"], summary["review_count"])
 
     return {
         "ok": True,
         "msg": "已送出評論/評分",
-        "avg_rating": g.get("avg_rating"),
-        "count": g.get("review_count")
+        "avg_rating": summary["avg_rating"],
+        "count": summary["review_count"],
     }
 
-def handle_logout(payload):
-    token = payload.get("token")
+@api.kind("logout")
+def handle_logout(req):
+    token = req.token
     if token:
         auth.revoke_token(token)
     return {"ok": True, "msg": "已登出"}
 
-def handle_subscribe_room(payload, conn):
-    token = payload.get("token")
-    t = auth.verify_token(token, role="player")
-    if not t:
-        return {"ok": False, "error": "未登入"}
-    
-    room_id = payload.get("room_id","").strip()
+def _hold_subscription(req, resp):
+    """✅ 回應送出後保持連線作為 SSE 通道"""
+    while True:
+        time.sleep(10)
+
+@api.kind("subscribe_room", auth="player", fields=[ROOM_ID], after=_hold_subscription)
+def handle_subscribe_room(req):
+    room_id = req.args["room_id"]
     rooms = db.load(ROOMS_FILE, {})
     if room_id not in rooms:
         return {"ok": False, "error": "房間不存在"}
     
-    subscribe_room(room_id, conn)
+    subscribe_room(room_id, req.conn)
     # ✅ 這裡多把目前房間狀態回傳給訂閱者
     return {
         "ok": True,
@@ -420,12 +474,9 @@ def handle_subscribe_room(payload, conn):
         "room": rooms[room_id],
     }
 
-def handle_game_details(payload):
-    _, err = require_player(payload)
-    if err:
-        return err
-
-    name = payload.get("name","").strip()
+@api.kind("game_details", auth="player", fields=[Field("name")])
+def handle_game_details(req):
+    name = req.args["name"]
     games = db.load(GAMES_FILE, {})
     if name not in games:
         return {"ok": False, "error": "遊戲不存在"}
@@ -436,9 +487,9 @@ def handle_game_details(payload):
         "status": game_data.get("status"),
         "author": game_data.get("author"),
         "latest": game_data.get("latest"),
-        "avg_rating": game_data.get("avg_rating"),
-        "review_count": game_data.get("review_count", 0),
-        "reviews": game_data.get("reviews", {}),
+        **reviews.summary_fields(game_data),
+        # 只帶最新幾則；其餘用 list_reviews 分頁查
+        "reviews": reviews.preview(name),
         "versions": {}
     }
 
@@ -450,12 +501,21 @@ def handle_game_details(payload):
 
     return {"ok": True, "details": cleaned_data}
 
-def handle_download_game(payload):
-    _, err = require_player(payload)
-    if err:
-        return err
+@api.kind("list_reviews", auth="player", fields=[
+    GAME_NAME,
+    Field("sort", default="recent", check=(lambda s: s in reviews.SORTS, "sort 必須是 " + " / ".join(reviews.SORTS))),
+    Field("offset", int, default=0),
+    Field("limit", int, default=10),
+])
+def handle_list_reviews(req):
+    name = req.args["name"]
+    if name not in db.load(GAMES_FILE, {}):
+        return {"ok": False, "error": "遊戲不存在"}
+    return {"ok": True, **reviews.page(name, req.args["sort"], req.args["offset"], req.args["limit"])}
 
-    name = payload.get("name","").strip()
+@api.kind("download_game", auth="player", fields=[Field("name")])
+def handle_download_game(req):
+    name = req.args["name"]
     games = db.load(GAMES_FILE, {})
     if name not in games:
         return {"ok": False, "error": "遊戲不存在"}
@@ -504,39 +564,31 @@ def _find_free_port(min_port=10000, max_port=65535):
     
     return port
 
-def handle_list_rooms(payload):
-    _, err = require_player(payload)
-    if err:
-        return err
+@api.kind("list_rooms", auth="player")
+def handle_list_rooms(req):
     rooms = db.load(ROOMS_FILE, {})
     return {"ok": True, "rooms": rooms}
 
-def handle_create_room(payload):
-    token = payload.get("token")
-    t = auth.verify_token(token, role="player")
-    if not t:
-        return {"ok": False, "error": "未登入"}
-    session_user = t["user"]
-
-    req_game = (payload.get("game") or "").strip()
-    if not req_game:
-        return {"ok": False, "error": "缺少遊戲名稱"}
-
+def _resolve_latest(req_game, req_version_raw=None):
+    """
+    確認遊戲可以開房並找出最新版本的檔案；回傳 (ctx, None) 或 (None, 錯誤訊息)
+    ctx: game / version / game_root / entry / relay_entry / max_players
+    """
     # 1) 掃檔案系統：確認這個遊戲真的有被上傳
     fs_games = _scan_uploaded_games()
     if req_game not in fs_games:
-        return {"ok": False, "error": "遊戲不存在或不可用"}
+        return None, "遊戲不存在或不可用"
 
     # 2) 檢查 DB：遊戲必須存在，且 status = active
     db_games = db.load(GAMES_FILE, {})
     ginfo = db_games.get(req_game)
     if not ginfo or ginfo.get("status", "active") != "active":
-        return {"ok": False, "error": "此遊戲已下架，無法建立新的房間"}
+        return None, "此遊戲已下架，無法建立新的房間"
 
     # 3) 從 DB 讀出「最新版本」並正規化
     db_latest_raw = ginfo.get("latest")
     if not db_latest_raw:
-        return {"ok": False, "error": "找不到此遊戲的最新版本資訊"}
+        return None, "找不到此遊戲的最新版本資訊"
 
     db_latest = normalize_version(db_latest_raw)
 
@@ -544,18 +596,14 @@ def handle_create_room(payload):
     fs_info = fs_games[req_game]
     fs_versions = set(fs_info["versions"])
     if db_latest not in fs_versions:
-        return {"ok": False, "error": f"伺服器缺少最新版本檔案（{db_latest}）"}
+        return None, f"伺服器缺少最新版本檔案（{db_latest}）"
 
     # 5) 若 payload 有帶 version，且 != 最新版本 → 直接拒絕
-    req_version_raw = (payload.get("version") or "").strip()
     if req_version_raw:
         req_norm = normalize_version(req_version_raw)
         if req_norm != db_latest:
-            return {
-                "ok": False,
-                "error": f"此遊戲只能使用最新版本 {db_latest} 建立房間，"
-                         f"請先到商城下載/更新後再試"
-            }
+            return None, (f"此遊戲只能使用最新版本 {db_latest} 建立房間，"
+                          f"請先到商城下載/更新後再試")
 
     # 6) 一律改用「最新版本」開房
     version = db_latest
@@ -567,22 +615,33 @@ def handle_create_room(payload):
     game_root = UPLOADED / req_game / actual_folder
     manifest_path = game_root / "manifest.json"
     if not manifest_path.exists():
-        return {"ok": False, "error": "伺服器缺少遊戲檔案"}
+        return None, "伺服器缺少遊戲檔案"
 
     manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
     entry = manifest.get("entry_server", "start_server.py")
-    max_players = manifest.get("max_players", 2)
+    if not (game_root / entry).exists():
+        return None, f"缺少 server entry: {entry}"
 
+    return {
+        "game": req_game,
+        "version": version,
+        "game_root": game_root,
+        "entry": entry,
+        "relay_entry": manifest.get("entry_relay"),  # 選填：觀戰轉播程式
+        "max_players": manifest.get("max_players", 2),
+    }, None
+
+def _spawn_game_server(ctx, room_id):
+    """
+    啟動 ctx 的遊戲伺服器（+ 觀戰轉播）並等它就緒；
+    回傳 {"room_id", "proc", "port", "relay"}，失敗回傳 None
+    """
     # ✅ 伺服器綁定和客戶端連線位址要分開處理
     server_bind_host = "0.0.0.0"  # 伺服器綁定在所有介面
     client_connect_host = PUBLIC_HOST  # 客戶端用 public_host 連線
-    
-    port = _find_free_port()
-    room_id = f"{req_game}-{int(time.time())}-{random.randint(1000, 9999)}"
 
-    cwd = game_root
-    if not (cwd / entry).exists():
-        return {"ok": False, "error": f"缺少 server entry: {entry}"}
+    port = _find_free_port()
+    cwd = ctx["game_root"]
 
     env = os.environ.copy()
     lobby_connect_host = LOBBY_HOST
@@ -593,18 +652,24 @@ def handle_create_room(payload):
         "GAME_HOST": server_bind_host,  # ← 遊戲伺服器綁定用
         "GAME_PORT": str(port),
         "ROOM_ID": room_id,
-        "GAME_NAME": req_game,
-        "GAME_VERSION": version,
+        "GAME_NAME": ctx["game"],
+        "GAME_VERSION": ctx["version"],
         "LOBBY_HOST": LOBBY_HOST,
         "LOBBY_CONNECT_HOST": lobby_connect_host,
         "LOBBY_PORT": str(LOBBY_PORT or 0),
+        # 遊戲 server 用這把 key 在本機驗證 HELLO 帶的房間票（只對這個房間有效）
+        "ROOM_KEY": auth.room_key(room_id),
     })
+    # 對局錄影（遊戲有支援才會用到）：config.json "record_replays": true 才開，寫到 data/replays/<遊戲>/
+    if CONF.get("record_replays"):
+        env["REPLAY_DIR"] = str(db.DATA_DIR / "replays" / ctx["game"])
 
-    print(f"[Lobby] 啟動遊戲伺服器：{req_game}@{version} on {server_bind_host}:{port}", flush=True)
+    room_log = get_logger("lobby.room", room=room_id)
+    room_log.info("啟動遊戲伺服器", game=ctx["game"], version=ctx["version"], bind=f"{server_bind_host}:{port}")
     
     # ✅ 啟動遊戲伺服器
     proc = subprocess.Popen(
-        [__import__("sys").executable, entry],
+        [__import__("sys").executable, ctx["entry"]],
         cwd=str(cwd), 
         env=env,
         stdout=subprocess.PIPE,
@@ -614,7 +679,7 @@ def handle_create_room(payload):
 
     # ✅ 關鍵修改：等待伺服器真正啟動（最多等 10 秒）
     server_ready = False
-    print(f"[Lobby] 等待遊戲伺服器啟動...", flush=True)
+    room_log.debug("等待遊戲伺服器啟動")
     
     for attempt in range(50):  # 50 次 × 0.2 秒 = 10 秒
         try:
@@ -624,64 +689,255 @@ def handle_create_room(payload):
             test_sock.connect(("127.0.0.1", port))
             test_sock.close()
             server_ready = True
-            print(f"[Lobby] ✓ 遊戲伺服器已就緒（嘗試 {attempt + 1} 次，耗時 {(attempt + 1) * 0.2:.1f}秒）", flush=True)
+            room_log.info("遊戲伺服器已就緒", attempts=attempt + 1, waited_sec=round((attempt + 1) * 0.2, 1))
             break
         except (ConnectionRefusedError, OSError, socket.timeout):
             time.sleep(0.2)
             # 檢查進程是否還活著
             if proc.poll() is not None:
-                print(f"[Lobby] ✗ 遊戲伺服器進程意外終止（退出碼：{proc.returncode}）", flush=True)
+                room_log.error("遊戲伺服器進程意外終止", exit_code=proc.returncode)
                 break
     
     if not server_ready:
-        print(f"[Lobby] ✗ 遊戲伺服器啟動超時或失敗", flush=True)
+        room_log.error("遊戲伺服器啟動超時或失敗")
         try:
             proc.kill()
             proc.wait(timeout=2)
         except:
             pass
+        return None
+
+    # ✅ 有觀戰轉播就一起啟動；失敗不影響開房，觀戰者直接連遊戲伺服器
+    relay = None
+    relay_entry = ctx["relay_entry"]
+    if relay_entry and (cwd / relay_entry).exists():
+        relay = _start_relay(cwd, relay_entry, port, env, room_log)
+        if relay:
+            relay["host"] = client_connect_host
+
+    return {"room_id": room_id, "proc": proc, "port": port, "relay": relay}
+
+def _new_room_id(game):
+    return f"{game}-{int(time.time())}-{random.randint(1000, 9999)}"
+
+@api.kind("create_room", auth="player", fields=[Field("game", required="缺少遊戲名稱"), Field("version")])
+def handle_create_room(req):
+    session_user = req.user
+    ctx, err = _resolve_latest(req.args["game"], req.args["version"])
+    if err:
+        return {"ok": False, "error": err}
+
+    room_id = _new_room_id(ctx["game"])
+    server = _spawn_game_server(ctx, room_id)
+    if server is None:
         return {"ok": False, "error": "遊戲伺服器啟動失敗，請稍後再試"}
 
     # ✅ 伺服器就緒後才儲存房間資訊
     rooms = db.load(ROOMS_FILE, {})
     rooms[room_id] = {
-        "game": req_game,
-        "version": version,
-        "host": client_connect_host,  # ← 客戶端連線用這個
-        "port": port,
+        "game": ctx["game"],
+        "version": ctx["version"],
+        "host": PUBLIC_HOST,  # ← 客戶端連線用這個
+        "port": server["port"],
         "status": "waiting",
         "owner": session_user,
         "start": {"state": "idle"},
         "players": [session_user],
         "ready_players": [],
-        "max_players": max_players,
-        "pid": proc.pid,
+        "max_players": ctx["max_players"],
+        "pid": server["proc"].pid,
     }
+    if server["relay"]:
+        rooms[room_id]["relay"] = server["relay"]
     db.save(ROOMS_FILE, rooms)
     
-    print(f"[Lobby] ✓ 房間 {room_id} 建立完成", flush=True)
-    return {"ok": True, "room_id": room_id, **rooms[room_id]}
+    get_logger("lobby.room", room=room_id).info("房間建立完成", owner=session_user, pid=server["proc"].pid)
+    return {"ok": True, "room_id": room_id, **rooms[room_id],
+            "ticket": auth.issue_token(session_user, "player", room=room_id)}
 
-def _mark_played(game_name: str, players: list[str]):
-    users = db.load(PLAYER_USERS_FILE, {})
-    changed = False
-    for u in players:
-        rec = users.get(u, {})
-        played = rec.get("played", {})
-        played[game_name] = int(played.get(game_name, 0)) + 1
-        rec["played"] = played
-        users[u] = rec
-        changed = True
-    if changed:
-        db.save(PLAYER_USERS_FILE, users)
+def _start_relay(cwd, relay_entry, game_port, env, room_log=log):
+    """
+    啟動觀戰轉播：relay 以一條連線接上遊戲伺服器，再分送給所有觀戰者，
+    觀戰人數再多也不會拖慢遊戲伺服器的 tick。
+    回傳 {"port", "pid"}，失敗回傳 None
+    """
+    relay_port = _find_free_port()
+    relay_env = dict(env)
+    relay_env.update({
+        "RELAY_TICKET": auth.issue_token("__relay__", "relay", room=env["ROOM_ID"]),
+        "GAME_HOST": "127.0.0.1",  # ← relay 連回本機的遊戲伺服器
+        "GAME_PORT": str(game_port),
+        "RELAY_PORT": str(relay_port),
+        "RELAY_DELAY_MS": str(int(CONF.get("spectator_delay_ms", 0))),
+    })
 
-def handle_join_room(payload):
-    token = payload.get("token")
-    t = auth.verify_token(token, role="player")
-    if not t:
-        return {"ok": False, "error": "未登入"}
-    player = t["user"]
-    room_id = payload.get("room_id","").strip()
+    room_log.info("啟動觀戰轉播", relay_port=relay_port, game_port=game_port)
+    proc = subprocess.Popen(
+        [__import__("sys").executable, relay_entry],
+        cwd=str(cwd),
+        env=relay_env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        bufsize=1
+    )
+
+    for _ in range(25):  # 25 次 × 0.2 秒 = 5 秒
+        try:
+            test_sock = socket.socket()
+            test_sock.settimeout(0.5)
+            test_sock.connect(("127.0.0.1", relay_port))
+            test_sock.close()
+            room_log.info("觀戰轉播已就緒", relay_port=relay_port)
+            return {"port": relay_port, "pid": proc.pid}
+        except (ConnectionRefusedError, OSError, socket.timeout):
+            time.sleep(0.2)
+            if proc.poll() is not None:
+                break
+
+    room_log.warning("觀戰轉播啟動失敗，觀戰者將直接連線遊戲伺服器")
+    try:
+        proc.kill()
+    except Exception:
+        pass
+    return None
+
+# ----------------- 自動配對 ----------------- #
+# queue_for_match：同一個 (遊戲, 最新版本) 排滿 max_players 人就自動開房（優先拿預熱好的遊戲 server），
+# 房間直接推給每個人，不用再 list_rooms / join_room / 提議開始。
+# config.json 的 "matchmaking" 可覆寫：warm_servers（每個遊戲預熱幾個，0 = 不預熱）/ warm_ttl_sec / max_wait_sec
+MATCH_CONF = {"warm_servers": 1, "warm_ttl_sec": 600, "max_wait_sec": 300, **(CONF.get("matchmaking") or {})}
+
+def _warm_spawn(key):
+    game, version = key
+    ctx, err = _resolve_latest(game)
+    if err or ctx["version"] != version:
+        return None  # 已下架 / 已經有新版本：不再預熱這個版本
+    # 房號先配好（ROOM_KEY 跟著房號），配對成功時直接沿用
+    return _spawn_game_server(ctx, _new_room_id(game))
+
+def _kill_game_server(server):
+    try:
+        server["proc"].kill()
+        server["proc"].wait(timeout=2)
+    except Exception:
+        pass
+    relay_pid = (server.get("relay") or {}).get("pid")
+    if relay_pid:
+        try:
+            os.kill(relay_pid, signal.SIGTERM)
+        except OSError:
+            pass
+
+WARM = WarmPool(
+    spawn=_warm_spawn,
+    alive=lambda server: server["proc"].poll() is None,
+    kill=_kill_game_server,
+    size=int(MATCH_CONF["warm_servers"] or 0),
+    ttl=float(MATCH_CONF["warm_ttl_sec"]),
+)
+
+def _on_match(key, entries):
+    """MatchQueue 湊滿一組時（背景 thread）呼叫：開房、寫 rooms.json、把房間推給每個人"""
+    game, version = key
+    ctx, err = _resolve_latest(game, version)
+    if err:
+        for e in entries:
+            e.resolve({"event": "match_failed", "error": err})
+        return
+
+    server = WARM.take(key)
+    warm = server is not None
+    if server is None:
+        server = _spawn_game_server(ctx, _new_room_id(game))
+        if server is None:
+            raise RuntimeError("遊戲伺服器啟動失敗")
+    WARM.refill(key)
+
+    room_id = server["room_id"]
+    players = [e.user for e in entries]
+    now = int(time.time())
+    rooms = db.load(ROOMS_FILE, {})
+    rooms[room_id] = {
+        "game": game,
+        "version": version,
+        "host": PUBLIC_HOST,
+        "port": server["port"],
+        # 配對成功就等於大家都同意開始，直接進 in_game；打完一局之後跟一般房間一樣
+        "status": "in_game",
+        "owner": players[0],
+        "start": {"state": "agreed", "by": "matchmaking", "ts": now, "players": list(players)},
+        "players": players,
+        "ready_players": [],
+        "max_players": ctx["max_players"],
+        "pid": server["proc"].pid,
+        "matched": True,
+    }
+    if server["relay"]:
+        rooms[room_id]["relay"] = server["relay"]
+    db.save(ROOMS_FILE, rooms)
+
+    try:
+        stats.record_start(game, version, room_id, players)
+    except Exception as e:
+        log.warning("記錄開局失敗", room_id=room_id, error=str(e))
+
+    get_logger("lobby.room", room=room_id).info("配對成功", players=players, warm=warm)
+    for e in entries:
+        e.resolve({
+            "event": "match_found",
+            "room_id": room_id,
+            "game": game,
+            "version": version,
+            "host": PUBLIC_HOST,
+            "port": server["port"],
+            "players": players,
+            "ticket": auth.issue_token(e.user, "player", room=room_id),
+        })
+
+MATCHES = MatchQueue(_on_match)
+
+def _wait_for_match(req, resp):
+    """回應（已排入）送出後連線保持開著，配對結果以一行事件推回去"""
+    entry = req.args["entry"]
+    result = entry.wait(MATCHES, float(MATCH_CONF["max_wait_sec"]))
+    if result is None:
+        return  # client 已經斷線
+    try:
+        req.conn.sendall((json.dumps(result, ensure_ascii=False) + "\n").encode("utf-8"))
+    except OSError:
+        pass
+
+@api.kind("queue_for_match", auth="player", fields=[Field("game", required="缺少遊戲名稱"), Field("version")],
+          after=_wait_for_match)
+def handle_queue_for_match(req):
+    ctx, err = _resolve_latest(req.args["game"], req.args["version"])
+    if err:
+        return {"ok": False, "error": err}
+
+    key = (ctx["game"], ctx["version"])
+    group_size = int(ctx["max_players"])
+    entry = MATCHES.join(key, req.user, group_size, conn=req.conn)
+    req.args["entry"] = entry  # 給 after hook 用
+    WARM.refill(key)
+    return {
+        "ok": True,
+        "queued": True,
+        "game": ctx["game"],
+        "version": ctx["version"],
+        "group_size": group_size,
+        "position": MATCHES.position(entry),
+    }
+
+@api.kind("leave_queue", auth="player")
+def handle_leave_queue(req):
+    if not MATCHES.leave(req.user):
+        return {"ok": True, "msg": "目前沒有在排隊"}
+    return {"ok": True, "msg": "已取消排隊"}
+
+@api.kind("join_room", auth="player", fields=[ROOM_ID])
+def handle_join_room(req):
+    player = req.user
+    room_id = req.args["room_id"]
     rooms = db.load(ROOMS_FILE, {})
     if room_id not in rooms:
         return {"ok": False, "error": "房間不存在"}
@@ -706,16 +962,35 @@ def handle_join_room(payload):
         db.save(ROOMS_FILE, rooms)
         broadcast_room_update(room_id)
     
-    return {"ok": True, "room_id": room_id, **r}
+    return {"ok": True, "room_id": room_id, **r, "ticket": auth.issue_token(player, "player", room=room_id)}
 
-def handle_leave_room(payload):
-    token = payload.get("token")
-    t = auth.verify_token(token, role="player")
-    if not t:
-        return {"ok": False, "error": "未登入"}
+@api.kind("spectate_room", auth="player", fields=[ROOM_ID])
+def handle_spectate_room(req):
+    """觀戰：有觀戰轉播就給轉播位址，沒有才給遊戲伺服器位址（玩家一律拿 join_room 的真實位址）"""
+    room_id = req.args["room_id"]
+    rooms = db.load(ROOMS_FILE, {})
+    if room_id not in rooms:
+        return {"ok": False, "error": "房間不存在"}
 
-    player = t["user"]
-    room_id = (payload.get("room_id") or "").strip()
+    r = rooms[room_id]
+    relay = r.get("relay") or {}
+    via_relay = bool(relay.get("port"))
+    return {
+        "ok": True,
+        "room_id": room_id,
+        "game": r.get("game"),
+        "version": r.get("version"),
+        "host": relay.get("host", r.get("host")) if via_relay else r.get("host"),
+        "port": relay["port"] if via_relay else r.get("port"),
+        "spectator": True,
+        "via_relay": via_relay,
+        "ticket": auth.issue_token(req.user, "spectator", room=room_id),
+    }
+
+@api.kind("leave_room", auth="player", fields=[ROOM_ID])
+def handle_leave_room(req):
+    player = req.user
+    room_id = req.args["room_id"]
 
     rooms = db.load(ROOMS_FILE, {})
     if room_id not in rooms:
@@ -760,11 +1035,23 @@ def handle_leave_room(payload):
 
     return {"ok": True, "msg": "已離開房間"}
 
-def handle_game_finished(payload):
-    """遊戲 server 呼叫：某個 room 的一局已經結束了"""
-    room_id = (payload.get("room_id") or "").strip()
-    if not room_id:
-        return {"ok": False, "error": "缺少 room_id"}
+@api.kind("game_finished", fields=[
+    ROOM_ID, Field("kick_all", bool),
+    # 選填的對局結果（遊戲 server 有回報才有）
+    Field("reason"), Field("winnerUsername", object), Field("results", list),
+])
+def handle_game_finished(req):
+    """
+    遊戲 server 呼叫：某個 room 的一局已經結束了。
+    payload 要帶 ts + sig（用這個房間的 ROOM_KEY 簽，見 auth.callback_signature），
+    不然任何知道房號的人都能關房 / 寫假的戰績
+    """
+    room_id = req.args["room_id"]
+    get_logger("lobby.room", room=room_id).info("Processing game_finished", req=req.payload)
+
+    if not auth.verify_callback(req.payload, room_id):
+        log.warning("game_finished 簽章不符", room_id=room_id, addr=req.addr)
+        return {"ok": False, "error": "簽章不符", "code": "FORBIDDEN"}
 
     rooms = db.load(ROOMS_FILE, {})
     if room_id not in rooms:
@@ -772,9 +1059,23 @@ def handle_game_finished(payload):
 
     r = rooms[room_id]
 
+    # 只有進行中的那一局記一次結果（重複通知 / 已經 reset 的房間不算）
+    if r.get("status") == "in_game":
+        try:
+            stats.record_finish(
+                r["game"], room_id,
+                (r.get("start") or {}).get("players") or r.get("players", []),
+                reason=req.args["reason"] or None,
+                winner=req.args["winnerUsername"],
+                results=req.args["results"],
+            )
+        except Exception as e:
+            log.warning("記錄對局結果失敗", room_id=room_id, error=str(e))
+
     # ✅ 若有要求 kick_all：直接踢 & 關房
-    if bool(payload.get("kick_all")):
-        print(f"[Lobby] Kicking all players from room {room_id}", flush=True)
+    if req.args["kick_all"]:
+        room_log = get_logger("lobby.room", room=room_id)
+        room_log.info("Kicking all players")
 
         # 1) 清空玩家並標記為 closed
         r["players"] = []
@@ -791,11 +1092,11 @@ def handle_game_finished(payload):
         rooms.pop(room_id, None)
         db.save(ROOMS_FILE, rooms)
 
-        print(f"[Lobby] Room {room_id} closed and removed", flush=True)
+        room_log.info("Room closed and removed")
         return {"ok": True, "msg": "room closed (kicked all)"}
 
     # 沒帶 kick_all：僅重設
-    print(f"[Lobby] Resetting room {room_id}", flush=True)
+    get_logger("lobby.room", room=room_id).info("Resetting room")
     r["status"] = "waiting"
     r["start"] = {"state": "idle"}
     r["ready_players"] = []
@@ -834,6 +1135,10 @@ def room_liveness_monitor_loop(stop_event):
     每 2 秒掃一次 rooms.json
     - 房間 server 連不到 → 直接刪房
     """
+    with metrics.scope(METRICS, "_liveness_monitor"):
+        _room_liveness_monitor_loop(stop_event)
+
+def _room_liveness_monitor_loop(stop_event):
     while not stop_event.is_set():
         rooms = db.load(ROOMS_FILE, {})
         if not isinstance(rooms, dict):
@@ -855,6 +1160,9 @@ def room_liveness_monitor_loop(stop_event):
         if changed:
             db.save(ROOMS_FILE, rooms)
 
+        # 預熱的遊戲 server：收掉死掉的 / 放太久沒用到的
+        WARM.prune()
+
         time.sleep(2)
 
 def start_room_liveness_monitor(stop_event):
@@ -873,6 +1181,10 @@ def serve(host, port, stop_event=None):
     LOBBY_PORT = port
 
     ensure_user_db()
+    reviews.migrate(GAMES_FILE)
+    catalog.rebuild(db.load(GAMES_FILE, {}))
+    stats.load()
+    passwords.warm_up()
     
     # ✅ 確保有 stop_event
     if stop_event is None:
@@ -881,7 +1193,7 @@ def serve(host, port, stop_event=None):
     # ✅ 只做你要的：房間存活監控
     start_room_liveness_monitor(stop_event)
 
-    print(f"[Lobby] Running with server_host={host}, PUBLIC_HOST={PUBLIC_HOST}", flush=True)
+    log.info("Running", server_host=host, public_host=PUBLIC_HOST)
 
     s = socket.socket()
     s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
@@ -891,13 +1203,13 @@ def serve(host, port, stop_event=None):
     # 短 timeout：避免 accept 永遠卡住
     s.settimeout(0.5)
     
-    print(f"[LobbyServer] listening on {host}:{s.getsockname()[1]}")
+    log.info("listening", addr=f"{host}:{s.getsockname()[1]}")
 
     try:
         while True:
             # 外部要求停止時，跳出主迴圈
             if stop_event is not None and stop_event.is_set():
-                print("[LobbyServer] stop_event set, exiting serve loop.")
+                log.info("stop_event set, exiting serve loop")
                 break
 
             try:
@@ -907,9 +1219,14 @@ def serve(host, port, stop_event=None):
                 continue
             except OSError as e:
                 # socket 已關閉或其他錯誤，結束迴圈
-                print(f"[LobbyServer] Socket closed / error: {e}")
+                log.warning("Socket closed / error", error=str(e))
                 break
 
+            # 超過同時連線上限：不開 thread、不讀請求，直接回 OVERLOADED
+            if not CONN_CAP.try_enter():
+                _shed(conn, addr)
+                continue
+
             threading.Thread(
                 target=_handle_conn,
                 args=(conn, addr),
@@ -920,16 +1237,13 @@ def serve(host, port, stop_event=None):
             s.close()
         except Exception:
             pass
-        print(f"[LobbyServer] Shutdown complete on {host}:{port}")
+        WARM.close()
+        log.info("Shutdown complete", addr=f"{host}:{port}")
 
-def handle_propose_start(payload):
-    token = payload.get("token")
-    t = auth.verify_token(token, role="player")
-    if not t:
-        return {"ok": False, "error": "未登入"}
-    user = t["user"]
-
-    room_id = (payload.get("room_id") or "").strip()
+@api.kind("propose_start", auth="player", fields=[ROOM_ID])
+def handle_propose_start(req):
+    user = req.user
+    room_id = req.args["room_id"]
     rooms = db.load(ROOMS_FILE, {})
     if room_id not in rooms:
         return {"ok": False, "error": "房間不存在"}
@@ -954,15 +1268,11 @@ def handle_propose_start(payload):
     broadcast_room_update(room_id)
     return {"ok": True, "msg": "已送出開始提議"}
 
-def handle_respond_start(payload):
-    token = payload.get("token")
-    t = auth.verify_token(token, role="player")
-    if not t:
-        return {"ok": False, "error": "未登入"}
-    user = t["user"]
-
-    room_id = (payload.get("room_id") or "").strip()
-    accept = bool(payload.get("accept"))
+@api.kind("respond_start", auth="player", fields=[ROOM_ID, Field("accept", bool)])
+def handle_respond_start(req):
+    user = req.user
+    room_id = req.args["room_id"]
+    accept = req.args["accept"]
     rooms = db.load(ROOMS_FILE, {})
     if room_id not in rooms:
         return {"ok": False, "error": "房間不存在"}
@@ -1005,16 +1315,18 @@ def handle_respond_start(payload):
     
     if all_agreed:
         # ✅ 所有房客都同意了，可以開始
-        r["start"] = {"state": "agreed", "by": owner, "ts": int(time.time())}
+        # players 記在 start 裡：game_finished 只認這局開始時在房裡的人
+        r["start"] = {"state": "agreed", "by": owner, "ts": int(time.time()), "players": list(players)}
         r["status"] = "in_game"
         r["ready_players"] = []
         db.save(ROOMS_FILE, rooms)
         broadcast_room_update(room_id)
 
+        # 開局只 append 一行事件（不再改寫整個 player_users.json）
         try:
-            _mark_played(r["game"], players)
-        except Exception:
-            pass
+            stats.record_start(r["game"], r.get("version"), room_id, players)
+        except Exception as e:
+            log.warning("記錄開局失敗", room_id=room_id, error=str(e))
 
         return {"ok": True, "msg": "對局開始"}
     else:
@@ -1031,110 +1343,33 @@ def handle_respond_start(payload):
             "msg": f"已記錄你的同意，等待其他玩家回應（{agreed_count}/{total_guests}）\n等待中：{', '.join(not_responded)}"
         }
 
-def _handle_conn(conn, addr):
-    data = b""
+@api.kind("metrics", auth="admin")
+def handle_metrics(req):
+    """admin：各 kind 的延遲 / 位元組 / 錯誤數 / db 等鎖時間，外加限流 / 准入的拒絕數"""
+    resp = metrics.handle_metrics(METRICS, req.payload, req.addr)
+    if resp.get("ok") and "metrics" in resp:
+        resp["limits"] = {
+            "per_ip": IP_LIMITS.stats(),
+            "per_user": USER_LIMITS.stats(),
+            "create_room": CREATE_ROOM_CAP.stats(),
+            "connections": CONN_CAP.stats(),
+        }
+        resp["db"] = db.stats()
+        resp["catalog"] = catalog.stats()
+        resp["stats"] = stats.stats()
+        resp["matchmaking"] = {"queue": MATCHES.stats(), "warm": WARM.stats()}
+    return resp
+
+def _shed(conn, addr):
+    """accept 迴圈裡直接拒絕（socket 剛建立，送一小行不會卡住）"""
+    conn_log.info("Shedding connection", addr=addr, inflight=CONN_CAP.inflight)
     try:
-        timeout_count = 0
-        max_timeout = 3
-        conn.settimeout(2.0)
-
-        # ✅ 讀到 \n 或多次 timeout 為止
-        while timeout_count < max_timeout:
-            try:
-                chunk = conn.recv(4096)
-                if not chunk:
-                    break
-                data += chunk
-                if b"\n" in data:
-                    break
-                timeout_count = 0
-            except socket.timeout:
-                timeout_count += 1
-
-        if not data:
-            # ⭐ 防止空內容直接 json.loads
-            return
-
-        line = data.split(b"\n", 1)[0].decode("utf-8", errors="ignore").strip()
-
-        if not line:
-            print(f"[LobbyServer] Received empty message from {addr}", flush=True)
-            return
-
-        print(f"[LobbyServer] Received from {addr}: {line[:120]}", flush=True)
-
-        try:
-            req = json.loads(line)
-        except json.JSONDecodeError as e:
-            print(f"[LobbyServer] ✗ JSON decode error from {addr}: {e}", flush=True)
-            print(f"[LobbyServer] Raw data (first 200 bytes): {data[:200]}", flush=True)
-            try:
-                conn.sendall((json.dumps({"ok": False, "error": "Invalid JSON"}, ensure_ascii=False) + "\n").encode("utf-8"))
-            except Exception:
-                pass
-            return
-
-        kind = req.get("kind")
-
-        if kind == "register":
-            resp = handle_register(req)
-        elif kind == "login":
-            resp = handle_login(req)
-        elif kind == "list_games":
-            resp = handle_list_games(req)
-        elif kind == "game_details":
-            resp = handle_game_details(req)
-        elif kind == "download_game":
-            resp = handle_download_game(req)
-        elif kind == "list_rooms":
-            resp = handle_list_rooms(req)
-        elif kind == "create_room":
-            resp = handle_create_room(req)
-        elif kind == "join_room":
-            resp = handle_join_room(req)
-        elif kind == "leave_room":
-            resp = handle_leave_room(req)
-        elif kind == "player_ready":
-            resp = handle_player_ready(req)
-        elif kind == "player_unready":
-            resp = handle_player_unready(req)
-        elif kind == "propose_start":
-            resp = handle_propose_start(req)
-        elif kind == "respond_start":
-            resp = handle_respond_start(req)
-        elif kind == "logout":
-            resp = handle_logout(req)
-        elif kind == "rate_game":
-            resp = handle_rate_game(req)
-
-        elif kind == "game_finished":
-            print(f"[LobbyServer] Processing game_finished: {req}", flush=True)
-            resp = handle_game_finished(req)
-
-        elif kind == "subscribe_room":
-            resp = handle_subscribe_room(req, conn)
-            conn.sendall((json.dumps(resp, ensure_ascii=False) + "\n").encode("utf-8"))
-            if resp.get("ok"):
-                # ✅ 保持連線作為 SSE 通道
-                while True:
-                    time.sleep(10)
-            return
-
-        else:
-            resp = {"ok": False, "error": f"unknown kind: {kind}"}
-
-        conn.sendall((json.dumps(resp, ensure_ascii=False) + "\n").encode("utf-8"))
-
-    except Exception as e:
-        print(f"[LobbyServer] ✗ Error handling connection from {addr}: {e}", flush=True)
-        traceback.print_exc()
-        try:
-            conn.sendall((json.dumps({"ok": False, "error": str(e)}, ensure_ascii=False) + "\n").encode("utf-8"))
-        except Exception:
-            pass
-
+        conn.sendall((json.dumps(overloaded(), ensure_ascii=False) + "\n").encode("utf-8"))
+    except OSError:
+        pass
     finally:
-        try:
-            conn.close()
-        except Exception:
-            pass
+        conn.close()
+
+def _handle_conn(conn, addr):
+    # 回應送出後就歸還名額（subscribe_room 之後保持的連線不占用）
+    api.handle_conn(conn, addr, on_reply=CONN_CAP.leave)
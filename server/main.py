@@ -1,8 +1,9 @@
 # server/main.py - 修正 IP 偵測與連線問題
-import json, asyncio, threading, urllib.request, socket, re
+import os, json, asyncio, threading, urllib.request, socket, re
 from pathlib import Path
 from dev_server import serve as serve_dev_sync
 from lobby_server import serve as serve_lobby_sync
+from common import auth, db, metrics, stats
 
 ROOT = Path(__file__).resolve().parents[1]
 CONF = json.loads((ROOT / "config.json").read_text(encoding="utf-8"))
@@ -177,6 +178,20 @@ async def main():
         print(f"\n⚠️  遠端連線模式 (IP: {public_ip})")
         print(f"   請確保防火牆已開放 port {dev_port}, {lobby_port}, 10000-65535")
     
+    # 選填：本機 Prometheus 端點（config.json 的 metrics_port 或環境變數 METRICS_PORT）
+    metrics_port = int(os.getenv("METRICS_PORT") or CONF.get("metrics_port") or 0)
+    if metrics_port:
+        metrics.start_http_server(metrics_port)
+
+    # 選填：session store（config.json 的 session_store / session_ttl，或環境變數 SESSION_STORE / SESSION_TTL）
+    #   "sqlite:sessions.sqlite3" → 重啟後不用重新登入，多個 worker 行程可共用
+    if CONF.get("session_store") or "session_ttl" in CONF:
+        auth.configure(CONF.get("session_store"), CONF.get("session_ttl", ...))
+
+    # 選填：db group commit（config.json 的 db_commit = "group" / db_commit_interval，或環境變數 DB_COMMIT）
+    if CONF.get("db_commit") or CONF.get("db_commit_interval"):
+        db.configure(CONF.get("db_commit"), CONF.get("db_commit_interval"))
+
     print("\n按 Ctrl+C 停止伺服器\n")
 
     stop_event = threading.Event()
@@ -191,6 +206,8 @@ async def main():
         stop_event.set()
         await asyncio.sleep(1.0)
     finally:
+        stats.flush()
+        db.flush()
         print("[Main] Bye.")
 
 if __name__ == "__main__":